@@ -0,0 +1,37 @@
+import re
+from typing import List, Optional
+
+from video_ids import canonical_url, short_id
+
+# Sites the bot accepts links from, matched anywhere in the lowercased URL
+SUPPORTED_DOMAINS = ('youtube', 'youtu.be', 'instagram', 'tiktok', 'twitter', 'facebook', 'reddit', 'vimeo',
+                     'dailymotion')
+
+# Links in free text: explicit http(s) URLs, or bare host/path forms such as
+# "youtu.be/abc" that people paste without a scheme
+URL_RE = re.compile(r"(?:https?://|www\.)[^\s<>\"']+|\b(?:[a-z0-9-]+\.)+[a-z]{2,}/[^\s<>\"']+", re.IGNORECASE)
+TRAILING_PUNCTUATION = ".,;:!?)]}>"
+
+
+def is_supported(url: str) -> bool:
+    return any(domain in url.lower() for domain in SUPPORTED_DOMAINS)
+
+
+def find_urls(text: str, limit: Optional[int] = None) -> List[str]:
+    """Every distinct link in text, canonicalized, in order of appearance"""
+    urls = []
+    seen = set()
+    for match in URL_RE.finditer(text or ""):
+        url = canonical_url(match.group(0).rstrip(TRAILING_PUNCTUATION))
+        if url in seen:
+            continue
+        seen.add(url)
+        urls.append(url)
+        if limit and len(urls) >= limit:
+            break
+    return urls
+
+
+def batch_key(urls: List[str]) -> str:
+    """Stable identity of a batch of links"""
+    return "batch:" + short_id("\n".join(urls))
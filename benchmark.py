@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the Telegram Video Downloader Bot
+
+Drives the real handle_url, handle_callback and start_download code
+against stand-ins from fakes.py: a fake Pyrogram client, a fake yt-dlp
+extractor and a local media server with configurable file size, latency
+and bandwidth. Nothing talks to Telegram or the video sites.
+
+Every run reports handler latency, jobs/sec and peak RSS, and appends
+its figures with the current git commit to a JSON lines file, so runs
+with the same parameters can be compared across commits:
+
+    python benchmark.py --jobs 50 --size-kb 2048 --compare
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import resource
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fakes import FakeClient, FakeExtractor, MediaServer, fake_url
+
+# Results are appended here unless --results says otherwise
+RESULTS_FILE = "benchmarks.jsonl"
+
+# Figures compared between runs; for these, higher is worse unless listed in HIGHER_IS_BETTER
+COMPARED = ("url_p50", "url_p95", "callback_p95", "job_p50", "job_p95", "jobs_per_second", "peak_rss_mb")
+HIGHER_IS_BETTER = ("jobs_per_second", "updates_per_second")
+
+
+def configure_environment(work_dir: str, slots: int, telegram_limits: bool = False, trace_file: Optional[str] = None):
+    """Point the bot's configuration at scratch files before it is imported
+
+    Streamed uploads go through raw MTProto calls the fake client does not
+    implement, so downloads take the native ranged path and are uploaded
+    with send_video. Without telegram_limits the outbound scheduler gets
+    rates high enough to stay out of the measurement.
+    """
+    os.environ.update({
+        "BOT_TOKEN": "0:benchmark",
+        "API_ID": "1",
+        "API_HASH": "benchmark",
+        "BOT_MODE": "standalone",
+        "STORAGE_URL": "",
+        "EXECUTOR_KIND": "thread",
+        "INFO_CACHE_DB": "",
+        "FILE_ID_CACHE_DB": os.path.join(work_dir, "file_ids.db"),
+        "SPOOL_DIR": os.path.join(work_dir, "spool"),
+        "PROFILE_DIR": os.path.join(work_dir, "profiles"),
+        "TRACE_FILE": trace_file or "",
+        "METRICS_PORT": "0",
+        "STREAM_UPLOADS": "0",
+        "MAX_CONCURRENT_DOWNLOADS": str(slots),
+    })
+    if not telegram_limits:
+        os.environ.update(OUTBOUND_GLOBAL_RATE="100000", OUTBOUND_CHAT_RATE="100000", OUTBOUND_CHAT_BURST="100000")
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank percentiles of latencies in seconds"""
+    values = sorted(values)
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+
+    def percentile(percent: float) -> float:
+        rank = max(1, -(-len(values) * percent // 100))
+        return round(values[int(rank) - 1], 4)
+
+    return {'p50': percentile(50), 'p95': percentile(95), 'p99': percentile(99), 'max': round(values[-1], 4)}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_revision() -> Dict[str, Any]:
+    """Commit of the working tree and whether it has uncommitted changes"""
+    def git(*args: str) -> str:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    try:
+        return {'commit': git("rev-parse", "--short", "HEAD"), 'dirty': bool(git("status", "--porcelain", "-uno"))}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def save_result(path: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Append a run to path; returns the previous run with the same parameters"""
+    previous = None
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    earlier = json.loads(line)
+                except ValueError:
+                    continue
+                if earlier.get('benchmark') == record['benchmark'] and earlier.get('params') == record['params']:
+                    previous = earlier
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    return previous
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any], names=COMPARED) -> List[str]:
+    """One line per figure: previous value, current value and the change"""
+    lines = [f"Compared with {previous.get('commit')} ({previous.get('timestamp')}):"]
+    for name in names:
+        before, after = previous['results'].get(name), current['results'].get(name)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        worse = change < 0 if name in HIGHER_IS_BETTER else change > 0
+        marker = "  (worse)" if worse and abs(change) >= 5 else ""
+        lines.append(f"  {name:<18} {before:>10} -> {after:<10} {change:+.1f}%{marker}")
+    return lines
+
+
+def is_finished(text: str) -> bool:
+    """Whether a job's message shows its final state"""
+    return "completed successfully" in text or text.startswith("❌")
+
+
+async def run_job(bot, client: FakeClient, index: int, url: str, format_id: str, timings: Dict[str, List[float]],
+                  timeout: float) -> bool:
+    """Send a link as a fresh user, pick a format and wait for the file"""
+    user_id = 100000 + index
+    message = client.text_message(user_id, url)
+
+    started = time.monotonic()
+    await bot.handle_url(client, message)
+    timings['url'].append(time.monotonic() - started)
+
+    # The formats are offered on the bot's processing message
+    if not message.replies:
+        return False
+    keyboard = message.replies[0]
+    choice = next((data for data in client.buttons(user_id, keyboard.id)
+                   if data.startswith("download_") and data.endswith(f"_{format_id}")), None)
+    if choice is None:
+        return False
+
+    started = time.monotonic()
+    await bot.handle_callback(client, client.callback_query(user_id, keyboard, choice))
+    timings['callback'].append(time.monotonic() - started)
+
+    try:
+        text = await client.wait_for(user_id, keyboard.id, is_finished, timeout)
+    except asyncio.TimeoutError:
+        return False
+    timings['job'].append(time.monotonic() - started)
+    return not text.startswith("❌")
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    import bot
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    # As after connecting, so the first job does not pay for importing yt-dlp
+    await bot.warm_up_ytdl()
+
+    server = MediaServer(args.size_kb * 1024, latency=args.server_latency, bandwidth=args.bandwidth_kb * 1024)
+    extractor = FakeExtractor(server.start(), server.size, latency=args.extract_latency)
+    bot.ytdl.extract_info = extractor
+    client = FakeClient(api_latency=args.api_latency, upload_bandwidth=args.upload_kb * 1024)
+
+    # A share of the jobs ask for a link an earlier job already sent
+    rng = random.Random(args.seed)
+    urls = []
+    for index in range(args.jobs):
+        repeat = urls and rng.random() < args.repeat
+        urls.append(rng.choice(urls) if repeat else fake_url(index, str(args.seed)))
+
+    timings: Dict[str, List[float]] = {'url': [], 'callback': [], 'job': []}
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def limited(index: int) -> bool:
+        async with gate:
+            return await run_job(bot, client, index, urls[index], args.format, timings, args.timeout)
+
+    started = time.monotonic()
+    try:
+        outcomes = await asyncio.gather(*(limited(index) for index in range(args.jobs)))
+        elapsed = time.monotonic() - started
+    finally:
+        await bot.scheduler.shutdown()
+        await bot.outbound.close()
+        if bot.http_session:
+            await bot.http_session.close()
+        bot.tracer.close()
+        bot.spool.close()
+        bot.pools.shutdown(wait=False)
+        server.stop()
+
+    completed = sum(outcomes)
+    results = {
+        'jobs': args.jobs,
+        'completed': completed,
+        'failed': args.jobs - completed,
+        'elapsed': round(elapsed, 3),
+        'jobs_per_second': round(completed / elapsed, 3),
+        'megabytes_per_second': round(client.uploaded_bytes / elapsed / 1024 / 1024, 2),
+        'extractions': extractor.calls,
+        'server_requests': server.requests,
+        'api_calls': dict(client.calls),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    for name, values in timings.items():
+        for figure, value in summarize(values).items():
+            results[f"{name}_{figure}"] = value
+    return results
+
+
+def print_results(results: Dict[str, Any]):
+    print(f"Jobs:      {results['completed']}/{results['jobs']} completed in {results['elapsed']}s "
+          f"({results['jobs_per_second']} jobs/s, {results['megabytes_per_second']} MB/s)")
+    for name in ("url", "callback", "job"):
+        figures = " · ".join(f"{figure} {results[f'{name}_{figure}']}s" for figure in ("p50", "p95", "p99", "max"))
+        print(f"{name + ':':<10} {figures}")
+    print(f"Peak RSS:  {results['peak_rss_mb']} MB")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the bot's handlers offline")
+    parser.add_argument("--jobs", type=int, default=20, help="downloads to run")
+    parser.add_argument("--concurrency", type=int, default=10, help="users sending links at once")
+    parser.add_argument("--slots", type=int, default=3, help="MAX_CONCURRENT_DOWNLOADS")
+    parser.add_argument("--repeat", type=float, default=0.0, help="share of jobs repeating an earlier link")
+    parser.add_argument("--format", default="22", choices=("22", "140"), help="format picked: 22 (mp4) or 140 (m4a)")
+    parser.add_argument("--size-kb", type=int, default=1024, help="size of every media file")
+    parser.add_argument("--server-latency", type=float, default=0.0, help="seconds before the first byte")
+    parser.add_argument("--bandwidth-kb", type=int, default=0, help="per-connection KB/s, 0 for unlimited")
+    parser.add_argument("--extract-latency", type=float, default=0.05, help="seconds per fake extraction")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds per fake Telegram call")
+    parser.add_argument("--upload-kb", type=int, default=0, help="upload KB/s, 0 for unlimited")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds a job may take")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--telegram-limits", action="store_true", help="keep the real outbound rate limits")
+    parser.add_argument("--trace", help="write per-job stage spans to this file")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSON lines file the run is appended to")
+    parser.add_argument("--compare", action="store_true", help="show the change since the last comparable run")
+    parser.add_argument("--json", action="store_true", help="print the run as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logging")
+    return parser.parse_args(argv)
+
+
+# Options that describe the environment rather than the workload; runs that
+# differ only in these are still comparable
+NOT_PARAMS = ("results", "compare", "json", "verbose", "trace")
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="bot-benchmark-") as work_dir:
+        configure_environment(work_dir, args.slots, args.telegram_limits, args.trace)
+        results = asyncio.run(run_benchmark(args))
+
+    record = dict(
+        benchmark="handlers",
+        timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        python=sys.version.split()[0],
+        **git_revision(),
+        params={name: value for name, value in vars(args).items() if name not in NOT_PARAMS},
+        results=results,
+    )
+    previous = save_result(args.results, record)
+    if args.json:
+        print(json.dumps(record))
+    else:
+        print_results(results)
+    if args.compare:
+        print("\n".join(compare(previous, record)) if previous else "No earlier run with these parameters")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,45 @@
 import os
+import time
+import shutil
 import asyncio
 import logging
-import tempfile
-import shutil
 import sys
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Union
 from datetime import datetime
 
 # Add current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from pyrogram import Client, filters, types
+from pyrogram import Client, filters, types, idle
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-import yt_dlp
+from pyrogram.handlers import MessageHandler, CallbackQueryHandler
 from dotenv import load_dotenv
 
+import aiohttp
+from urllib.parse import urlparse
+
+import ytdl
+from executor import ExecutorPools
+from jobs import JobScheduler, Job, JobSpec, JobQueue
+from cache import InfoCache, FileIdCache
+from video_ids import canonical_url, session_id
+from sessions import SessionStore, Session, FormatRow, AUDIO_EXTS
+from storage import open_backend, SQLiteBackend, RedisBackend
+from streaming import stream_media, StreamingUnavailable
+from spool import Spool, SpoolFull
+from progress import ProgressReporter, Progress, progress_bar, DOWNLOAD, UPLOAD, STREAM, PLAYLIST
+from splitter import split_and_send, needs_split, split_reservation
+from downloader import download_ranges, RangesUnsupported
+from sizes import fill_sizes
+from video_info import VideoInfo, PlaylistInfo, load_info
+from playlist import run_pipeline, pick_entry_format, PipelineStats
+from batch import find_urls, is_supported, batch_key
+from tracing import Tracer, Profiler, current_job
+from metrics import Registry, RecentSamples, RollingSum, LoopLag, THROUGHPUT_BUCKETS, serve as serve_metrics
+from outbound import OutboundScheduler, PRIORITY_ANSWER, PRIORITY_UPLOAD, PRIORITY_SEND, PRIORITY_EDIT
+from singleflight import Recipients, SingleFlight
+from startup import StartupTimer, parse_budget
+
 # Load environment variables
 load_dotenv()
 
@@ -51,8 +76,159 @@ app = Client(
     workdir=os.path.dirname(os.path.abspath(__file__))
 )
 
-# Global variables to store user states
-user_states = {}
+# Thread/process pools for blocking yt-dlp work
+pools = ExecutorPools.from_env()
+
+# "standalone" does everything in this process; "frontend" only handles
+# updates and hands extraction and downloads to worker.py processes
+BOT_MODE = os.getenv("BOT_MODE", "standalone").lower()
+
+# Shared storage for sessions and queued jobs (memory://, sqlite:///..., redis://...)
+STORAGE_URL = os.getenv("STORAGE_URL")
+storage = open_backend(STORAGE_URL) if STORAGE_URL else None
+
+if BOT_MODE == "frontend" and not isinstance(storage, (SQLiteBackend, RedisBackend)):
+    raise ValueError("BOT_MODE=frontend needs a shared STORAGE_URL (sqlite:// or redis://)")
+
+# Queue between the frontend and its worker processes
+job_queue = JobQueue(storage) if storage else None
+
+# Download queue with global and per-user concurrency limits. Only a
+# standalone bot resumes its own pending downloads after a restart; workers
+# hand theirs back to the shared queue when they stop
+scheduler = JobScheduler(
+    max_concurrent=int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "3")),
+    max_per_user=int(os.getenv("MAX_DOWNLOADS_PER_USER", "1")),
+    backend=storage if BOT_MODE == "standalone" else None,
+)
+
+# Cache of extracted video info shared by all users
+info_cache = InfoCache(
+    max_entries=int(os.getenv("INFO_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("INFO_CACHE_TTL", "1800")),
+    db_path=os.getenv("INFO_CACHE_DB") or None,
+)
+
+# Skip subtitle, comment and format-check work during extraction
+LEAN_EXTRACTION = os.getenv("LEAN_EXTRACTION", "1") == "1"
+
+# Playlists and channels: entries taken from the start, entries downloading
+# or uploading at once, and the highest video quality picked for them
+PLAYLIST_MAX_ENTRIES = int(os.getenv("PLAYLIST_MAX_ENTRIES", "500"))
+PLAYLIST_CONCURRENCY = int(os.getenv("PLAYLIST_CONCURRENCY", "2"))
+PLAYLIST_MAX_HEIGHT = int(os.getenv("PLAYLIST_MAX_HEIGHT", "720"))
+
+# Links accepted from one message or .txt document, and the largest document read
+MAX_BATCH_URLS = int(os.getenv("MAX_BATCH_URLS", "50"))
+BATCH_FILE_MAX_BYTES = int(os.getenv("BATCH_FILE_MAX_KB", "256")) * 1024
+
+# Format choices offered for a whole playlist or batch; the matching format of every
+# entry is picked by pick_entry_format
+PLAYLIST_PRESETS = (
+    FormatRow(format_id='video', ext='mp4', height=PLAYLIST_MAX_HEIGHT),
+    FormatRow(format_id='audio', ext='m4a'),
+)
+
+# Telegram file_ids of earlier uploads, keyed by video and format
+file_id_cache = FileIdCache(os.getenv("FILE_ID_CACHE_DB", "file_ids.db"))
+
+# Stream progressive formats straight from their URL into the upload
+STREAM_UPLOADS = os.getenv("STREAM_UPLOADS", "1") == "1"
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_MB", "8")) * 1024 * 1024
+
+# Direct-URL formats are fetched over several HTTP range requests at once;
+# DASH/HLS formats fetch this many fragments at once through yt-dlp
+NATIVE_DOWNLOADS = os.getenv("NATIVE_DOWNLOADS", "1") == "1"
+DOWNLOAD_CONNECTIONS = int(os.getenv("DOWNLOAD_CONNECTIONS", "4"))
+FRAGMENT_CONCURRENCY = int(os.getenv("FRAGMENT_CONCURRENCY", "4"))
+
+# Overall time budget for sizing formats with HEAD requests before the keyboard is shown
+SIZE_PROBE_DEADLINE = float(os.getenv("SIZE_PROBE_DEADLINE", "1.5"))
+
+# Larger outputs are split into parts and sent as an album
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_MB", "2000")) * 1024 * 1024
+SPLIT_UPLOAD_WORKERS = int(os.getenv("SPLIT_UPLOAD_WORKERS", "3"))
+
+# Shared, pooled HTTP session (created on first use inside the event loop)
+http_session: Optional[aiohttp.ClientSession] = None
+
+# Scratch space for downloads, with a byte quota shared by all processes
+spool = Spool(
+    os.getenv("SPOOL_DIR") or None,
+    quota_bytes=int(os.getenv("SPOOL_QUOTA_MB", "8192")) * 1024 * 1024,
+)
+SPOOL_DEFAULT_RESERVATION = int(os.getenv("SPOOL_DEFAULT_RESERVATION_MB", "256")) * 1024 * 1024
+SPOOL_WAIT_TIMEOUT = float(os.getenv("SPOOL_WAIT_TIMEOUT", "600"))
+
+# Rate-limited gate for every outgoing Bot API call (limits are per process)
+outbound = OutboundScheduler(
+    global_rate=float(os.getenv("OUTBOUND_GLOBAL_RATE", "25")),
+    chat_rate=float(os.getenv("OUTBOUND_CHAT_RATE", "1")),
+    chat_burst=float(os.getenv("OUTBOUND_CHAT_BURST", "3")),
+)
+
+# Identical extractions and downloads running at the same time share one
+# call; waiting chats get the shared result (per process)
+extractions = SingleFlight()
+downloads = SingleFlight()
+# Jobs waiting for each shared download; the first one still waiting gets the upload
+download_recipients: Dict[Tuple[str, str], Recipients] = {}
+
+# Minimum seconds between two progress edits of the same message
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "3"))
+
+# Pending format choices, bounded by count and age
+user_states = SessionStore(
+    max_entries=int(os.getenv("MAX_SESSIONS", "1000")),
+    ttl=float(os.getenv("SESSION_TTL", "3600")),
+    backend=storage,
+)
+
+# Prometheus metrics of this process, served on METRICS_PORT when it is set
+# (worker processes use the ports right after it)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+metrics_registry = Registry()
+extract_seconds = metrics_registry.histogram(
+    "bot_extract_seconds", "Time to get the info of a link", labels=("source",))
+download_speed = metrics_registry.histogram(
+    "bot_download_bytes_per_second", "Average download speed of a file", THROUGHPUT_BUCKETS, labels=("method",))
+upload_speed = metrics_registry.histogram(
+    "bot_upload_bytes_per_second", "Average upload speed of a file", THROUGHPUT_BUCKETS, labels=("method",))
+queue_wait_seconds = metrics_registry.histogram(
+    "bot_queue_wait_seconds", "Time from choosing a format until the job starts")
+job_seconds = metrics_registry.histogram(
+    "bot_job_seconds", "Time from choosing a format until the job ends", labels=("kind",))
+failures = metrics_registry.counter(
+    "bot_failures_total", "Failed extractions, downloads and uploads", labels=("stage", "extractor"))
+metrics_registry.gauge("bot_active_jobs", "Downloads running in this process", lambda: scheduler.running_count)
+metrics_registry.gauge("bot_queued_jobs", "Downloads waiting for a slot in this process", lambda: scheduler.queued_count)
+metrics_registry.gauge("bot_sessions", "Pending format choices held in memory", lambda: len(user_states))
+metrics_registry.gauge("bot_spool_bytes", "Bytes reserved in the download spool by all processes", spool.used)
+
+# Rolling figures behind /status and /stats, cheap to update and to read
+STARTED_AT = time.time()
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").replace(",", " ").split()}
+recent_extractions = RecentSamples()
+recent_downloads = RecentSamples()
+bytes_served = RollingSum(window=3600)
+loop_lag = LoopLag()
+metrics_registry.gauge("bot_event_loop_lag_seconds", "How late the event loop last woke a sleeping task",
+                       lambda: loop_lag.last)
+
+# Per-job stage spans as JSON lines (off unless TRACE_FILE is set), and the
+# profiler admins switch on with /profile
+tracer = Tracer(os.getenv("TRACE_FILE") or None)
+profiler = Profiler(os.getenv("PROFILE_DIR", "profiles"))
+
+# Seconds from process start to import, connect, first update handled and
+# yt-dlp loaded; logged, checked against STARTUP_BUDGET ("import=3,first_update=5")
+# and written to STARTUP_REPORT when set
+startup = StartupTimer(budget=parse_budget(os.getenv("STARTUP_BUDGET", "")),
+                       report_path=os.getenv("STARTUP_REPORT") or None)
+
+# Load yt-dlp in the background once connected, instead of with the first link
+WARM_UP_YTDL = os.getenv("WARM_UP_YTDL", "1") == "1"
 
 def format_size(size_bytes: int) -> str:
     """Convert bytes to human readable format"""
@@ -81,64 +257,99 @@ def format_duration(seconds: int) -> str:
         remaining_seconds = seconds % 60
         return f"{hours}h {minutes}m {remaining_seconds}s"
 
-async def extract_video_info(url: str) -> Optional[Dict[str, Any]]:
-    """Extract video information using yt-dlp"""
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'extract_flat': False,
-    }
+async def extract_video_info(url: str) -> Optional[Union[VideoInfo, PlaylistInfo]]:
+    """Extract video (or flat playlist) information using yt-dlp"""
+    started = time.monotonic()
+    key = canonical_url(url)
+    cached = info_cache.get(key)
+    if cached:
+        extract_seconds.observe(time.monotonic() - started, source="cache")
+        tracer.record("extract", time.monotonic() - started, key=key, source="cache")
+        return load_info(cached)
     
+    # Concurrent requests for the same video wait on a single extraction
+    info = await extractions.do(key, lambda: fetch_video_info(url, key))
+    elapsed = time.monotonic() - started
+    extract_seconds.observe(elapsed, source="extract")
+    recent_extractions.add(elapsed)
+    tracer.record("extract", elapsed, key=key, source="extract", ok=info is not None)
+    return info
+
+async def fetch_video_info(url: str, key: str) -> Optional[Union[VideoInfo, PlaylistInfo]]:
+    """Run the yt-dlp extraction and cache its (projected) result"""
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return info
+        started = time.monotonic()
+        info = await pools.run_extract(ytdl.extract_info, url, LEAN_EXTRACTION, PLAYLIST_MAX_ENTRIES)
+        logger.info(f"Extracted {key} in {time.monotonic() - started:.2f}s")
+        info_cache.put(key, info)
+        return load_info(info)
     except Exception as e:
         logger.error(f"Error extracting info: {e}")
+        failures.inc(stage="extract", extractor=extractor_name(key))
         return None
 
-def get_available_formats(info: Dict[str, Any]) -> list:
+def transfer_speed(size: int, seconds: float) -> float:
+    """Average bytes per second of a transfer"""
+    return size / max(seconds, 0.001)
+
+def record_download(method: str, size: int, seconds: float):
+    """Feed a finished download into the metrics, the /status figures and the trace"""
+    download_speed.observe(transfer_speed(size, seconds), method=method)
+    recent_downloads.add(seconds)
+    tracer.record("download", seconds, bytes=size, method=method)
+
+def record_sent(messages: List[Message]):
+    """Count the bytes of media sent to users"""
+    for message in messages:
+        media = message.video or message.audio or message.document
+        if media and media.file_size:
+            bytes_served.add(media.file_size)
+
+def extractor_name(key: str) -> str:
+    """Metric label for a video key or URL: the extractor, else the host"""
+    if "://" in key:
+        return urlparse(key).netloc or "unknown"
+    return key.split(":", 1)[0]
+
+def get_available_formats(info: VideoInfo) -> list:
     """Get available video formats"""
-    formats = []
-    
-    if 'formats' in info:
-        for fmt in info['formats']:
-            if fmt.get('url') and fmt.get('ext'):
-                format_info = {
-                    'format_id': fmt.get('format_id', ''),
-                    'ext': fmt.get('ext', ''),
-                    'filesize': fmt.get('filesize'),
-                    'height': fmt.get('height'),
-                    'width': fmt.get('width'),
-                    'fps': fmt.get('fps'),
-                    'vcodec': fmt.get('vcodec'),
-                    'acodec': fmt.get('acodec'),
-                    'url': fmt.get('url'),
-                    'format_note': fmt.get('format_note', ''),
-                }
-                formats.append(format_info)
-    
-    return formats
+    # Copies, since sizes get filled in and the cached info must not change
+    return [dict(fmt, format_note=fmt.get('format_note', '')) for fmt in info.formats]
+
+def select_keyboard_formats(formats: list) -> Tuple[list, list]:
+    """Pick the video and audio formats offered on the keyboard"""
+    # Group formats by quality
+    video_formats = [f for f in formats if f.get('height') and f.get('vcodec') != 'none']
+    audio_formats = [f for f in formats if f.get('acodec') and f.get('acodec') != 'none']
+    
+    # Sort by quality (height)
+    video_formats.sort(key=lambda x: x.get('height', 0), reverse=True)
+    
+    # Show top 5 video formats and top 3 audio formats
+    return video_formats[:5], audio_formats[:3]
+
+def format_size_label(fmt: Dict[str, Any]) -> str:
+    """Exact size, "~" and an estimate, or Unknown"""
+    if fmt.get('filesize'):
+        return format_size(fmt['filesize'])
+    if fmt.get('filesize_approx'):
+        return f"~{format_size(fmt['filesize_approx'])}"
+    return 'Unknown'
 
 def create_format_keyboard(formats: list, video_id: str) -> InlineKeyboardMarkup:
     """Create inline keyboard for format selection"""
     keyboard = []
     
-    # Group formats by quality
-    video_formats = [f for f in formats if f.get('height') and f.get('vcodec') != 'none']
-    audio_formats = [f for f in formats if f.get('acodec') and f.get('acodec') != 'none']
+    video_formats, audio_formats = select_keyboard_formats(formats)
     
     # Add video formats
     if video_formats:
         keyboard.append([InlineKeyboardButton("📹 Video Formats", callback_data=f"header_video_{video_id}")])
         
-        # Sort by quality (height)
-        video_formats.sort(key=lambda x: x.get('height', 0), reverse=True)
-        
-        for fmt in video_formats[:5]:  # Show top 5 video formats
+        for fmt in video_formats:
             height = fmt.get('height', 'N/A')
             ext = fmt.get('ext', 'mp4')
-            size = format_size(fmt.get('filesize', 0)) if fmt.get('filesize') else 'Unknown'
+            size = format_size_label(fmt)
             text = f"🎥 {height}p ({ext}) - {size}"
             callback_data = f"download_{video_id}_{fmt['format_id']}"
             keyboard.append([InlineKeyboardButton(text, callback_data=callback_data)])
@@ -147,9 +358,9 @@ def create_format_keyboard(formats: list, video_id: str) -> InlineKeyboardMarkup
     if audio_formats:
         keyboard.append([InlineKeyboardButton("🎵 Audio Formats", callback_data=f"header_audio_{video_id}")])
         
-        for fmt in audio_formats[:3]:  # Show top 3 audio formats
+        for fmt in audio_formats:
             ext = fmt.get('ext', 'mp3')
-            size = format_size(fmt.get('filesize', 0)) if fmt.get('filesize') else 'Unknown'
+            size = format_size_label(fmt)
             text = f"🎵 Audio ({ext}) - {size}"
             callback_data = f"download_{video_id}_{fmt['format_id']}"
             keyboard.append([InlineKeyboardButton(text, callback_data=callback_data)])
@@ -159,6 +370,77 @@ def create_format_keyboard(formats: list, video_id: str) -> InlineKeyboardMarkup
     
     return InlineKeyboardMarkup(keyboard)
 
+def build_caption(title: str, selected_format: FormatRow, size: int) -> str:
+    """Build the caption sent along with a downloaded file"""
+    return f"""
+✅ <b>Download Complete!</b>
+
+<b>Title:</b> {title[:50]}
+<b>Format:</b> {selected_format.ext or 'mp4'}
+<b>Quality:</b> {selected_format.height or 'N/A'}p
+<b>Size:</b> {format_size(size)}
+
+Downloaded with ❤️ by Video Downloader Bot
+        """
+
+def build_part_caption(title: str, selected_format: FormatRow, size: int, index: int, count: int, raw_chunks: bool) -> str:
+    """Build the caption of one part of a split file"""
+    if index > 0:
+        return f"<b>Part {index + 1}/{count}</b>"
+    caption = build_caption(title, selected_format, size).rstrip() + f"\n\n<b>Part 1/{count}</b> (too large for a single Telegram upload)"
+    if raw_chunks:
+        caption += "\nJoin the parts in order to play the file, e.g. <code>cat file.001 file.002 &gt; file</code>"
+    return caption
+
+PROGRESS_HEADERS = {
+    DOWNLOAD: "⏳ <b>Downloading...</b>",
+    UPLOAD: "📤 <b>Uploading...</b>",
+    STREAM: "⚡ <b>Downloading and uploading...</b>",
+}
+
+def render_progress(selected_format: FormatRow, progress: Progress) -> str:
+    """Build the live progress message of a running job"""
+    lines = [
+        PROGRESS_HEADERS[progress.phase],
+        "",
+        f"<b>Format:</b> {selected_format.ext or 'mp4'}",
+        f"<b>Quality:</b> {selected_format.height or 'N/A'}p",
+        "",
+    ]
+    if progress.percent is not None:
+        lines.append(f"{progress_bar(progress.percent)} {progress.percent:.1f}%")
+        lines.append(f"{format_size(progress.done)} of {format_size(progress.total)}")
+    else:
+        lines.append(f"{format_size(progress.done)} so far")
+    if progress.speed:
+        eta = format_duration(int(progress.eta)) if progress.eta is not None else "Unknown"
+        lines.append(f"<b>Speed:</b> {format_size(int(progress.speed))}/s · <b>ETA:</b> {eta}")
+    return "\n".join(lines)
+
+def ytdl_progress(state: Dict[str, Any]) -> Progress:
+    """Convert a progress dict from ytdl.progress_hook"""
+    return Progress(DOWNLOAD, state['downloaded'], state['total'], state['speed'], state['eta'])
+
+async def reply_text(message: Message, text: str, **kwargs) -> Message:
+    """Reply to a message through the outbound scheduler"""
+    return await outbound.call(PRIORITY_SEND, message.chat.id, message.reply_text, text, **kwargs)
+
+async def edit_message(client: Client, chat_id: int, message_id: Optional[int], text: str, **kwargs) -> Optional[Message]:
+    """Edit a message through the outbound scheduler; a newer edit replaces a queued one"""
+    if message_id is None:
+        # Playlist entries have no message of their own
+        return None
+    return await outbound.call_replacing((chat_id, message_id), PRIORITY_EDIT, chat_id,
+                                         client.edit_message_text, chat_id, message_id, text, **kwargs)
+
+async def answer_callback(callback_query: CallbackQuery, text: Optional[str] = None, **kwargs):
+    """Answer a button press ahead of any queued edits"""
+    return await outbound.call(PRIORITY_ANSWER, None, callback_query.answer, text, **kwargs)
+
+def create_job_keyboard(job_id: str) -> InlineKeyboardMarkup:
+    """Create inline keyboard with a cancel button for a queued or running job"""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"stop_{job_id}")]])
+
 @app.on_message(filters.command("start"))
 async def start_command(client: Client, message: Message):
     """Handle /start command"""
@@ -186,7 +468,7 @@ I can download videos from most popular websites including:
 Made with ❤️ using yt-dlp
     """
     
-    await message.reply_text(welcome_text, parse_mode="html")
+    await reply_text(message, welcome_text, parse_mode="html")
 
 @app.on_message(filters.command("help"))
 async def help_command(client: Client, message: Message):
@@ -217,23 +499,28 @@ async def help_command(client: Client, message: Message):
 • Audio-only formats are smaller in size
 • Some videos may take time to process
 • Large files might be split due to Telegram limits
+• Send several links in one message (or a .txt file) to download them all at once
+• Playlist and channel links download every video
 
 <b>Need help?</b> Contact @your_username
     """
     
-    await message.reply_text(help_text, parse_mode="html")
+    await reply_text(message, help_text, parse_mode="html")
 
 @app.on_message(filters.command("status"))
 async def status_command(client: Client, message: Message):
     """Handle /status command"""
-    status_text = """
+    cache_stats = info_cache.stats()
+    status_text = f"""
 🤖 <b>Bot Status</b>
 
-✅ <b>Bot is running</b>
-✅ <b>yt-dlp is available</b>
-✅ <b>Ready to download videos</b>
+<b>Uptime:</b> {format_duration(int(time.time() - STARTED_AT))}
+<b>Downloads:</b> {scheduler.running_count} running, {queued_downloads()} queued
+<b>Extraction:</b> {format_latency(recent_extractions)}
+<b>Download:</b> {format_latency(recent_downloads)}
+<b>Info cache:</b> {cache_stats['entries']} entries, {cache_stats['hit_rate']:.0%} hit rate
+<b>Event loop lag:</b> {loop_lag.last * 1000:.0f} ms
 
-<b>Uptime:</b> Since last restart
 <b>Version:</b> 1.0.0
 <b>Powered by:</b> yt-dlp + Pyrogram
 <b>Hosted on:</b> PythonAnywhere
@@ -241,7 +528,85 @@ async def status_command(client: Client, message: Message):
 Send me a video URL to get started!
     """
     
-    await message.reply_text(status_text, parse_mode="html")
+    await reply_text(message, status_text, parse_mode="html")
+
+@app.on_message(filters.command("stats"))
+async def stats_command(client: Client, message: Message):
+    """Handle /stats command (admins only)"""
+    if message.from_user.id not in ADMIN_USER_IDS:
+        await reply_text(message, "❌ This command is only available to the bot's admins.")
+        return
+    
+    info_stats = info_cache.stats()
+    file_stats = file_id_cache.stats()
+    lag_p95 = loop_lag.recent.percentile(95) or 0.0
+    failed = failures.total()
+    stats_text = f"""
+📊 <b>Bot Statistics</b>
+
+<b>Uptime:</b> {format_duration(int(time.time() - STARTED_AT))} · <b>Mode:</b> {BOT_MODE}
+<b>Downloads:</b> {scheduler.running_count} running, {queued_downloads()} queued
+<b>Sessions:</b> {len(user_states)} pending format choices
+
+<b>Extraction:</b> {format_latency(recent_extractions)} ({len(recent_extractions)} recent)
+<b>Download:</b> {format_latency(recent_downloads)} ({len(recent_downloads)} recent)
+<b>Served (last hour):</b> {format_size(int(bytes_served.total()))}
+<b>Failures since start:</b> {failed:.0f}
+
+<b>Info cache:</b> {info_stats['entries']} entries, {info_stats['hit_rate']:.0%} hit rate ({info_stats['disk_hits']} from disk)
+<b>File ID cache:</b> {file_stats['entries']} files, {file_stats['hit_rate']:.0%} hit rate
+<b>Shared work:</b> {extractions.shared} extractions, {downloads.shared} downloads
+<b>Spool:</b> {format_size(spool.used())} of {format_size(spool.quota_bytes) if spool.quota_bytes else 'unlimited'}
+<b>Outbound:</b> {outbound.queued_count} queued, {outbound.flood_waits} flood waits
+<b>Event loop lag:</b> {loop_lag.last * 1000:.0f} ms now, {lag_p95 * 1000:.0f} ms p95
+    """
+    
+    await reply_text(message, stats_text, parse_mode="html")
+
+@app.on_message(filters.command("profile"))
+async def profile_command(client: Client, message: Message):
+    """Handle /profile command (admins only): /profile jobs N, /profile seconds N or /profile stop"""
+    if message.from_user.id not in ADMIN_USER_IDS:
+        await reply_text(message, "❌ This command is only available to the bot's admins.")
+        return
+    
+    args = message.command[1:]
+    if args[:1] == ["stop"]:
+        path = profiler.stop()
+        await reply_text(message, f"✅ Profile written to <code>{path}</code>" if path else "ℹ️ No profile is being recorded.", parse_mode="html")
+        return
+    
+    try:
+        unit, amount = args[0], int(args[1])
+        if unit not in ("jobs", "seconds") or amount <= 0:
+            raise ValueError(unit)
+    except (IndexError, ValueError):
+        await reply_text(message, "Usage: <code>/profile jobs N</code>, <code>/profile seconds N</code> or <code>/profile stop</code>", parse_mode="html")
+        return
+    if unit == "jobs" and BOT_MODE == "frontend":
+        # Downloads finish in the workers, so this process would never count one
+        await reply_text(message, "❌ Downloads run in the worker processes in frontend mode. Use <code>/profile seconds N</code> instead.", parse_mode="html")
+        return
+    
+    try:
+        profiler.start(jobs=amount if unit == "jobs" else 0, seconds=amount if unit == "seconds" else 0)
+    except RuntimeError as e:
+        await reply_text(message, f"❌ {e}. Use /profile stop first.")
+        return
+    await reply_text(message, f"⏺ Profiling the next {amount} {unit}; the profile goes to <code>{profiler.directory}</code>.", parse_mode="html")
+
+def queued_downloads() -> int:
+    """Downloads waiting in this process, or in the shared queue in frontend mode"""
+    if BOT_MODE == "frontend":
+        return job_queue.length(JobQueue.DOWNLOAD)
+    return scheduler.queued_count
+
+def format_latency(samples: RecentSamples) -> str:
+    """Recent median and 95th percentile of a latency, for display"""
+    p50 = samples.percentile(50)
+    if p50 is None:
+        return "no recent data"
+    return f"p50 {p50:.1f}s · p95 {samples.percentile(95):.1f}s"
 
 @app.on_message(filters.text)
 async def handle_url(client: Client, message: Message):
@@ -249,40 +614,100 @@ async def handle_url(client: Client, message: Message):
     # Skip if this is a command
     if message.text.startswith('/'):
         return
-        
-    url = message.text.strip()
     
+    # Several links in one message are downloaded as a batch
+    urls = find_urls(message.text, MAX_BATCH_URLS)
+    if len(urls) > 1:
+        await offer_batch(client, message, urls)
+        return
+    
+    await handle_single_url(client, message, urls[0] if urls else message.text.strip())
+
+@app.on_message(filters.document)
+async def handle_document(client: Client, message: Message):
+    """Handle .txt documents with video URLs"""
+    document = message.document
+    if document.mime_type != "text/plain" and not (document.file_name or "").lower().endswith(".txt"):
+        return
+    
+    if document.file_size > BATCH_FILE_MAX_BYTES:
+        await reply_text(message, f"❌ This file is too large. Please send at most {format_size(BATCH_FILE_MAX_BYTES)} of links.")
+        return
+    
+    data = await client.download_media(message, in_memory=True)
+    urls = find_urls(bytes(data.getbuffer()).decode("utf-8", errors="replace"), MAX_BATCH_URLS)
+    if len(urls) == 1:
+        await handle_single_url(client, message, urls[0])
+    else:
+        await offer_batch(client, message, urls)
+
+async def handle_single_url(client: Client, message: Message, url: str):
+    """Validate one URL and offer its formats"""
     # Basic URL validation
-    if not any(domain in url.lower() for domain in ['youtube', 'youtu.be', 'instagram', 'tiktok', 'twitter', 'facebook', 'reddit', 'vimeo', 'dailymotion']):
-        await message.reply_text("❌ Please send a valid video URL from supported platforms.")
+    if not is_supported(url):
+        await reply_text(message, "❌ Please send a valid video URL from supported platforms.")
         return
     
+    url = canonical_url(url)
+    
     # Send processing message
-    processing_msg = await message.reply_text("🔍 <b>Processing your video...</b>\n\nPlease wait while I extract the available formats.", parse_mode="html")
+    processing_msg = await reply_text(message, "🔍 <b>Processing your video...</b>\n\nPlease wait while I extract the available formats.", parse_mode="html")
     
+    if BOT_MODE == "frontend":
+        # A worker process extracts the formats and edits the message
+        job_queue.enqueue_extract(message.from_user.id, message.chat.id, processing_msg.id, url)
+        return
+    
+    await process_url(client, message.chat.id, processing_msg.id, message.from_user.id, url)
+
+async def process_url(client: Client, chat_id: int, message_id: int, user_id: int, url: str):
+    """Extract formats for a URL and offer them on the processing message"""
     try:
         # Extract video information
         info = await extract_video_info(url)
         
         if not info:
-            await processing_msg.edit_text("❌ <b>Error:</b> Could not extract video information.\n\nPlease check if the URL is valid and the video is available.")
+            await edit_message(client, chat_id, message_id, "❌ <b>Error:</b> Could not extract video information.\n\nPlease check if the URL is valid and the video is available.")
+            return
+        
+        if isinstance(info, PlaylistInfo):
+            await offer_playlist(client, chat_id, message_id, user_id, url, info)
             return
         
         # Get video details
-        title = info.get('title', 'Unknown Title')
-        duration = info.get('duration', 0)
-        uploader = info.get('uploader', 'Unknown')
-        thumbnail = info.get('thumbnail')
+        title = info.title
+        duration = info.duration
+        uploader = info.uploader
+        thumbnail = info.thumbnail
         
         # Get available formats
-        formats = get_available_formats(info)
+        key = info.key(url)
+        with tracer.span("formats", key=key) as span:
+            formats = get_available_formats(info)
+            span['formats'] = len(formats)
         
         if not formats:
-            await processing_msg.edit_text("❌ <b>Error:</b> No downloadable formats found for this video.")
+            await edit_message(client, chat_id, message_id, "❌ <b>Error:</b> No downloadable formats found for this video.")
             return
         
-        # Generate unique video ID
-        video_id = str(hash(url))[:8]
+        # Generate a stable per-user session ID from the video identity
+        video_id = session_id(key, user_id)
+        
+        # Size the offered formats, within a fixed time budget
+        video_formats, audio_formats = select_keyboard_formats(formats)
+        with tracer.span("sizes", key=key) as span:
+            span['filled'] = await fill_sizes(get_http_session(), video_formats + audio_formats, duration, deadline=SIZE_PROBE_DEADLINE)
+        
+        # Store only what the keyboard and download need for later use
+        user_states.put(video_id, Session(
+            url=url,
+            video_key=key,
+            title=title,
+            duration=duration,
+            formats=[FormatRow.from_format(fmt) for fmt in video_formats + audio_formats],
+            user_id=user_id,
+            message_id=message_id,
+        ))
         
         # Create format selection keyboard
         keyboard = create_format_keyboard(formats, video_id)
@@ -300,24 +725,17 @@ Choose your preferred format below:
         """
         
         # Send video info with format options
-        await processing_msg.edit_text(
+        await edit_message(client, 
+            chat_id,
+            message_id,
             response_text,
             reply_markup=keyboard,
             parse_mode="html"
         )
         
-        # Store video info for later use
-        user_states[video_id] = {
-            'url': url,
-            'info': info,
-            'formats': formats,
-            'user_id': message.from_user.id,
-            'message_id': message.id
-        }
-        
     except Exception as e:
         logger.error(f"Error processing URL: {e}")
-        await processing_msg.edit_text(f"❌ <b>Error:</b> An unexpected error occurred.\n\nError: {str(e)}")
+        await edit_message(client, chat_id, message_id, f"❌ <b>Error:</b> An unexpected error occurred.\n\nError: {str(e)}")
 
 @app.on_callback_query()
 async def handle_callback(client: Client, callback_query: CallbackQuery):
@@ -328,138 +746,726 @@ async def handle_callback(client: Client, callback_query: CallbackQuery):
     try:
         if data.startswith("download_"):
             # Parse download request
-            parts = data.split("_")
+            parts = data.split("_", 2)
             video_id = parts[1]
             format_id = parts[2]
             
-            if video_id not in user_states:
-                await callback_query.answer("❌ Video session expired. Please send the URL again.")
-                return
+            session = user_states.get(video_id)
             
-            video_info = user_states[video_id]
+            if not session:
+                await answer_callback(callback_query, "❌ Video session expired. Please send the URL again.")
+                return
             
             # Check if user owns this session
-            if video_info['user_id'] != user_id:
-                await callback_query.answer("❌ This download session is not yours.")
+            if session.user_id != user_id:
+                await answer_callback(callback_query, "❌ This download session is not yours.")
                 return
             
             # Find the selected format
-            selected_format = None
-            for fmt in video_info['formats']:
-                if fmt['format_id'] == format_id:
-                    selected_format = fmt
-                    break
+            selected_format = session.find_format(format_id)
             
             if not selected_format:
-                await callback_query.answer("❌ Format not found.")
+                await answer_callback(callback_query, "❌ Format not found.")
+                return
+            
+            # Re-send an earlier upload of the same video and format instantly
+            if not session.playlist and await send_cached_file(client, callback_query, session, selected_format):
                 return
             
-            # Start download process
-            await start_download(client, callback_query, video_info, selected_format)
+            # Queue the download; it starts as soon as a slot is free
+            spec = JobSpec(
+                user_id=user_id,
+                chat_id=callback_query.message.chat.id,
+                message_id=callback_query.message.id,
+                url=session.url,
+                video_key=session.video_key,
+                title=session.title,
+                duration=session.duration,
+                format=selected_format,
+                playlist=session.playlist,
+                urls=session.urls,
+            )
+            
+            if BOT_MODE == "frontend":
+                position = job_queue.enqueue_download(spec)
+                await edit_message(client, callback_query.message.chat.id, callback_query.message.id, 
+                    f"⏳ <b>Queued</b>\n\n<b>Position in queue:</b> {position}\n\nYour download will start automatically.",
+                    reply_markup=create_job_keyboard(spec.job_id),
+                    parse_mode="html"
+                )
+                await answer_callback(callback_query, "⏳ Download queued")
+                return
+            
+            job = submit_download(client, spec)
+            await answer_callback(callback_query, "⏳ Download queued" if job.position else "⏳ Download started")
             
         elif data.startswith("cancel_"):
             video_id = data.split("_")[1]
             
-            if video_id in user_states:
-                del user_states[video_id]
+            user_states.pop(video_id)
+            
+            await edit_message(client, callback_query.message.chat.id, callback_query.message.id, "❌ <b>Download cancelled.</b>\n\nSend me another video URL to try again.", parse_mode="html")
+            await answer_callback(callback_query, "Download cancelled")
+            
+        elif data.startswith("stop_"):
+            job_id = data.split("_")[1]
+            
+            if BOT_MODE == "frontend":
+                # The job runs in a worker process; ask it to stop
+                spec = job_queue.get_spec(job_id)
+                job_owner = spec.user_id if spec else None
+            else:
+                job = scheduler.get(job_id)
+                job_owner = job.user_id if job else None
+            
+            if job_owner is None:
+                await answer_callback(callback_query, "❌ This download has already finished.")
+                return
+            
+            if job_owner != user_id:
+                await answer_callback(callback_query, "❌ This download session is not yours.")
+                return
             
-            await callback_query.message.edit_text("❌ <b>Download cancelled.</b>\n\nSend me another video URL to try again.", parse_mode="html")
-            await callback_query.answer("Download cancelled")
+            if BOT_MODE == "frontend":
+                job_queue.request_cancel(job_id)
+            else:
+                await scheduler.cancel(job_id)
+            await edit_message(client, callback_query.message.chat.id, callback_query.message.id, "❌ <b>Download cancelled.</b>\n\nSend me another video URL to try again.", parse_mode="html")
+            await answer_callback(callback_query, "Download cancelled")
             
         elif data.startswith("header_"):
             # Just acknowledge header buttons
-            await callback_query.answer()
+            await answer_callback(callback_query)
             
     except Exception as e:
         logger.error(f"Error handling callback: {e}")
-        await callback_query.answer("❌ An error occurred.")
+        await answer_callback(callback_query, "❌ An error occurred.")
 
-async def start_download(client: Client, callback_query: CallbackQuery, video_info: dict, selected_format: dict):
-    """Start the download process"""
-    try:
-        # Update message to show download progress
-        progress_text = f"""
-⏳ <b>Downloading...</b>
+def submit_download(client: Client, spec: JobSpec) -> Job:
+    """Queue a download job and keep its message updated with the queue position"""
+    async def run(job: Job):
+        # Spans recorded anywhere below belong to this job
+        current_job.set(spec.job_id)
+        waited = max(0.0, time.time() - spec.created_at)
+        queue_wait_seconds.observe(waited)
+        tracer.record("queue", waited)
+        try:
+            with tracer.span("job", key=spec.video_key, format=spec.format.format_id, playlist=spec.playlist):
+                await start_download(client, spec, job)
+        finally:
+            job_seconds.observe(max(0.0, time.time() - spec.created_at), kind="playlist" if spec.playlist else "video")
+            profiler.job_finished()
+    
+    async def show_position(position: int):
+        await edit_message(client, 
+            spec.chat_id,
+            spec.message_id,
+            f"⏳ <b>Queued</b>\n\n<b>Position in queue:</b> {position}\n\nYour download will start automatically.",
+            reply_markup=create_job_keyboard(job.job_id),
+            parse_mode="html"
+        )
+    
+    job = scheduler.submit(spec.user_id, run, on_position=show_position, spec=spec)
+    return job
 
-<b>Format:</b> {selected_format.get('ext', 'mp4')}
-<b>Quality:</b> {selected_format.get('height', 'N/A')}p
-<b>Size:</b> {format_size(selected_format.get('filesize', 0)) if selected_format.get('filesize') else 'Unknown'}
+async def resume_pending_downloads(client: Client):
+    """Requeue downloads that were unfinished when the bot last stopped"""
+    specs = scheduler.pending_specs()
+    for spec in specs:
+        submit_download(client, spec)
+    if specs:
+        logger.info(f"Resumed {len(specs)} pending downloads")
 
-Please wait while I download your video...
-        """
-        
-        await callback_query.message.edit_text(progress_text, parse_mode="html")
-        
-        # Download the video
-        downloaded_file = await download_video(video_info['url'], selected_format)
-        
-        if not downloaded_file:
-            await callback_query.message.edit_text("❌ <b>Download failed.</b>\n\nPlease try again or choose a different format.")
-            return
-        
-        # Send the video file
-        caption = f"""
-✅ <b>Download Complete!</b>
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared HTTP session, creating it on first use"""
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_read=60))
+    return http_session
 
-<b>Title:</b> {video_info['info'].get('title', 'Unknown')[:50]}
-<b>Format:</b> {selected_format.get('ext', 'mp4')}
-<b>Quality:</b> {selected_format.get('height', 'N/A')}p
-<b>Size:</b> {format_size(os.path.getsize(downloaded_file))}
+def is_audio_format(selected_format: FormatRow) -> bool:
+    """Whether a format is sent as audio rather than video"""
+    # Audio-only formats in other containers, like WebM, are audio all the same
+    return selected_format.ext in AUDIO_EXTS or (selected_format.vcodec == 'none' and not selected_format.height)
 
-Downloaded with ❤️ by Video Downloader Bot
-        """
+async def stream_download(client: Client, spec: JobSpec, reporter: ProgressReporter):
+    """Pipe a progressive format from its URL into the upload without touching disk"""
+    selected_format = spec.format
+    return await stream_media(
+        client,
+        get_http_session(),
+        spec.chat_id,
+        selected_format.url,
+        file_name=f"{spec.title[:60]}.{selected_format.ext or 'mp4'}",
+        caption=lambda size: build_caption(spec.title, selected_format, size),
+        parse_mode="html",
+        audio=is_audio_format(selected_format),
+        duration=int(spec.duration or 0),
+        width=selected_format.width or 0,
+        height=selected_format.height or 0,
+        expected_size=selected_format.filesize,
+        headers=selected_format.http_headers,
+        buffer_size=STREAM_BUFFER_SIZE,
+        progress=reporter.callback(STREAM),
+        max_size=MAX_UPLOAD_SIZE,
+        outbound=outbound,
+    )
+
+async def start_download(client: Client, spec: JobSpec, job: Job):
+    """Start the download process"""
+    selected_format = spec.format
+    if spec.playlist:
+        await download_playlist(client, spec, job)
+        return
+    
+    try:
+        # The same file may have been uploaded while this job was queued
+        if await send_cached(client, spec.chat_id, spec.video_key, spec.title, selected_format):
+            await edit_message(client, spec.chat_id, spec.message_id, "✅ <b>Download completed successfully!</b>\n\nSend me another video URL to download more videos.", parse_mode="html")
+            return
         
-        # Send file based on type
-        if selected_format.get('ext') in ['mp3', 'm4a', 'wav', 'ogg']:
-            await client.send_audio(
-                chat_id=callback_query.message.chat.id,
-                audio=downloaded_file,
-                caption=caption,
-                parse_mode="html"
-            )
-        else:
-            await client.send_video(
-                chat_id=callback_query.message.chat.id,
-                video=downloaded_file,
-                caption=caption,
-                parse_mode="html"
-            )
+        flight_key = (spec.video_key, selected_format.format_id)
+        follower = downloads.in_flight(flight_key)
+        if follower:
+            await edit_message(client, spec.chat_id, spec.message_id, "⏳ <b>Waiting for the same download...</b>\n\nThis video is already being downloaded in this format. You will get a copy as soon as it is ready.", reply_markup=create_job_keyboard(job.job_id), parse_mode="html")
+        
+        recipients = download_recipients.setdefault(flight_key, Recipients())
+        recipients.add(spec)
+        try:
+            sent = await downloads.do(flight_key, lambda: transfer(client, spec, recipients))
+        except Exception as e:
+            if not follower:
+                raise
+            logger.warning(f"Shared download of {spec.video_key} failed: {e}")
+            sent = None
+        finally:
+            # When this job is stopped, the shared download goes on for the next one waiting
+            recipients.discard(spec)
+            if not recipients and download_recipients.get(flight_key) is recipients:
+                del download_recipients[flight_key]
         
-        # Clean up
-        os.remove(downloaded_file)
+        if sent and sent[0].chat.id != spec.chat_id:
+            # The shared upload went to the chat of another job
+            sent = await copy_shared_upload(client, spec.chat_id, sent)
+        if sent is None and follower:
+            sent = await transfer(client, spec)
+        
+        if sent is None:
+            return
         
         # Update message
-        await callback_query.message.edit_text("✅ <b>Download completed successfully!</b>\n\nSend me another video URL to download more videos.", parse_mode="html")
+        await edit_message(client, spec.chat_id, spec.message_id, "✅ <b>Download completed successfully!</b>\n\nSend me another video URL to download more videos.", parse_mode="html")
         
     except Exception as e:
         logger.error(f"Error in download process: {e}")
-        await callback_query.message.edit_text(f"❌ <b>Download failed.</b>\n\nError: {str(e)}")
+        await edit_message(client, spec.chat_id, spec.message_id, f"❌ <b>Download failed.</b>\n\nError: {str(e)}")
+
+async def transfer(client: Client, spec: JobSpec, recipients: Optional[Recipients] = None) -> Optional[List[Message]]:
+    """Download a format and upload it to the chat of spec, streaming when possible
+
+    A shared transfer reports to and uploads for the first of recipients
+    still waiting, so a job that is stopped gets no further edits or files.
+    """
+    selected_format = spec.format
+    if recipients is None:
+        recipients = Recipients([spec])
+    # Runs under its own Job: a shared transfer must outlive the scheduler
+    # job that started it, and is only stopped once nobody waits for it
+    job = Job(spec.user_id, None, spec=spec)
+    reporter = ProgressReporter(
+        lambda text: show_transfer(client, recipients, text),
+        lambda progress: render_progress(selected_format, progress),
+        min_interval=PROGRESS_INTERVAL,
+    )
+    
+    # Update message to show download progress
+    progress_text = f"""
+⏳ <b>Downloading...</b>
+
+<b>Format:</b> {selected_format.ext or 'mp4'}
+<b>Quality:</b> {selected_format.height or 'N/A'}p
+<b>Size:</b> {format_size(selected_format.filesize) if selected_format.filesize else 'Unknown'}
 
-async def download_video(url: str, format_info: dict) -> Optional[str]:
-    """Download video using yt-dlp"""
-    temp_dir = tempfile.mkdtemp()
+Please wait while I download your video...
+    """
     
+    await show_transfer(client, recipients, progress_text)
+    
+    sent = None
     try:
-        ydl_opts = {
-            'format': format_info['format_id'],
-            'outtmpl': os.path.join(temp_dir, '%(title)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-        }
+        if STREAM_UPLOADS and selected_format.url:
+            # Upload while downloading; fall back to a staged download on failure
+            try:
+                started = time.monotonic()
+                sent = [await recipients.serve(lambda owner: stream_download(client, owner, reporter))]
+                media = sent[0].video or sent[0].audio or sent[0].document
+                if media and media.file_size:
+                    elapsed = time.monotonic() - started
+                    record_download("stream", media.file_size, elapsed)
+                    upload_speed.observe(transfer_speed(media.file_size, elapsed), method="stream")
+                    tracer.record("upload", elapsed, bytes=media.file_size, method="stream")
+            except StreamingUnavailable as e:
+                logger.info(f"Streaming not possible for {spec.video_key}: {e}")
+            except (aiohttp.ClientError, IOError, asyncio.TimeoutError) as e:
+                logger.warning(f"Streaming upload failed for {spec.video_key}, retrying via yt-dlp: {e}")
+                failures.inc(stage="stream", extractor=extractor_name(spec.video_key))
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+        if sent is None:
+            sent = await download_and_send(client, spec, job, reporter, recipients)
+    finally:
+        # No progress edit may land after the final message
+        await reporter.close()
+    
+    if sent:
+        record_sent(sent)
+        # Remember the upload so repeat requests can skip download and upload
+        media = sent[0].video or sent[0].audio or sent[0].document
+        if media and len(sent) == 1:
+            file_id_cache.put(spec.video_key, selected_format.format_id,
+                              media.file_id, sent[0].media.value, media.file_size or 0)
+    return sent
+
+async def show_transfer(client: Client, recipients: Recipients, text: str, stoppable: bool = True):
+    """Show the state of a transfer on the message of the first job waiting for it"""
+    owner = recipients.first
+    if owner:
+        reply_markup = create_job_keyboard(owner.job_id) if stoppable else None
+        await edit_message(client, owner.chat_id, owner.message_id, text, reply_markup=reply_markup, parse_mode="html")
+
+async def copy_shared_upload(client: Client, chat_id: int, sent: List[Message]) -> Optional[List[Message]]:
+    """Copy an upload made for another chat into chat_id; None if that fails"""
+    copies = []
+    copied_groups = set()
+    try:
+        for message in sent:
+            if message.media_group_id:
+                # Albums are sent in groups of ten; copy each group once
+                if message.media_group_id in copied_groups:
+                    continue
+                copied_groups.add(message.media_group_id)
+                copies.extend(await outbound.call(
+                    PRIORITY_UPLOAD, chat_id, client.copy_media_group,
+                    chat_id=chat_id, from_chat_id=message.chat.id, message_id=message.id
+                ))
+            else:
+                copies.append(await outbound.call(
+                    PRIORITY_UPLOAD, chat_id, client.copy_message,
+                    chat_id=chat_id, from_chat_id=message.chat.id, message_id=message.id
+                ))
+    except Exception as e:
+        logger.warning(f"Could not copy shared upload to chat {chat_id}: {e}")
+        return None
+    record_sent(copies)
+    return copies
+
+async def offer_playlist(client: Client, chat_id: int, message_id: int, user_id: int, url: str, info: PlaylistInfo):
+    """Offer the playlist presets for a playlist or channel link"""
+    if not info.entries:
+        await edit_message(client, chat_id, message_id, "❌ <b>Error:</b> This playlist has no downloadable videos.")
+        return
+    
+    key = info.key(url)
+    video_id = session_id(key, user_id)
+    user_states.put(video_id, Session(
+        url=url,
+        video_key=key,
+        title=info.title,
+        duration=len(info.entries),
+        formats=PLAYLIST_PRESETS,
+        user_id=user_id,
+        message_id=message_id,
+        playlist=True,
+    ))
+    
+    keyboard = create_preset_keyboard(video_id)
+    limit_note = f" (only the first {PLAYLIST_MAX_ENTRIES} are downloaded)" if len(info.entries) >= PLAYLIST_MAX_ENTRIES else ""
+    response_text = f"""
+📃 <b>Playlist Found!</b>
+
+<b>Title:</b> {info.title[:100]}{'...' if len(info.title) > 100 else ''}
+<b>Uploader:</b> {info.uploader}
+<b>Videos:</b> {len(info.entries)}{limit_note}
+
+Every video will be sent to this chat. Choose a format:
+    """
+    await edit_message(client, chat_id, message_id, response_text, reply_markup=keyboard, parse_mode="html")
+
+async def offer_batch(client: Client, message: Message, urls: List[str]):
+    """Offer the playlist presets for every supported link of a message"""
+    supported = [url for url in urls if is_supported(url)]
+    if not supported:
+        await reply_text(message, "❌ Please send valid video URLs from supported platforms.")
+        return
+    
+    key = batch_key(supported)
+    video_id = session_id(key, message.from_user.id)
+    skipped = len(urls) - len(supported)
+    skipped_note = f"\n<b>Skipped:</b> {skipped} unsupported link(s)" if skipped else ""
+    response_text = f"""
+📦 <b>Batch of {len(supported)} links</b>
+{skipped_note}
+Every video will be sent to this chat as soon as it is ready. Choose a format:
+    """
+    offer = await reply_text(message, response_text, reply_markup=create_preset_keyboard(video_id), parse_mode="html")
+    user_states.put(video_id, Session(
+        url=supported[0],
+        video_key=key,
+        title=f"Batch of {len(supported)} links",
+        duration=len(supported),
+        formats=PLAYLIST_PRESETS,
+        user_id=message.from_user.id,
+        message_id=offer.id,
+        playlist=True,
+        urls=supported,
+    ))
+
+def create_preset_keyboard(video_id: str) -> InlineKeyboardMarkup:
+    """Create inline keyboard with the playlist presets"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"📹 Videos (up to {PLAYLIST_MAX_HEIGHT}p)", callback_data=f"download_{video_id}_video")],
+        [InlineKeyboardButton("🎵 Audio only", callback_data=f"download_{video_id}_audio")],
+        [InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{video_id}")],
+    ])
+
+def render_playlist_progress(spec: JobSpec, stats: PipelineStats) -> str:
+    """Build the aggregate progress message of a playlist job"""
+    lines = [
+        f"📃 <b>Downloading {'batch' if spec.urls else 'playlist'}...</b>",
+        "",
+        f"<b>Title:</b> {spec.title[:50]}",
+        f"<b>Format:</b> {'Audio only' if spec.format.format_id == 'audio' else f'Videos up to {spec.format.height}p'}",
+        "",
+        f"{progress_bar(stats.finished * 100 / stats.total)} {stats.finished}/{stats.total}",
+        f"<b>Sent:</b> {stats.done} · <b>Failed:</b> {stats.failed}",
+    ]
+    return "\n".join(lines)
+
+async def download_playlist(client: Client, spec: JobSpec, job: Job):
+    """Send every entry of a playlist or batch, overlapping extraction, download and upload
+
+    Entries are sent as soon as they are ready, not in list order.
+    """
+    if spec.urls:
+        entries = [{'url': url} for url in spec.urls]
+    else:
+        info = await extract_video_info(spec.url)
+        if not isinstance(info, PlaylistInfo) or not info.entries:
+            await edit_message(client, spec.chat_id, spec.message_id, "❌ <b>Error:</b> Could not extract the playlist.\n\nPlease send the link again.")
+            return
+        entries = info.entries
+    
+    stats = PipelineStats(len(entries))
+    reporter = ProgressReporter(
+        lambda text: edit_message(client, spec.chat_id, spec.message_id, text, reply_markup=create_job_keyboard(job.job_id), parse_mode="html"),
+        lambda progress: render_playlist_progress(spec, stats),
+        min_interval=PROGRESS_INTERVAL,
+    )
+    
+    async def prepare(entry: Dict[str, Any]) -> Optional[JobSpec]:
+        entry_info = await extract_video_info(entry['url'])
+        if not isinstance(entry_info, VideoInfo):
+            return None
+        selected_format = pick_entry_format(get_available_formats(entry_info), spec.format,
+                                            merge=shutil.which("ffmpeg") is not None)
+        if not selected_format:
+            logger.warning(f"No {'audio-only' if spec.format.format_id == 'audio' else 'video'} format for playlist entry {entry['url']}")
+            return None
+        return JobSpec(
+            user_id=spec.user_id,
+            chat_id=spec.chat_id,
+            message_id=None,
+            url=entry['url'],
+            video_key=entry_info.key(entry['url']),
+            title=entry_info.title,
+            duration=entry_info.duration,
+            format=selected_format,
+        )
+    
+    async def deliver(entry_spec: JobSpec) -> bool:
+        if await send_cached(client, entry_spec.chat_id, entry_spec.video_key, entry_spec.title, entry_spec.format):
+            return True
+        return bool(await transfer(client, entry_spec))
+    
+    reporter.report(Progress(PLAYLIST, 0, stats.total))
+    try:
+        await run_pipeline(
+            entries, prepare, deliver,
+            # Extractions are cheap next to transfers; use the whole extraction pool
+            prepare_workers=max(PLAYLIST_CONCURRENCY, pools.extract_workers),
+            deliver_workers=PLAYLIST_CONCURRENCY,
+            buffer=PLAYLIST_CONCURRENCY,
+            stats=stats,
+            on_update=lambda stats: reporter.report(Progress(PLAYLIST, stats.finished, stats.total)),
+        )
+    finally:
+        await reporter.close()
+    
+    await edit_message(client, spec.chat_id, spec.message_id, f"✅ <b>{'Batch' if spec.urls else 'Playlist'} finished!</b>\n\n<b>Sent:</b> {stats.done} · <b>Failed:</b> {stats.failed}\n\nSend me another video URL to download more videos.", parse_mode="html")
+
+def spool_reservation(selected_format: FormatRow) -> int:
+    """Bytes of spool space to reserve for downloading a format"""
+    filesize = selected_format.filesize or selected_format.filesize_approx
+    if not filesize:
+        return SPOOL_DEFAULT_RESERVATION
+    size = filesize
+    if "+" in selected_format.format_id:
+        # Merged formats keep the video, the audio and the merged output on disk at once;
+        # video-only formats are downloaded as they are
+        size *= 2
+    if filesize > MAX_UPLOAD_SIZE:
+        # Split parts sit next to the original until they are uploaded
+        size += split_reservation(filesize, MAX_UPLOAD_SIZE, SPLIT_UPLOAD_WORKERS)
+    return size
+
+async def download_and_send(client: Client, spec: JobSpec, job: Job, reporter: ProgressReporter,
+                            recipients: Optional[Recipients] = None) -> Optional[List[Message]]:
+    """Download a format into a spool directory with yt-dlp, then upload it (in parts if needed)"""
+    if recipients is None:
+        recipients = Recipients([spec])
+    selected_format = spec.format
+    
+    try:
+        job.work_dir = await spool.reserve(spool_reservation(selected_format), job.job_id,
+                                           timeout=SPOOL_WAIT_TIMEOUT)
+    except SpoolFull as e:
+        logger.warning(f"No spool space for job {job.job_id}: {e}")
+        failures.inc(stage="spool", extractor=extractor_name(spec.video_key))
+        await show_transfer(client, recipients, "❌ <b>Not enough disk space for this format.</b>\n\nPlease try a smaller format or try again later.", stoppable=False)
+        return None
+    
+    try:
+        # Download the video
+        downloaded_file = await download_video(spec.url, selected_format, job, reporter, title=spec.title)
         
-        # Find the downloaded file
-        files = os.listdir(temp_dir)
-        if files:
-            return os.path.join(temp_dir, files[0])
+        if not downloaded_file:
+            await show_transfer(client, recipients, "❌ <b>Download failed.</b>\n\nPlease try again or choose a different format.", stoppable=False)
+            return None
         
-        return None
+        size = os.path.getsize(downloaded_file)
+        started = time.monotonic()
+        with tracer.span("upload", bytes=size) as span:
+            try:
+                sent = await recipients.serve(lambda owner: upload_file(client, owner, job, reporter, downloaded_file, size))
+            except Exception:
+                failures.inc(stage="upload", extractor=extractor_name(spec.video_key))
+                raise
+            span['method'] = "split" if len(sent) > 1 else "single"
+        upload_speed.observe(transfer_speed(size, time.monotonic() - started), method="split" if len(sent) > 1 else "single")
+        return sent
+    finally:
+        # Runs on success, failure and cancellation alike
+        spool.release(job.work_dir)
+
+async def upload_file(client: Client, spec: JobSpec, job: Job, reporter: ProgressReporter, downloaded_file: str, size: int) -> List[Message]:
+    """Send a downloaded file, split into an album when it is too large"""
+    selected_format = spec.format
+    if needs_split(downloaded_file, MAX_UPLOAD_SIZE):
+        return await split_and_send(
+            client, spec.chat_id, downloaded_file, job.work_dir,
+            caption=lambda index, count, raw_chunks: build_part_caption(spec.title, selected_format, size, index, count, raw_chunks),
+            parse_mode="html",
+            audio=is_audio_format(selected_format),
+            duration=spec.duration,
+            width=selected_format.width or 0,
+            height=selected_format.height or 0,
+            part_size=MAX_UPLOAD_SIZE,
+            workers=SPLIT_UPLOAD_WORKERS,
+            outbound=outbound,
+            progress=reporter.callback(UPLOAD),
+        )
+    
+    # Send the video file
+    caption = build_caption(spec.title, selected_format, size)
+    
+    # Send file based on type
+    if is_audio_format(selected_format):
+        sent = await outbound.call(
+            PRIORITY_UPLOAD, spec.chat_id, client.send_audio,
+            chat_id=spec.chat_id,
+            audio=downloaded_file,
+            caption=caption,
+            parse_mode="html",
+            progress=reporter.callback(UPLOAD)
+        )
+    else:
+        sent = await outbound.call(
+            PRIORITY_UPLOAD, spec.chat_id, client.send_video,
+            chat_id=spec.chat_id,
+            video=downloaded_file,
+            caption=caption,
+            parse_mode="html",
+            progress=reporter.callback(UPLOAD)
+        )
+    return [sent]
+
+async def send_cached(client: Client, chat_id: int, video_key: str, title: str, selected_format: FormatRow) -> bool:
+    """Send a previously uploaded file to chat_id by its Telegram file_id"""
+    cached = file_id_cache.get(video_key, selected_format.format_id)
+    if not cached:
+        return False
+    
+    file_id, media_type, file_size = cached
+    try:
+        await outbound.call(
+            PRIORITY_UPLOAD, chat_id, client.send_cached_media,
+            chat_id=chat_id,
+            file_id=file_id,
+            caption=build_caption(title, selected_format, file_size),
+            parse_mode="html"
+        )
+    except Exception as e:
+        logger.warning(f"Cached {media_type} for {video_key} is no longer valid: {e}")
+        file_id_cache.discard(video_key, selected_format.format_id)
+        return False
+    bytes_served.add(file_size)
+    return True
+
+async def send_cached_file(client: Client, callback_query: CallbackQuery, session: Session, selected_format: FormatRow) -> bool:
+    """Re-send a previously uploaded file in reply to a format choice"""
+    if not await send_cached(client, callback_query.message.chat.id, session.video_key, session.title, selected_format):
+        return False
+    
+    await answer_callback(callback_query, "✅ Sent from cache")
+    await edit_message(client, callback_query.message.chat.id, callback_query.message.id, "✅ <b>Download completed successfully!</b>\n\nSend me another video URL to download more videos.", parse_mode="html")
+    return True
+
+async def poll_progress_file(progress_file: ytdl.ProgressFile, reporter: ProgressReporter):
+    """Forward progress written by a download in the process pool"""
+    while True:
+        await asyncio.sleep(1)
+        state = progress_file.read()
+        if state:
+            reporter.report(ytdl_progress(state))
+
+async def native_download(format_info: FormatRow, job: Job, title: str, reporter: Optional[ProgressReporter] = None) -> Optional[str]:
+    """Fetch a direct-URL format over parallel range requests; None means use yt-dlp"""
+    # Naming the file loads yt-dlp on first use; with process pools it is not
+    # loaded in this process yet, so keep that off the event loop
+    path = os.path.join(job.work_dir, await asyncio.to_thread(ytdl.output_name, title, format_info.ext))
+    try:
+        return await download_ranges(
+            get_http_session(),
+            format_info.url,
+            path,
+            headers=format_info.http_headers,
+            connections=DOWNLOAD_CONNECTIONS,
+            progress=reporter.callback(DOWNLOAD) if reporter else None,
+        )
+    except RangesUnsupported as e:
+        logger.info(f"Ranged download not possible, using yt-dlp: {e}")
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+        logger.warning(f"Ranged download failed, retrying via yt-dlp: {e}")
+    if os.path.exists(path):
+        os.remove(path)
+    return None
+
+async def download_video(url: str, format_info: FormatRow, job: Job, reporter: Optional[ProgressReporter] = None, title: str = "video") -> Optional[str]:
+    """Download video natively when the format has a direct URL, otherwise using yt-dlp"""
+    extractor = extractor_name(job.spec.video_key if job.spec else url)
+    if NATIVE_DOWNLOADS and format_info.url:
+        started = time.monotonic()
+        path = await native_download(format_info, job, title, reporter)
+        if path:
+            record_download("native", os.path.getsize(path), time.monotonic() - started)
+            return path
+    
+    report = None
+    poller = None
+    if reporter and pools.kind == "process":
+        report = ytdl.ProgressFile(os.path.join(job.work_dir, ".progress"))
+        poller = asyncio.ensure_future(poll_progress_file(report, reporter))
+    elif reporter:
+        # Hand progress from the download thread to the loop without waiting on it
+        loop = asyncio.get_running_loop()
+        report = lambda state: loop.call_soon_threadsafe(reporter.report, ytdl_progress(state))
+    
+    download = asyncio.ensure_future(
+        pools.run_download(ytdl.download, url, format_info.format_id, job.work_dir, job.cancel_path, report,
+                           FRAGMENT_CONCURRENCY)
+    )
+    
+    started = time.monotonic()
+    try:
+        path = await asyncio.shield(download)
+        if path:
+            record_download("ytdl", os.path.getsize(path), time.monotonic() - started)
+        else:
+            failures.inc(stage="download", extractor=extractor)
+            tracer.record("download", time.monotonic() - started, method="ytdl", ok=False)
+        return path
         
+    except asyncio.CancelledError:
+        # yt-dlp stops once it sees the cancel marker; wait for it so the
+        # work directory is no longer in use when it gets removed
+        job.request_cancel()
+        await asyncio.wait([download])
+        raise
     except Exception as e:
         logger.error(f"Error downloading video: {e}")
+        failures.inc(stage="download", extractor=extractor)
+        tracer.record("download", time.monotonic() - started, method="ytdl", ok=False)
         return None
+    finally:
+        if poller:
+            poller.cancel()
+
+async def warm_up_ytdl():
+    """Import yt-dlp and its extractors in the pools, off the event loop"""
+    try:
+        await pools.warm_up(ytdl.warm_up)
+    except Exception as e:
+        logger.warning(f"Could not warm up yt-dlp: {e}")
+        return
+    startup.mark("ytdl_ready")
+
+async def first_update_handled(client: Client, update):
+    """Record the first handled update, then stop listening"""
+    if startup.mark("first_update") is not None:
+        for handler in FIRST_UPDATE_HANDLERS:
+            client.remove_handler(handler, FIRST_UPDATE_GROUP)
+
+# Handlers in a later group run once the regular ones are done with an update
+FIRST_UPDATE_GROUP = 1
+FIRST_UPDATE_HANDLERS = (MessageHandler(first_update_handled), CallbackQueryHandler(first_update_handled))
+for handler in FIRST_UPDATE_HANDLERS:
+    app.add_handler(handler, FIRST_UPDATE_GROUP)
+
+async def start_metrics(port_offset: int = 0):
+    """Serve this process's metrics if METRICS_PORT is set; returns the runner to clean up"""
+    if not METRICS_PORT:
+        return None
+    return await serve_metrics(metrics_registry, METRICS_HOST, METRICS_PORT + port_offset)
+
+async def main():
+    """Run the bot until it is stopped, resuming unfinished downloads first"""
+    spool.sweep()
+    try:
+        async with app:
+            startup.mark("connect")
+            # Commands are answered right away while yt-dlp loads in the pools;
+            # a frontend leaves extraction and downloads to its workers
+            warm_up = asyncio.ensure_future(warm_up_ytdl()) if WARM_UP_YTDL and BOT_MODE != "frontend" else None
+            loop_lag.start()
+            metrics_server = await start_metrics()
+            if BOT_MODE == "standalone":
+                await resume_pending_downloads(app)
+            await idle()
+            if warm_up:
+                warm_up.cancel()
+            await scheduler.shutdown()
+            await outbound.close()
+            if http_session:
+                await http_session.close()
+            if metrics_server:
+                await metrics_server.cleanup()
+            await loop_lag.stop()
+            profiler.stop()
+            tracer.close()
+    finally:
+        # Removes this process's job directories even after a crash
+        spool.close()
+
+startup.mark("import")
 
 if __name__ == "__main__":
     print("🚀 Starting Video Downloader Bot on PythonAnywhere...")
@@ -472,9 +1478,11 @@ if __name__ == "__main__":
         sys.exit(1)
     
     try:
-        app.run()
+        app.run(main())
     except KeyboardInterrupt:
         print("\n🛑 Bot stopped by user")
     except Exception as e:
         logger.error(f"Bot crashed: {e}")
         print(f"❌ Bot crashed: {e}")
+    finally:
+        pools.shutdown(wait=False)
@@ -0,0 +1,206 @@
+import json
+import time
+import sqlite3
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that carry the expiry time (unix seconds) of signed
+# media URLs, e.g. googlevideo.com uses "expire"
+EXPIRY_PARAMS = ("expire", "expires", "Expires")
+
+
+def url_expiry(url: str) -> Optional[float]:
+    """Return the unix time a signed media URL stops working, if it says so"""
+    try:
+        query = parse_qs(urlparse(url).query)
+    except ValueError:
+        return None
+
+    for param in EXPIRY_PARAMS:
+        for value in query.get(param, []):
+            try:
+                return float(value)
+            except ValueError:
+                continue
+    return None
+
+
+def info_expiry(info: Dict[str, Any]) -> Optional[float]:
+    """Earliest expiry among the signed format URLs of an info dict"""
+    expiries = [url_expiry(fmt['url']) for fmt in info.get('formats') or [] if fmt.get('url')]
+    expiries = [expiry for expiry in expiries if expiry]
+    return min(expiries) if expiries else None
+
+
+class InfoCache:
+    """LRU cache for extracted video info with an optional SQLite tier
+
+    Entries live for at most `ttl` seconds, and never past the moment the
+    signed format URLs inside them expire (minus `safety_margin`), since a
+    cached info with dead URLs is worse than a fresh extraction.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 1800, db_path: Optional[str] = None,
+                 safety_margin: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.safety_margin = safety_margin
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS info_cache "
+                "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, info TEXT NOT NULL)"
+            )
+            self._db.execute("DELETE FROM info_cache WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def expires_at(self, info: Dict[str, Any], now: Optional[float] = None) -> float:
+        """Compute when a freshly extracted info should leave the cache"""
+        now = time.time() if now is None else now
+        expires_at = now + self.ttl
+        url_expires_at = info_expiry(info)
+        if url_expires_at:
+            expires_at = min(expires_at, url_expires_at - self.safety_margin)
+        return expires_at
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached info, checking memory first and then disk"""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry:
+            expires_at, info = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return info
+            del self._entries[key]
+
+        if self._db:
+            row = self._db.execute(
+                "SELECT expires_at, info FROM info_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row:
+                info = json.loads(row[1])
+                self._remember(key, row[0], info)
+                self.hits += 1
+                self.disk_hits += 1
+                return info
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, info: Dict[str, Any]):
+        """Cache an info unless its format URLs are about to expire"""
+        expires_at = self.expires_at(info)
+        if expires_at <= time.time():
+            return
+
+        self._remember(key, expires_at, info)
+        if self._db:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO info_cache (key, expires_at, info) VALUES (?, ?, ?)",
+                    (key, expires_at, json.dumps(info)),
+                )
+                self._db.commit()
+            except (TypeError, ValueError, sqlite3.Error) as e:
+                logger.warning(f"Could not persist info for {key}: {e}")
+
+    def _remember(self, key: str, expires_at: float, info: Dict[str, Any]):
+        self._entries[key] = (expires_at, info)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for tuning the cache size and TTL"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self._db:
+            self._db.close()
+            self._db = None
+
+
+class FileIdCache:
+    """Persistent index from (video key, format id) to a Telegram file_id
+
+    Telegram lets a bot re-send any file it has uploaded by its file_id, so
+    a repeat request for the same video and format needs neither yt-dlp
+    nor an upload.
+    """
+
+    def __init__(self, db_path: str = ":memory:"):
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids "
+            "(video_key TEXT NOT NULL, format_id TEXT NOT NULL, file_id TEXT NOT NULL, "
+            "media_type TEXT NOT NULL, file_size INTEGER, created_at REAL NOT NULL, "
+            "PRIMARY KEY (video_key, format_id))"
+        )
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, video_key: str, format_id: str) -> Optional[Tuple[str, str, int]]:
+        """Return (file_id, media_type, file_size) of an earlier upload"""
+        row = self._db.execute(
+            "SELECT file_id, media_type, file_size FROM file_ids WHERE video_key = ? AND format_id = ?",
+            (video_key, format_id),
+        ).fetchone()
+        if row:
+            self.hits += 1
+            return row[0], row[1], row[2] or 0
+        self.misses += 1
+        return None
+
+    def put(self, video_key: str, format_id: str, file_id: str, media_type: str, file_size: int = 0):
+        self._db.execute(
+            "INSERT OR REPLACE INTO file_ids "
+            "(video_key, format_id, file_id, media_type, file_size, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (video_key, format_id, file_id, media_type, file_size, time.time()),
+        )
+        self._db.commit()
+
+    def discard(self, video_key: str, format_id: str):
+        """Forget a file_id that Telegram no longer accepts"""
+        self._db.execute("DELETE FROM file_ids WHERE video_key = ? AND format_id = ?", (video_key, format_id))
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        self._db.close()
@@ -11,3 +11,113 @@ API_HASH = "your_api_hash_here"
 
 # Optional: Set to True for debug logging
 DEBUG = False
+
+# Optional: Pools for blocking yt-dlp work ("thread" or "process")
+# Worker counts of 0 pick a default based on the number of CPU cores
+EXECUTOR_KIND = "thread"
+EXTRACT_WORKERS = 0
+DOWNLOAD_WORKERS = 0
+
+# Optional: Download queue limits
+MAX_CONCURRENT_DOWNLOADS = 3
+MAX_DOWNLOADS_PER_USER = 1
+
+# Optional: Video info cache (set INFO_CACHE_DB to a file path to keep it across restarts)
+INFO_CACHE_SIZE = 256
+INFO_CACHE_TTL = 1800
+INFO_CACHE_DB = ""
+
+# Optional: Where Telegram file_ids of earlier uploads are kept
+FILE_ID_CACHE_DB = "file_ids.db"
+
+# Optional: Pending format choices (count cap and lifetime in seconds)
+MAX_SESSIONS = 1000
+SESSION_TTL = 3600
+
+# Optional: Shared storage for sessions and queued jobs, so they survive restarts
+# memory:// (default), sqlite:///bot_state.db or redis://localhost:6379/0
+STORAGE_URL = ""
+
+# Optional: "standalone" (default) or "frontend"; in frontend mode run worker.py
+# with the same STORAGE_URL to do extraction, downloads and uploads
+BOT_MODE = "standalone"
+WORKER_PROCESSES = 0
+
+# Optional: Upload progressive formats while they download instead of staging
+# them on disk first (1 = on, 0 = off), and the in-memory buffer size in MB
+STREAM_UPLOADS = 1
+STREAM_BUFFER_MB = 8
+
+# Optional: Download scratch space (defaults to a folder in the system temp dir),
+# its quota in MB, the space reserved when a format's size is unknown, and how
+# long a download waits for room before giving up (seconds). A file above
+# MAX_UPLOAD_MB needs room for itself and the parts being uploaded, so the
+# quota must be well above MAX_UPLOAD_MB for splitting to work; 8192 fits
+# files up to 4 GB with the default part size
+SPOOL_DIR = ""
+SPOOL_QUOTA_MB = 8192
+SPOOL_DEFAULT_RESERVATION_MB = 256
+SPOOL_WAIT_TIMEOUT = 600
+
+# Optional: Minimum seconds between two progress updates of the same message
+PROGRESS_INTERVAL = 3
+
+# Optional: Outgoing Bot API rate limits per process (requests per second overall,
+# per chat, and the per-chat burst); split the overall rate across worker processes
+OUTBOUND_GLOBAL_RATE = 25
+OUTBOUND_CHAT_RATE = 1
+OUTBOUND_CHAT_BURST = 3
+
+# Optional: Files above this size (MB) are split into parts and sent as an album;
+# stream-copy splitting needs ffmpeg, otherwise raw byte chunks are sent
+MAX_UPLOAD_MB = 2000
+SPLIT_UPLOAD_WORKERS = 3
+
+# Optional: Fetch direct-URL formats over several parallel range requests
+# (falls back to yt-dlp when the server does not support ranges), and how many
+# DASH/HLS fragments yt-dlp downloads at once
+NATIVE_DOWNLOADS = 1
+DOWNLOAD_CONNECTIONS = 4
+FRAGMENT_CONCURRENCY = 4
+
+# Optional: Seconds allowed for sizing formats with HEAD requests before the
+# format keyboard is shown
+SIZE_PROBE_DEADLINE = 1.5
+
+# Optional: Lean extraction skips subtitles, comments, format checks and
+# playlist expansion of video links (1 = on, 0 = full yt-dlp extraction)
+LEAN_EXTRACTION = 1
+
+# Optional: Playlist and channel links - entries taken from the start, how many
+# entries are downloaded and uploaded at once, and the highest video quality
+PLAYLIST_MAX_ENTRIES = 500
+PLAYLIST_CONCURRENCY = 2
+PLAYLIST_MAX_HEIGHT = 720
+
+# Optional: Links taken from one message or .txt document (sent as a batch with
+# one format preset), and the largest .txt document accepted in KB
+MAX_BATCH_URLS = 50
+BATCH_FILE_MAX_KB = 256
+
+# Optional: Serve Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics
+# (0 = off); worker processes use the following ports, one each
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 0
+
+# Optional: Telegram user IDs (comma separated) allowed to use /stats
+ADMIN_USER_IDS = ""
+
+# Optional: Write per-job stage spans (job id, stage, duration, bytes) as JSON
+# lines to this file, and where /profile (admins only) writes its profiles
+TRACE_FILE = ""
+PROFILE_DIR = "profiles"
+
+# Optional: Startup budget in seconds since process start per milestone (import,
+# connect, first_update, ytdl_ready); slower milestones are logged as warnings,
+# and the timings are written as JSON to STARTUP_REPORT when it is set
+STARTUP_BUDGET = ""
+STARTUP_REPORT = ""
+
+# Optional: Load yt-dlp in the background right after connecting (1) instead of
+# with the first link (0)
+WARM_UP_YTDL = 1
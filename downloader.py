@@ -0,0 +1,126 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Work is handed out in segments of this size, so fast connections simply
+# take more of them; each segment is retried on its own
+SEGMENT_SIZE = 8 * 1024 * 1024
+READ_CHUNK_SIZE = 256 * 1024
+SEGMENT_RETRIES = 3
+PROGRESS_INTERVAL = 0.5
+
+CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+)")
+
+# Multi-connection downloader for direct URLs: the file is preallocated and
+# fetched as HTTP Range segments over one pooled aiohttp session, each
+# connection writing its bytes in place with os.pwrite.
+
+
+class RangesUnsupported(Exception):
+    """The server (or platform) cannot do ranged downloads; use yt-dlp instead"""
+
+
+async def probe(http: aiohttp.ClientSession, url: str, headers: Optional[Dict[str, str]] = None) -> int:
+    """Return the size of the file behind url, or raise RangesUnsupported"""
+    request_headers = dict(headers or {}, Range="bytes=0-0")
+    async with http.get(url, headers=request_headers) as response:
+        response.raise_for_status()
+        match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+        if response.status != 206 or not match:
+            raise RangesUnsupported(f"Server answered a range request with {response.status}")
+        return int(match.group(3))
+
+
+def plan_segments(size: int, segment_size: int = SEGMENT_SIZE) -> List[Tuple[int, int]]:
+    """Inclusive (start, end) byte ranges covering the whole file"""
+    return [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+
+
+async def download_ranges(http: aiohttp.ClientSession, url: str, path: str,
+                          headers: Optional[Dict[str, str]] = None, connections: int = 4,
+                          segment_size: int = SEGMENT_SIZE,
+                          progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> str:
+    """Download url into path over up to `connections` parallel range requests
+
+    Raises RangesUnsupported before writing anything when the server does
+    not honour Range requests. Cancelling the calling task stops every
+    connection; the partial file is left for the caller to remove.
+    """
+    if not hasattr(os, "pwrite"):
+        raise RangesUnsupported("Positional writes are not available on this platform")
+
+    size = await probe(http, url, headers)
+    segments = plan_segments(size, segment_size)
+    queue: asyncio.Queue = asyncio.Queue()
+    for segment in segments:
+        queue.put_nowait(segment)
+
+    done = 0
+    last_report = 0.0
+
+    async def report(force: bool = False):
+        nonlocal last_report
+        now = time.monotonic()
+        if progress and (force or now - last_report >= PROGRESS_INTERVAL):
+            last_report = now
+            await progress(done, size)
+
+    async def fetch(fd: int, start: int, end: int):
+        nonlocal done
+        offset = start
+        for attempt in range(SEGMENT_RETRIES + 1):
+            try:
+                request_headers = dict(headers or {}, Range=f"bytes={offset}-{end}")
+                async with http.get(url, headers=request_headers) as response:
+                    if response.status != 206:
+                        raise RangesUnsupported(f"Server answered a range request with {response.status}")
+                    async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+                        chunk = chunk[:end + 1 - offset]
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                        done += len(chunk)
+                        await report()
+                if offset > end:
+                    return
+                raise aiohttp.ClientPayloadError(f"Segment {start}-{end} ended at {offset}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == SEGMENT_RETRIES:
+                    raise
+                logger.debug(f"Retrying segment {start}-{end} from {offset}: {e}")
+                await asyncio.sleep(0.5 * (attempt + 1))
+
+    async def worker(fd: int):
+        while True:
+            try:
+                start, end = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await fetch(fd, start, end)
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        # Reserve the whole file up front so segments can land in any order
+        if hasattr(os, "posix_fallocate") and size:
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+        workers = [asyncio.ensure_future(worker(fd)) for _ in range(max(1, min(connections, len(segments))))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.wait(workers)
+            raise
+    finally:
+        os.close(fd)
+
+    await report(force=True)
+    return path
@@ -0,0 +1,88 @@
+import os
+import asyncio
+import logging
+import functools
+from typing import Callable, Any
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_KINDS = ("thread", "process")
+
+
+def default_workers() -> int:
+    """Number of CPU cores available to this process"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class ExecutorPools:
+    """Separate bounded pools for yt-dlp extraction and downloading
+
+    Blocking yt-dlp calls must never run on the event loop, otherwise one
+    large download stalls every handler. Extraction and downloading get
+    their own pools so a burst of long downloads cannot starve extraction.
+    """
+
+    def __init__(self, extract_workers: int = 0, download_workers: int = 0, kind: str = "thread"):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown executor kind: {kind!r} (expected one of {EXECUTOR_KINDS})")
+
+        self.kind = kind
+        self.extract_workers = extract_workers or default_workers() * 2
+        self.download_workers = download_workers or default_workers()
+        self._extract_pool = self._create_pool(self.extract_workers, "extract")
+        self._download_pool = self._create_pool(self.download_workers, "download")
+
+    def _create_pool(self, workers: int, name: str) -> Executor:
+        if self.kind == "process":
+            return ProcessPoolExecutor(max_workers=workers)
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    async def _run(self, pool: Executor, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+
+    async def run_extract(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking extraction call in the extraction pool"""
+        return await self._run(self._extract_pool, func, *args, **kwargs)
+
+    async def run_download(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking download call in the download pool"""
+        return await self._run(self._download_pool, func, *args, **kwargs)
+
+    async def warm_up(self, func: Callable, *args, **kwargs):
+        """Run func ahead of real work in every worker, e.g. to import heavy modules
+
+        Threads share their imports, so one call is enough. Each worker
+        process has its own; a process pool starts a new process for a
+        call while none is idle, so one call per worker reaches most of them.
+        """
+        if self.kind != "process":
+            await self.run_extract(func, *args, **kwargs)
+            return
+        await asyncio.gather(
+            *(self.run_extract(func, *args, **kwargs) for _ in range(self.extract_workers)),
+            *(self.run_download(func, *args, **kwargs) for _ in range(self.download_workers)),
+        )
+
+    def shutdown(self, wait: bool = True):
+        """Shut down both pools"""
+        self._extract_pool.shutdown(wait=wait, cancel_futures=True)
+        self._download_pool.shutdown(wait=wait, cancel_futures=True)
+
+    @classmethod
+    def from_env(cls) -> "ExecutorPools":
+        """Build pools from EXECUTOR_KIND, EXTRACT_WORKERS and DOWNLOAD_WORKERS"""
+        pools = cls(
+            extract_workers=int(os.getenv("EXTRACT_WORKERS", "0")),
+            download_workers=int(os.getenv("DOWNLOAD_WORKERS", "0")),
+            kind=os.getenv("EXECUTOR_KIND", "thread").lower(),
+        )
+        logger.info(
+            f"Executor pools: kind={pools.kind}, extract={pools.extract_workers}, "
+            f"download={pools.download_workers}"
+        )
+        return pools
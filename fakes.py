@@ -0,0 +1,305 @@
+import os
+import re
+import time
+import asyncio
+import threading
+import itertools
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from aiohttp import web
+from pyrogram import enums
+
+from video_ids import short_id, youtube_id
+from video_info import project_info
+
+# Stand-ins for Telegram, yt-dlp and the media hosts, so the real handlers
+# can be driven offline by benchmark.py and loadtest.py
+
+# Bytes written per chunk by the media server; bandwidth is enforced per chunk
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+class MediaServer:
+    """HTTP server for fake media files, on its own thread and event loop
+
+    Every path serves `size` bytes, with HEAD and Range support. Each
+    response waits `latency` seconds before its first byte, and each
+    connection is throttled to `bandwidth` bytes/s (0 for unlimited).
+    Running on a separate loop keeps its work out of the measured one.
+    """
+
+    def __init__(self, size: int, latency: float = 0.0, bandwidth: float = 0):
+        self.size = size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.url: Optional[str] = None
+        self.requests = 0
+        self.bytes_sent = 0
+        self._block = os.urandom(CHUNK_SIZE)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    def start(self) -> str:
+        """Start serving; returns the base URL"""
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="media-server", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if not self.url:
+            raise RuntimeError("Media server did not start")
+        return self.url
+
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def _run(self, ready: threading.Event):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._start())
+        finally:
+            ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get("/{name:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", 0).start()
+        self.url = f"http://127.0.0.1:{self._runner.addresses[0][1]}"
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        start, end = 0, self.size - 1
+        match = RANGE_RE.fullmatch(request.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), end) if match.group(2) else end
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        response = web.StreamResponse(status=206 if match else 200)
+        response.content_type = "video/mp4"
+        response.content_length = end - start + 1
+        response.headers["Accept-Ranges"] = "bytes"
+        if match:
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{self.size}"
+        await response.prepare(request)
+        if request.method == "HEAD":
+            return response
+
+        remaining = end - start + 1
+        while remaining:
+            chunk = min(remaining, CHUNK_SIZE)
+            started = time.monotonic()
+            await response.write(self._block[:chunk])
+            remaining -= chunk
+            self.bytes_sent += chunk
+            if self.bandwidth:
+                await asyncio.sleep(max(0.0, chunk / self.bandwidth - (time.monotonic() - started)))
+        await response.write_eof()
+        return response
+
+
+class FakeExtractor:
+    """Stand-in for ytdl.extract_info with formats hosted on a MediaServer
+
+    Blocks its thread for `latency` seconds like yt-dlp does, then returns
+    a projected info dict with one progressive MP4 and one M4A format.
+    The video ID is taken from YouTube links, other links get a hash.
+    """
+
+    def __init__(self, base_url: str, size: int, latency: float = 0.0):
+        self.base_url = base_url
+        self.size = size
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url: str, lean: bool = True, playlist_end: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        video = youtube_id(url) or short_id(url, 10)
+        media = f"{self.base_url}/{video}"
+        return project_info({
+            'id': video,
+            'extractor_key': 'Youtube' if youtube_id(url) else urlparse(url).netloc,
+            'webpage_url': url,
+            'title': f"Benchmark video {video}",
+            'duration': 60,
+            'uploader': 'Benchmark',
+            'formats': [
+                {'format_id': '140', 'ext': 'm4a', 'url': f"{media}.m4a", 'protocol': 'http',
+                 'filesize': self.size, 'vcodec': 'none', 'acodec': 'mp4a.40.2'},
+                {'format_id': '22', 'ext': 'mp4', 'url': f"{media}.mp4", 'protocol': 'http',
+                 'filesize': self.size, 'height': 720, 'width': 1280, 'vcodec': 'avc1.64001F',
+                 'acodec': 'mp4a.40.2'},
+            ],
+        })
+
+
+def fake_url(index: int, run: str = "") -> str:
+    """A distinct, valid YouTube link for the index-th fake video"""
+    return f"https://www.youtube.com/watch?v=b{short_id(f'{run}/{index}', 10)}"
+
+
+class FakeClient:
+    """Stand-in for a Pyrogram Client that records what the bot sends
+
+    Every call takes `api_latency` seconds. Uploads read the file at up to
+    `upload_bandwidth` bytes/s (0 for unlimited) and report progress the
+    way Pyrogram does. Messages keep their latest text and keyboard, and
+    tasks can wait for a message to reach a given text.
+    """
+
+    def __init__(self, api_latency: float = 0.0, upload_bandwidth: float = 0):
+        self.api_latency = api_latency
+        self.upload_bandwidth = upload_bandwidth
+        self.messages: Dict[Tuple[int, int], SimpleNamespace] = {}
+        self.calls: Counter = Counter()
+        self.uploaded_bytes = 0
+        self._ids = itertools.count(1)
+        self._watchers: Dict[Tuple[int, int], List[Tuple[Callable[[str], bool], asyncio.Future]]] = defaultdict(list)
+
+    # Updates as Pyrogram would deliver them to the handlers
+
+    def text_message(self, user_id: int, text: str, chat_id: Optional[int] = None) -> SimpleNamespace:
+        """An incoming text Message from a user"""
+        message = self._new_message(chat_id or user_id, text)
+        message.from_user = SimpleNamespace(id=user_id)
+        message.replies = []
+
+        async def reply_text(text: str, **kwargs) -> SimpleNamespace:
+            reply = await self.send_message(message.chat.id, text, **kwargs)
+            message.replies.append(reply)
+            return reply
+        message.reply_text = reply_text
+        return message
+
+    def callback_query(self, user_id: int, message: SimpleNamespace, data: str) -> SimpleNamespace:
+        """A button press on one of the bot's messages"""
+        async def answer(text: Optional[str] = None, **kwargs):
+            await self._call("answer_callback_query")
+            return True
+        return SimpleNamespace(id=str(next(self._ids)), data=data, from_user=SimpleNamespace(id=user_id),
+                               message=message, answer=answer)
+
+    def buttons(self, chat_id: int, message_id: int) -> List[str]:
+        """Callback data of the keyboard currently on a message"""
+        markup = self.messages[(chat_id, message_id)].reply_markup
+        if not markup:
+            return []
+        return [button.callback_data for row in markup.inline_keyboard for button in row if button.callback_data]
+
+    async def wait_for(self, chat_id: int, message_id: int, predicate: Callable[[str], bool],
+                       timeout: Optional[float] = None) -> str:
+        """Wait until the text of a message satisfies predicate; returns the text"""
+        message = self.messages.get((chat_id, message_id))
+        if message and predicate(message.text):
+            return message.text
+        future = asyncio.get_running_loop().create_future()
+        self._watchers[(chat_id, message_id)].append((predicate, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            watchers = self._watchers.get((chat_id, message_id))
+            if watchers is not None:
+                watchers[:] = [entry for entry in watchers if entry[1] is not future]
+                if not watchers:
+                    del self._watchers[(chat_id, message_id)]
+
+    # The Client methods the bot calls
+
+    async def send_message(self, chat_id: int, text: str, reply_markup=None, **kwargs) -> SimpleNamespace:
+        await self._call("send_message")
+        message = self._new_message(chat_id, text, reply_markup)
+        self._changed(message)
+        return message
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, reply_markup=None,
+                                **kwargs) -> SimpleNamespace:
+        await self._call("edit_message_text")
+        message = self.messages[(chat_id, message_id)]
+        message.text = text
+        message.reply_markup = reply_markup
+        self._changed(message)
+        return message
+
+    async def send_video(self, chat_id: int, video: str, progress=None, **kwargs) -> SimpleNamespace:
+        return await self._upload("send_video", chat_id, video, enums.MessageMediaType.VIDEO, progress)
+
+    async def send_audio(self, chat_id: int, audio: str, progress=None, **kwargs) -> SimpleNamespace:
+        return await self._upload("send_audio", chat_id, audio, enums.MessageMediaType.AUDIO, progress)
+
+    async def send_document(self, chat_id: int, document: str, progress=None, **kwargs) -> SimpleNamespace:
+        return await self._upload("send_document", chat_id, document, enums.MessageMediaType.DOCUMENT, progress)
+
+    async def send_cached_media(self, chat_id: int, file_id: str, **kwargs) -> SimpleNamespace:
+        await self._call("send_cached_media")
+        return self._media_message(chat_id, enums.MessageMediaType.VIDEO, file_id, 0)
+
+    async def copy_message(self, chat_id: int, from_chat_id: int, message_id: int, **kwargs) -> SimpleNamespace:
+        await self._call("copy_message")
+        original = self.messages[(from_chat_id, message_id)]
+        media = getattr(original, original.media.value)
+        return self._media_message(chat_id, original.media, media.file_id, media.file_size)
+
+    async def copy_media_group(self, chat_id: int, from_chat_id: int, message_id: int,
+                               **kwargs) -> List[SimpleNamespace]:
+        return [await self.copy_message(chat_id, from_chat_id, message_id)]
+
+    # Internals
+
+    async def _call(self, method: str):
+        self.calls[method] += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+    async def _upload(self, method: str, chat_id: int, path: str, media_type: enums.MessageMediaType,
+                      progress=None) -> SimpleNamespace:
+        await self._call(method)
+        size = os.path.getsize(path)
+        done = 0
+        with open(path, "rb") as f:
+            while True:
+                started = time.monotonic()
+                chunk = len(f.read(512 * 1024))
+                if not chunk:
+                    break
+                done += chunk
+                if progress:
+                    await progress(done, size)
+                delay = chunk / self.upload_bandwidth - (time.monotonic() - started) if self.upload_bandwidth else 0
+                await asyncio.sleep(max(0.0, delay))
+        self.uploaded_bytes += size
+        return self._media_message(chat_id, media_type, f"file-{next(self._ids)}", size)
+
+    def _new_message(self, chat_id: int, text: str = "", reply_markup=None) -> SimpleNamespace:
+        message = SimpleNamespace(id=next(self._ids), chat=SimpleNamespace(id=chat_id), text=text,
+                                  reply_markup=reply_markup, media=None, media_group_id=None,
+                                  video=None, audio=None, document=None)
+        self.messages[(chat_id, message.id)] = message
+        return message
+
+    def _media_message(self, chat_id: int, media_type: enums.MessageMediaType, file_id: str,
+                       file_size: int) -> SimpleNamespace:
+        message = self._new_message(chat_id)
+        message.media = media_type
+        setattr(message, media_type.value, SimpleNamespace(file_id=file_id, file_size=file_size))
+        return message
+
+    def _changed(self, message: SimpleNamespace):
+        for predicate, future in self._watchers.get((message.chat.id, message.id), ()):
+            if not future.done() and predicate(message.text):
+                future.set_result(message.text)
@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import secrets
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sessions import FormatRow
+from storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Hash in the storage backend holding the specs of unfinished jobs
+PENDING_JOBS = "jobs:pending"
+
+# Name of the marker file that asks a running yt-dlp download to stop.
+# A file works across both thread and process executor pools.
+CANCEL_MARKER = ".cancel"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobSpec:
+    """Everything needed to run a download, independent of the update that asked for it
+
+    Specs are plain data, so they can be persisted and picked up again
+    after a restart or by another process.
+    """
+
+    __slots__ = ('job_id', 'user_id', 'chat_id', 'message_id', 'url', 'video_key', 'title', 'duration',
+                 'format', 'playlist', 'urls', 'created_at')
+
+    def __init__(self, user_id: int, chat_id: int, message_id: Optional[int], url: str, video_key: str, title: str,
+                 format: FormatRow, duration: int = 0, playlist: bool = False, urls: Optional[List[str]] = None,
+                 job_id: Optional[str] = None, created_at: Optional[float] = None):
+        self.job_id = job_id or secrets.token_hex(6)
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.url = url
+        self.video_key = video_key
+        self.title = title
+        self.duration = duration
+        self.format = format
+        # For a playlist, url is the playlist and format a preset from
+        # bot.PLAYLIST_PRESETS applied to every entry; a batch of links is
+        # a playlist whose entries are listed in urls
+        self.playlist = playlist
+        self.urls = urls
+        self.created_at = time.time() if created_at is None else created_at
+
+    def to_json(self) -> str:
+        fields: Dict[str, Any] = {name: getattr(self, name) for name in self.__slots__}
+        fields['format'] = self.format.to_dict()
+        return json.dumps(fields)
+
+    @classmethod
+    def from_json(cls, data: str) -> "JobSpec":
+        fields = json.loads(data)
+        fields['format'] = FormatRow(**fields['format'])
+        return cls(**fields)
+
+
+class Job:
+    """A single queued or running download
+
+    Work shared by several jobs runs under a Job of its own that is never
+    submitted to a scheduler; such a job has no func.
+    """
+
+    def __init__(self, user_id: int, func: Optional[Callable[["Job"], Awaitable[None]]],
+                 on_position: Optional[Callable[[int], Awaitable[None]]] = None,
+                 spec: Optional[JobSpec] = None):
+        self.job_id = spec.job_id if spec else secrets.token_hex(6)
+        self.user_id = user_id
+        self.func = func
+        self.on_position = on_position
+        self.spec = spec
+        self.state = QUEUED
+        self.position = 0
+        self.work_dir: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self._finished = asyncio.Event()
+
+    @property
+    def cancel_path(self) -> Optional[str]:
+        """Marker file checked by the yt-dlp progress hook"""
+        if not self.work_dir:
+            return None
+        return os.path.join(self.work_dir, CANCEL_MARKER)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    async def wait(self):
+        """Wait until the job has finished, whether it ran or not"""
+        await self._finished.wait()
+
+    def request_cancel(self):
+        """Ask an in-flight download to stop at its next progress update"""
+        if self.cancel_path and os.path.isdir(self.work_dir):
+            with open(self.cancel_path, "w"):
+                pass
+
+
+class JobScheduler:
+    """FIFO download queue with a global and a per-user concurrency cap
+
+    Jobs wait in submission order. A job starts as soon as a global slot is
+    free and its user is below the per-user cap, so one user with many
+    queued jobs cannot hold back everybody else.
+
+    With a storage backend, the spec of every unfinished job is kept there
+    until the job ends, so pending_specs() can resubmit them after a restart.
+    """
+
+    def __init__(self, max_concurrent: int = 3, max_per_user: int = 1, backend: Optional[StorageBackend] = None):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_user = max(1, max_per_user)
+        self.backend = backend
+        self._closing = False
+        self._jobs: Dict[str, Job] = {}
+        self._waiting: List[Job] = []
+        self._running: List[Job] = []
+        self._notify_tasks = set()
+
+    @property
+    def running_count(self) -> int:
+        return len(self._running)
+
+    @property
+    def queued_count(self) -> int:
+        return len(self._waiting)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def unfinished_specs(self) -> List[JobSpec]:
+        """Specs of the jobs queued or running in this process, oldest first"""
+        specs = [job.spec for job in self._running + self._waiting if job.spec]
+        return sorted(specs, key=lambda spec: spec.created_at)
+
+    def pending_specs(self) -> List[JobSpec]:
+        """Specs of jobs that were unfinished when the backend was last written"""
+        if not self.backend:
+            return []
+        specs = [JobSpec.from_json(data) for data in self.backend.hgetall(PENDING_JOBS).values()]
+        return sorted(specs, key=lambda spec: spec.created_at)
+
+    def submit(self, user_id: int, func: Callable[[Job], Awaitable[None]],
+               on_position: Optional[Callable[[int], Awaitable[None]]] = None,
+               spec: Optional[JobSpec] = None) -> Job:
+        """Queue a job; it starts immediately if a slot is free"""
+        job = Job(user_id, func, on_position, spec)
+        self._jobs[job.job_id] = job
+        if spec and self.backend:
+            self.backend.hset(PENDING_JOBS, job.job_id, spec.to_json())
+        self._waiting.append(job)
+        self._pump()
+        return job
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job and wait until it has stopped"""
+        job = self._jobs.get(job_id)
+        if not job or job.finished:
+            return False
+
+        if job.state == QUEUED:
+            self._waiting.remove(job)
+            job.state = CANCELLED
+            self._forget(job)
+            self._pump()
+            return True
+
+        job.request_cancel()
+        job.task.cancel()
+        await asyncio.wait([job.task])
+        return True
+
+    async def shutdown(self):
+        """Stop all running and queued jobs but keep their specs for the next start"""
+        self._closing = True
+        for job in self._waiting:
+            job.state = CANCELLED
+            self._forget(job)
+        self._waiting.clear()
+        tasks = [job.task for job in self._running]
+        for job in self._running:
+            job.request_cancel()
+            job.task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def _user_running(self, user_id: int) -> int:
+        return sum(1 for job in self._running if job.user_id == user_id)
+
+    def _pump(self):
+        """Start every waiting job that fits and refresh queue positions"""
+        if self._closing:
+            return
+
+        for job in list(self._waiting):
+            if len(self._running) >= self.max_concurrent:
+                break
+            if self._user_running(job.user_id) >= self.max_per_user:
+                continue
+            self._waiting.remove(job)
+            self._running.append(job)
+            job.state = RUNNING
+            job.position = 0
+            job.task = asyncio.ensure_future(self._run(job))
+
+        for position, job in enumerate(self._waiting, start=1):
+            if job.position != position:
+                job.position = position
+                if job.on_position:
+                    self._notify(job.on_position(position))
+
+    def _notify(self, coro: Awaitable[None]):
+        task = asyncio.ensure_future(coro)
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_done)
+
+    def _notify_done(self, task: asyncio.Task):
+        self._notify_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Error updating queue position: {task.exception()}")
+
+    async def _run(self, job: Job):
+        try:
+            await job.func(job)
+            job.state = DONE
+        except asyncio.CancelledError:
+            job.state = CANCELLED
+        except Exception as e:
+            job.state = FAILED
+            logger.error(f"Job {job.job_id} failed: {e}")
+        finally:
+            self._running.remove(job)
+            self._forget(job)
+            self._pump()
+
+    def _forget(self, job: Job):
+        job._finished.set()
+        self._jobs.pop(job.job_id, None)
+        if job.spec and self.backend and not self._closing:
+            self.backend.hdel(PENDING_JOBS, job.job_id)
+
+
+class JobQueue:
+    """Job queue shared by a frontend process and its download workers
+
+    The frontend pushes extraction and download requests; worker processes
+    pop them. Each kind has its own queue, so a worker can take extractions
+    while its download slots are full. Cancellation requests and job status
+    travel through the same storage backend, since the frontend never holds
+    the running job itself.
+    """
+
+    EXTRACT = "extract"
+    DOWNLOAD = "download"
+    # Popped in this order when a worker has room for both kinds
+    QUEUES = {EXTRACT: "queue:extract", DOWNLOAD: "queue:download"}
+
+    def __init__(self, backend: StorageBackend, ttl: float = 86400):
+        self.backend = backend
+        self.ttl = ttl
+
+    def __len__(self) -> int:
+        return sum(self.length(kind) for kind in self.QUEUES)
+
+    def length(self, kind: str) -> int:
+        return self.backend.length(self.QUEUES[kind])
+
+    def enqueue_extract(self, user_id: int, chat_id: int, message_id: int, url: str) -> int:
+        """Queue a URL for extraction; returns the queue position"""
+        self.backend.push(self.QUEUES[self.EXTRACT], json.dumps({
+            'kind': self.EXTRACT,
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'url': url,
+        }))
+        return self.length(self.EXTRACT)
+
+    def enqueue_download(self, spec: JobSpec) -> int:
+        """Queue a download; returns the queue position"""
+        self.backend.set(f"job:{spec.job_id}", spec.to_json(), ttl=self.ttl)
+        self.set_status(spec.job_id, QUEUED)
+        self.backend.push(self.QUEUES[self.DOWNLOAD], json.dumps({'kind': self.DOWNLOAD, 'spec': spec.to_json()}))
+        return self.length(self.DOWNLOAD)
+
+    def pop(self, timeout: float = 1.0, kinds: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Take the oldest request of the given kinds (default all), waiting up to timeout seconds (blocking)"""
+        queues = [queue for kind, queue in self.QUEUES.items() if kinds is None or kind in kinds]
+        popped = self.backend.pop_any(queues, timeout=timeout)
+        if popped is None:
+            return None
+        item = json.loads(popped[1])
+        if item['kind'] == self.DOWNLOAD:
+            item['spec'] = JobSpec.from_json(item['spec'])
+        return item
+
+    def get_spec(self, job_id: str) -> Optional[JobSpec]:
+        data = self.backend.get(f"job:{job_id}")
+        return JobSpec.from_json(data) if data else None
+
+    def request_cancel(self, job_id: str):
+        self.backend.set(f"cancel:{job_id}", "1", ttl=self.ttl)
+
+    def cancel_requested(self, job_id: str) -> bool:
+        return self.backend.get(f"cancel:{job_id}") is not None
+
+    def set_status(self, job_id: str, status: str):
+        """Report a job's state back to the frontend"""
+        self.backend.set(f"status:{job_id}", status, ttl=self.ttl)
+
+    def get_status(self, job_id: str) -> Optional[str]:
+        return self.backend.get(f"status:{job_id}")
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Load test for the Telegram Video Downloader Bot
+
+Simulates many users at once against the real handlers, with Telegram,
+yt-dlp and the media hosts replaced by the stand-ins in fakes.py. Each
+user loops until the run ends: think, send a link (a popular one or a
+new one), think, then pick a format, dismiss the keyboard, walk away
+from it, or start a download and stop it halfway.
+
+The run reports throughput, tail latency, event loop lag and how the
+memory held by user_states grows, sampled over the whole run:
+
+    python loadtest.py --users 2000 --duration 600 --think 5 --compare
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import tempfile
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from benchmark import compare, configure_environment, git_revision, peak_rss_mb, save_result, summarize
+from fakes import FakeClient, FakeExtractor, MediaServer, fake_url
+from metrics import LoopLag, RecentSamples
+
+# Results are appended here unless --results says otherwise
+RESULTS_FILE = "benchmarks.jsonl"
+
+# Figures compared between runs, see benchmark.compare
+COMPARED = ("jobs_per_second", "updates_per_second", "url_p99", "callback_p99", "job_p99", "loop_lag_p99",
+            "sessions_peak", "sessions_bytes_peak", "rss_growth_mb")
+
+# Options that describe the environment rather than the workload
+NOT_PARAMS = ("results", "compare", "json", "verbose", "trace", "sample_interval")
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process now; the peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def deep_size(obj: Any, seen: Optional[set] = None) -> int:
+    """Bytes held by obj and everything it references, each object counted once"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    else:
+        for name in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, name):
+                size += deep_size(getattr(obj, name), seen)
+        if hasattr(obj, '__dict__'):
+            size += deep_size(vars(obj), seen)
+    return size
+
+
+def is_finished(text: str) -> bool:
+    """Whether a job's message shows its final state"""
+    return "completed successfully" in text or text.startswith("❌")
+
+
+def has_job(text: str) -> bool:
+    """Whether a job's message shows it queued, running or done"""
+    return is_finished(text) or "Queued" in text or "Downloading" in text or "Waiting for the same" in text
+
+
+class LoadTest:
+    """Simulated users feeding updates to the bot's handlers"""
+
+    def __init__(self, bot, client: FakeClient, args: argparse.Namespace):
+        self.bot = bot
+        self.client = client
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.popular = [fake_url(index, f"popular/{args.seed}") for index in range(args.popular)]
+        self.unique = 0
+        self.counts: Counter = Counter()
+        self.timings: Dict[str, List[float]] = {'url': [], 'callback': [], 'job': []}
+        self.deadline = 0.0
+
+    def pick_url(self) -> str:
+        """A popular link (lower ranks far more often) or one nobody sent before"""
+        if self.popular and self.rng.random() < self.args.repeat:
+            # Zipf-like: rank r is chosen with weight 1/r
+            return self.rng.choices(self.popular, weights=[1 / rank for rank in range(1, len(self.popular) + 1)])[0]
+        self.unique += 1
+        return fake_url(self.unique, f"unique/{self.args.seed}")
+
+    async def think(self):
+        await asyncio.sleep(self.rng.expovariate(1 / self.args.think) if self.args.think else 0)
+
+    async def timed(self, name: str, handler, update) -> float:
+        started = time.monotonic()
+        await handler(self.client, update)
+        elapsed = time.monotonic() - started
+        self.timings[name].append(elapsed)
+        self.counts['updates'] += 1
+        return started
+
+    async def press(self, user_id: int, message, prefix: str) -> Optional[float]:
+        """Press the first button on message whose data starts with prefix; returns when"""
+        data = next((data for data in self.client.buttons(user_id, message.id) if data.startswith(prefix)), None)
+        if data is None:
+            return None
+        return await self.timed('callback', self.bot.handle_callback, self.client.callback_query(user_id, message, data))
+
+    async def user(self, user_id: int):
+        while time.monotonic() < self.deadline:
+            await self.think()
+            if time.monotonic() >= self.deadline:
+                return
+            try:
+                await self.session(user_id)
+            except Exception as e:
+                self.counts['errors'] += 1
+                logging.getLogger(__name__).exception(f"Simulated user {user_id} failed: {e}")
+
+    async def session(self, user_id: int):
+        """One link from sending it until its download ends or is given up"""
+        client = self.client
+        message = client.text_message(user_id, self.pick_url())
+        await self.timed('url', self.bot.handle_url, message)
+        self.counts['links'] += 1
+        client.messages.pop((user_id, message.id), None)
+        if not message.replies:
+            self.counts['no_reply'] += 1
+            return
+        keyboard = message.replies[0]
+        try:
+            await self.think()
+            choice = self.rng.random()
+            if choice < self.args.dismiss:
+                await self.press(user_id, keyboard, "cancel_")
+                self.counts['dismissed'] += 1
+                return
+            if choice < self.args.dismiss + self.args.abandon:
+                # The session stays in user_states until it expires or is evicted
+                self.counts['abandoned'] += 1
+                return
+
+            pressed = await self.press(user_id, keyboard, "download_")
+            if pressed is None:
+                self.counts['no_keyboard'] += 1
+                return
+            self.counts['downloads'] += 1
+            stop = self.rng.random() < self.args.stop
+            try:
+                if stop:
+                    await client.wait_for(user_id, keyboard.id, has_job, self.args.timeout)
+                    await asyncio.sleep(self.rng.uniform(0, self.args.think))
+                    if await self.press(user_id, keyboard, "stop_") is not None:
+                        self.counts['stopped'] += 1
+                text = await client.wait_for(user_id, keyboard.id, is_finished, self.args.timeout)
+            except asyncio.TimeoutError:
+                self.counts['timeouts'] += 1
+                return
+            if text.startswith("❌"):
+                self.counts['cancelled' if "cancelled" in text else 'failed'] += 1
+            else:
+                self.counts['completed'] += 1
+                self.timings['job'].append(time.monotonic() - pressed)
+        finally:
+            client.messages.pop((user_id, keyboard.id), None)
+
+
+async def sample(bot, client: FakeClient, interval: float, timeline: List[Dict[str, Any]], started: float):
+    """Record load, memory and the size of user_states every interval seconds"""
+    while True:
+        timeline.append({
+            't': round(time.monotonic() - started, 1),
+            'sessions': len(bot.user_states),
+            'sessions_bytes': deep_size(bot.user_states),
+            'rss_mb': current_rss_mb(),
+            'running': bot.scheduler.running_count,
+            'queued': bot.scheduler.queued_count,
+            'loop_lag': round(bot.loop_lag.last, 4),
+            'fake_messages': len(client.messages),
+        })
+        await asyncio.sleep(interval)
+
+
+async def run_loadtest(args: argparse.Namespace) -> Dict[str, Any]:
+    import bot
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    # As after connecting, so the first job does not pay for importing yt-dlp
+    await bot.warm_up_ytdl()
+
+    server = MediaServer(args.size_kb * 1024, latency=args.server_latency, bandwidth=args.bandwidth_kb * 1024)
+    bot.ytdl.extract_info = FakeExtractor(server.start(), server.size, latency=args.extract_latency)
+    client = FakeClient(api_latency=args.api_latency, upload_bandwidth=args.upload_kb * 1024)
+    test = LoadTest(bot, client, args)
+
+    # Keep every lag sample of the run for its tail, not just the last few minutes
+    bot.loop_lag = LoopLag(interval=0.05)
+    bot.loop_lag.recent = RecentSamples(size=1_000_000, max_age=float("inf"))
+    bot.loop_lag.start()
+
+    timeline: List[Dict[str, Any]] = []
+    started = time.monotonic()
+    test.deadline = started + args.duration
+    sampler = asyncio.ensure_future(sample(bot, client, args.sample_interval, timeline, started))
+    try:
+        await asyncio.gather(*(test.user(100000 + index) for index in range(args.users)))
+        elapsed = time.monotonic() - started
+    finally:
+        sampler.cancel()
+        await bot.loop_lag.stop()
+        await bot.scheduler.shutdown()
+        await bot.outbound.close()
+        if bot.http_session:
+            await bot.http_session.close()
+        bot.tracer.close()
+        bot.spool.close()
+        bot.pools.shutdown(wait=False)
+        server.stop()
+
+    timeline.append(dict(timeline[-1], t=round(elapsed, 1), sessions=len(bot.user_states),
+                         sessions_bytes=deep_size(bot.user_states), rss_mb=current_rss_mb()))
+    results = dict(
+        users=args.users,
+        elapsed=round(elapsed, 1),
+        **{name: test.counts[name] for name in ('links', 'downloads', 'completed', 'failed', 'cancelled', 'stopped',
+                                                'dismissed', 'abandoned', 'timeouts', 'no_reply', 'no_keyboard', 'errors')},
+        jobs_per_second=round(test.counts['completed'] / elapsed, 3),
+        updates_per_second=round(test.counts['updates'] / elapsed, 3),
+        extractions=bot.ytdl.extract_info.calls,
+        sessions_peak=max(point['sessions'] for point in timeline),
+        sessions_end=timeline[-1]['sessions'],
+        sessions_bytes_peak=max(point['sessions_bytes'] for point in timeline),
+        sessions_bytes_end=timeline[-1]['sessions_bytes'],
+        session_evictions=bot.user_states.evictions,
+        session_expirations=bot.user_states.expirations,
+        rss_start_mb=timeline[0]['rss_mb'],
+        rss_end_mb=timeline[-1]['rss_mb'],
+        rss_growth_mb=round(timeline[-1]['rss_mb'] - timeline[0]['rss_mb'], 1),
+        peak_rss_mb=peak_rss_mb(),
+    )
+    for name, values in test.timings.items():
+        for figure, value in summarize(values).items():
+            results[f"{name}_{figure}"] = value
+    for figure, percent in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100)):
+        lag = bot.loop_lag.recent.percentile(percent)
+        results[f"loop_lag_{figure}"] = None if lag is None else round(lag, 4)
+    results['timeline'] = timeline
+    return results
+
+
+def print_results(results: Dict[str, Any]):
+    print(f"Users:       {results['users']} for {results['elapsed']}s, {results['links']} links, "
+          f"{results['updates_per_second']} updates/s")
+    print(f"Downloads:   {results['completed']}/{results['downloads']} completed ({results['jobs_per_second']} jobs/s), "
+          f"{results['stopped']} stopped ({results['cancelled']} in time), {results['failed']} failed, {results['timeouts']} timed out, "
+          f"{results['errors']} errors")
+    print(f"Keyboards:   {results['dismissed']} dismissed, {results['abandoned']} abandoned")
+    for name in ("url", "callback", "job", "loop_lag"):
+        figures = " · ".join(f"{figure} {results[f'{name}_{figure}']}s" for figure in ("p50", "p95", "p99", "max"))
+        print(f"{name + ':':<12} {figures}")
+    print(f"user_states: peak {results['sessions_peak']} sessions / {results['sessions_bytes_peak'] / 1024:.0f} KB, "
+          f"end {results['sessions_end']} / {results['sessions_bytes_end'] / 1024:.0f} KB "
+          f"({results['session_evictions']} evicted, {results['session_expirations']} expired)")
+    print(f"Memory:      RSS {results['rss_start_mb']} -> {results['rss_end_mb']} MB, peak {results['peak_rss_mb']} MB")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test the bot's handlers with simulated users")
+    parser.add_argument("--users", type=int, default=200, help="simulated users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds users keep sending links")
+    parser.add_argument("--think", type=float, default=2.0, help="mean seconds between a user's actions")
+    parser.add_argument("--repeat", type=float, default=0.5, help="share of links taken from the popular ones")
+    parser.add_argument("--popular", type=int, default=20, help="number of popular links")
+    parser.add_argument("--dismiss", type=float, default=0.1, help="share of keyboards dismissed with Cancel")
+    parser.add_argument("--abandon", type=float, default=0.1, help="share of keyboards never answered")
+    parser.add_argument("--stop", type=float, default=0.1, help="share of downloads stopped halfway")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds a user waits for a download")
+    parser.add_argument("--slots", type=int, default=3, help="MAX_CONCURRENT_DOWNLOADS")
+    parser.add_argument("--max-sessions", type=int, default=1000, help="MAX_SESSIONS")
+    parser.add_argument("--session-ttl", type=float, default=3600, help="SESSION_TTL")
+    parser.add_argument("--size-kb", type=int, default=512, help="size of every media file")
+    parser.add_argument("--server-latency", type=float, default=0.05, help="seconds before the first byte")
+    parser.add_argument("--bandwidth-kb", type=int, default=0, help="per-connection KB/s, 0 for unlimited")
+    parser.add_argument("--extract-latency", type=float, default=0.3, help="seconds per fake extraction")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="seconds per fake Telegram call")
+    parser.add_argument("--upload-kb", type=int, default=0, help="upload KB/s, 0 for unlimited")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between timeline samples")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--telegram-limits", action="store_true", help="keep the real outbound rate limits")
+    parser.add_argument("--trace", help="write per-job stage spans to this file")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSON lines file the run is appended to")
+    parser.add_argument("--compare", action="store_true", help="show the change since the last comparable run")
+    parser.add_argument("--json", action="store_true", help="print the run as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logging")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="bot-loadtest-") as work_dir:
+        configure_environment(work_dir, args.slots, args.telegram_limits, args.trace)
+        os.environ.update(MAX_SESSIONS=str(args.max_sessions), SESSION_TTL=str(args.session_ttl))
+        results = asyncio.run(run_loadtest(args))
+
+    record = dict(
+        benchmark="loadtest",
+        timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        python=sys.version.split()[0],
+        **git_revision(),
+        params={name: value for name, value in vars(args).items() if name not in NOT_PARAMS},
+        results=results,
+    )
+    previous = save_result(args.results, record)
+    if args.json:
+        print(json.dumps(record))
+    else:
+        print_results(results)
+    if args.compare:
+        print("\n".join(compare(previous, record, COMPARED)) if previous else "No earlier run with these parameters")
+
+
+if __name__ == "__main__":
+    main()
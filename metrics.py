@@ -0,0 +1,271 @@
+import time
+import bisect
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Prometheus text exposition format 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Default buckets: seconds for latencies, bytes/s for throughput
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+THROUGHPUT_BUCKETS = tuple(2 ** power * 1024 for power in range(4, 17, 2))
+
+# Minimal in-process metrics without a client library. Updating a metric is
+# a dict lookup and an addition, so it is safe on the hot path; rendering
+# happens only when the endpoint is scraped.
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def total(self) -> float:
+        """Sum over every label set"""
+        return sum(self._values.values())
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; with func it is read at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, func: Optional[Callable[[], float]] = None):
+        super().__init__(name, help)
+        self.func = func
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    def value(self) -> float:
+        if self.func:
+            try:
+                return self.func()
+            except Exception as e:
+                logger.debug(f"Reading gauge {self.name} failed: {e}")
+                return float("nan")
+        return self._value
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.value())}"]
+
+
+class Histogram(_Metric):
+    """Counts of observations per bucket, with their sum"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., count above the last bucket], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """A set of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, func: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, help, func))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labels: Sequence[str] = ()) -> Histogram:
+        return self._register(Histogram(name, help, buckets, labels))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+class RecentSamples:
+    """The latest observations within max_age, for percentiles of recent behaviour
+
+    Only the last `size` values are kept, so reading a percentile sorts a
+    few hundred numbers at most.
+    """
+
+    def __init__(self, size: int = 512, max_age: float = 3600):
+        self.max_age = max_age
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, value: float, now: Optional[float] = None):
+        self._samples.append((time.monotonic() if now is None else now, value))
+
+    def percentile(self, percent: float, now: Optional[float] = None) -> Optional[float]:
+        """Nearest-rank percentile of the recent values, None without any"""
+        cutoff = (time.monotonic() if now is None else now) - self.max_age
+        values = sorted(value for at, value in self._samples if at >= cutoff)
+        if not values:
+            return None
+        rank = max(1, -(-len(values) * percent // 100))
+        return values[int(rank) - 1]
+
+
+class RollingSum:
+    """Sum of the values added during the last `window` seconds
+
+    The window is kept as `slots` fixed buckets, so adding and reading are
+    O(1) and O(slots); the sum is exact to within one bucket.
+    """
+
+    def __init__(self, window: float = 3600, slots: int = 60):
+        self.slot_length = window / slots
+        self._sums = [0.0] * slots
+        self._epochs = [-1] * slots
+
+    def add(self, value: float, now: Optional[float] = None):
+        epoch = int((time.monotonic() if now is None else now) // self.slot_length)
+        index = epoch % len(self._sums)
+        if self._epochs[index] != epoch:
+            self._epochs[index] = epoch
+            self._sums[index] = 0.0
+        self._sums[index] += value
+
+    def total(self, now: Optional[float] = None) -> float:
+        epoch = int((time.monotonic() if now is None else now) // self.slot_length)
+        oldest = epoch - len(self._sums) + 1
+        return sum(value for value, at in zip(self._sums, self._epochs) if oldest <= at <= epoch)
+
+
+class LoopLag:
+    """Measures how late the event loop wakes up a sleeping task
+
+    A loop busy with blocking work wakes sleepers late; that delay is the
+    time every handler currently waits before it gets to run.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last = 0.0
+        self.recent = RecentSamples(size=240, max_age=300)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, time.monotonic() - started - self.interval)
+            self.recent.add(self.last)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
+
+
+async def serve(registry: Registry, host: str = "127.0.0.1", port: int = 9100) -> web.AppRunner:
+    """Serve registry on http://host:port/metrics; clean up the returned runner to stop"""
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics served on http://{host}:{port}/metrics")
+    return runner
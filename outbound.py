@@ -0,0 +1,248 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+from pyrogram.errors import FloodWait
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first. Callback answers time out on the user's side after a few
+# seconds and uploads carry the result, so both go ahead of cosmetic edits.
+PRIORITY_ANSWER = 0
+PRIORITY_UPLOAD = 1
+PRIORITY_SEND = 2
+PRIORITY_EDIT = 3
+
+# Idle per-chat buckets are dropped once this many chats are tracked
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Allows `rate` requests per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Request:
+    __slots__ = ('priority', 'seq', 'chat_id', 'func', 'args', 'kwargs', 'key', 'future', 'task', 'attempts')
+
+    def __init__(self, priority: int, seq: int, chat_id: Optional[int], func: Callable[..., Awaitable[Any]],
+                 args: tuple, kwargs: dict, key: Optional[Hashable]):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.task: Optional[asyncio.Task] = None
+        self.attempts = 0
+
+    def __lt__(self, other: "_Request") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundScheduler:
+    """Single gate for Bot API calls with global and per-chat rate limits
+
+    Requests wait in priority order until both the global bucket and the
+    bucket of their chat have a token. A FloodWait pauses the chat it came
+    from (or everything, for requests without a chat) for the time Telegram
+    asked for, and the request is retried instead of failing. Requests that
+    share a key, such as edits of one message, run one at a time, and a
+    newer queued request replaces an older one that has not started yet.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 max_retries: int = 3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.flood_waits = 0
+        self.superseded = 0
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._blocked_until: Dict[Optional[int], float] = {}
+        self._pending: List[_Request] = []
+        self._by_key: Dict[Hashable, _Request] = {}
+        self._busy_keys: Set[Hashable] = set()
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def queued_count(self) -> int:
+        return len(self._pending)
+
+    async def call(self, priority: int, chat_id: Optional[int], func: Callable[..., Awaitable[Any]], /,
+                   *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) once the rate limits allow it"""
+        return await self._submit(None, priority, chat_id, func, args, kwargs)
+
+    async def call_replacing(self, key: Hashable, priority: int, chat_id: Optional[int],
+                             func: Callable[..., Awaitable[Any]], /, *args, **kwargs) -> Any:
+        """Like call(), but a later request with the same key supersedes this one
+
+        A superseded request is never sent and returns None.
+        """
+        return await self._submit(key, priority, chat_id, func, args, kwargs)
+
+    async def _submit(self, key: Optional[Hashable], priority: int, chat_id: Optional[int],
+                      func: Callable[..., Awaitable[Any]], args: tuple, kwargs: dict) -> Any:
+        self._ensure_dispatcher()
+        request = _Request(priority, next(self._seq), chat_id, func, args, kwargs, key)
+        if key is not None:
+            older = self._by_key.get(key)
+            if older is not None and older in self._pending:
+                self._remove(older)
+                self.superseded += 1
+                if not older.future.done():
+                    older.future.set_result(None)
+            self._by_key[key] = request
+        heapq.heappush(self._pending, request)
+        self._wakeup.set()
+
+        try:
+            return await request.future
+        except asyncio.CancelledError:
+            if request in self._pending:
+                self._remove(request)
+            elif request.task:
+                if key is None:
+                    # Uploads and other one-off calls stop with their caller
+                    request.task.cancel()
+                # Keyed edits finish, so later edits of the message keep their order
+                await asyncio.wait([request.task])
+            raise
+        finally:
+            if key is not None and self._by_key.get(key) is request:
+                del self._by_key[key]
+
+    def _remove(self, request: _Request):
+        self._pending.remove(request)
+        heapq.heapify(self._pending)
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                self._prune(time.monotonic())
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune(self, now: float):
+        """Forget chats whose bucket has refilled; a new bucket starts full anyway"""
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            bucket._refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._chat_buckets[chat_id]
+        for chat_id, until in list(self._blocked_until.items()):
+            if until <= now:
+                del self._blocked_until[chat_id]
+
+    def _delay(self, request: _Request, now: float) -> float:
+        if request.key is not None and request.key in self._busy_keys:
+            return float("inf")
+        delay = max(self._blocked_until.get(None, 0.0), self._blocked_until.get(request.chat_id, 0.0)) - now
+        if request.chat_id is not None:
+            delay = max(delay, self._chat_bucket(request.chat_id).delay(now))
+        return max(delay, self.global_bucket.delay(now))
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            wait = None
+            for request in sorted(self._pending):
+                delay = self._delay(request, now)
+                if delay <= 0:
+                    self._start(request, now)
+                    wait = 0
+                    break
+                if delay != float("inf"):
+                    wait = delay if wait is None else min(wait, delay)
+
+            if wait == 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, request: _Request, now: float):
+        self._remove(request)
+        self.global_bucket.take(now)
+        if request.chat_id is not None:
+            self._chat_bucket(request.chat_id).take(now)
+        if request.key is not None:
+            self._busy_keys.add(request.key)
+        request.attempts += 1
+        request.task = asyncio.ensure_future(self._execute(request))
+
+    async def _execute(self, request: _Request):
+        try:
+            result = await request.func(*request.args, **request.kwargs)
+        except FloodWait as e:
+            self.flood_waits += 1
+            until = time.monotonic() + e.value
+            self._blocked_until[request.chat_id] = max(self._blocked_until.get(request.chat_id, 0.0), until)
+            logger.warning(f"FloodWait of {e.value}s for chat {request.chat_id}")
+            superseded = request.key is not None and self._by_key.get(request.key) is not request
+            if request.future.done():
+                pass
+            elif superseded:
+                request.future.set_result(None)
+            elif request.attempts <= self.max_retries:
+                heapq.heappush(self._pending, request)
+            else:
+                request.future.set_exception(e)
+        except BaseException as e:
+            if not request.future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    request.future.cancel()
+                else:
+                    request.future.set_exception(e)
+        else:
+            if not request.future.done():
+                request.future.set_result(result)
+        finally:
+            if request.key is not None:
+                self._busy_keys.discard(request.key)
+            self._wakeup.set()
+
+    async def close(self):
+        """Stop dispatching; queued requests are cancelled"""
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.wait([self._dispatcher])
+        for request in self._pending:
+            request.future.cancel()
+        self._pending.clear()
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from sessions import AUDIO_EXTS, FormatRow
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+U = TypeVar('U')
+
+# Marks the end of the work queue for a deliver worker
+_DONE = object()
+
+# Height limit of a video preset that does not set one
+DEFAULT_MAX_HEIGHT = 720
+
+# Two-stage pipeline for playlists: `prepare` (extracting an entry and
+# picking its format) runs ahead of `deliver` (download and upload), so the
+# stages of different entries overlap. Entries are pulled from the iterable
+# only when a prepare worker is free and the bounded queue between the
+# stages has room, which caps the entries in flight at
+# prepare_workers + buffer + deliver_workers however long the playlist is.
+
+
+class PipelineStats:
+    """Counts of a pipeline run, updated as entries finish"""
+
+    __slots__ = ('total', 'done', 'failed')
+
+    def __init__(self, total: Optional[int] = None):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+
+    @property
+    def finished(self) -> int:
+        return self.done + self.failed
+
+    def __repr__(self) -> str:
+        return f"PipelineStats(done={self.done}, failed={self.failed}, total={self.total})"
+
+
+async def run_pipeline(entries: Iterable[T], prepare: Callable[[T], Awaitable[Optional[U]]],
+                       deliver: Callable[[U], Awaitable[bool]], prepare_workers: int = 2,
+                       deliver_workers: int = 2, buffer: int = 2, stats: Optional[PipelineStats] = None,
+                       on_update: Optional[Callable[[PipelineStats], None]] = None) -> PipelineStats:
+    """Prepare and deliver every entry, a bounded number at a time
+
+    prepare returns None and deliver returns False for entries that failed
+    without raising; exceptions from either count as failures as well and
+    never stop the other entries. Cancelling the caller cancels every stage.
+    Pass stats to watch the counts while the pipeline runs.
+    """
+    if stats is None:
+        stats = PipelineStats()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, buffer))
+    source = iter(entries)
+
+    def finish(ok: bool):
+        if ok:
+            stats.done += 1
+        else:
+            stats.failed += 1
+        if on_update:
+            on_update(stats)
+
+    async def preparer():
+        # Workers share the iterator, so each entry is taken exactly once
+        for entry in source:
+            try:
+                item = await prepare(entry)
+            except Exception as e:
+                logger.warning(f"Preparing playlist entry failed: {e}")
+                item = None
+            if item is None:
+                finish(False)
+                continue
+            await queue.put(item)
+
+    async def deliverer():
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            try:
+                ok = await deliver(item)
+            except Exception as e:
+                logger.warning(f"Delivering playlist entry failed: {e}")
+                ok = False
+            finish(bool(ok))
+
+    preparers = [asyncio.ensure_future(preparer()) for _ in range(max(1, prepare_workers))]
+    deliverers = [asyncio.ensure_future(deliverer()) for _ in range(max(1, deliver_workers))]
+    try:
+        await asyncio.gather(*preparers)
+        for _ in deliverers:
+            await queue.put(_DONE)
+        await asyncio.gather(*deliverers)
+    except BaseException:
+        for task in preparers + deliverers:
+            task.cancel()
+        await asyncio.wait(preparers + deliverers)
+        raise
+    return stats
+
+
+def pick_entry_format(formats: List[Dict[str, Any]], preset: FormatRow, merge: bool = False) -> Optional[FormatRow]:
+    """Pick the format of a playlist entry matching a playlist preset; None if nothing matches
+
+    The audio preset takes an audio-only format, preferring containers that
+    are sent as audio. merge allows a yt-dlp selector that merges separate
+    video and audio (it needs ffmpeg).
+    """
+    rows = [(fmt, FormatRow.from_format(fmt)) for fmt in formats]
+    if preset.format_id == 'audio':
+        candidates = [(fmt, row) for fmt, row in rows if row.is_progressive and not row.height]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda pair: (pair[1].ext in AUDIO_EXTS, pair[0].get('tbr') or 0))[1]
+
+    max_height = preset.height or DEFAULT_MAX_HEIGHT
+    # Single-file formats need no merging and can be streamed
+    candidates = [(fmt, row) for fmt, row in rows if row.is_progressive and row.height]
+    fitting = [(fmt, row) for fmt, row in candidates if row.height <= max_height]
+    candidates = fitting or sorted(candidates, key=lambda pair: pair[1].height)[:1]
+    best = max(candidates, key=lambda pair: (pair[1].height, pair[0].get('tbr') or 0))[1] if candidates else None
+
+    # Sites like YouTube offer only low qualities as single files; yt-dlp
+    # can merge separate video and audio up to the preset height instead
+    merged_heights = [row.height for fmt, row in rows
+                      if row.height and row.height <= max_height and not row.is_progressive and row.vcodec != 'none']
+    if merge and merged_heights and (not fitting or max(merged_heights) > best.height):
+        return FormatRow(
+            format_id=f"bv*[height<={max_height}][ext=mp4]+ba[ext=m4a]/bv*[height<={max_height}]+ba/b[height<={max_height}]",
+            ext='mp4',
+            height=max(merged_heights),
+        )
+    return best
@@ -0,0 +1,105 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from pyrogram.errors import FloodWait, MessageNotModified
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD = "download"
+UPLOAD = "upload"
+STREAM = "stream"
+PLAYLIST = "playlist"
+
+
+class Progress(NamedTuple):
+    phase: str
+    done: int
+    total: Optional[int] = None
+    speed: Optional[float] = None
+    eta: Optional[float] = None
+
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.total:
+            return None
+        return min(100.0, self.done * 100 / self.total)
+
+
+def progress_bar(percent: float, width: int = 10) -> str:
+    filled = int(round(percent / 100 * width))
+    return "█" * filled + "░" * (width - filled)
+
+
+class ProgressReporter:
+    """Coalesced, rate-limited progress edits of one message
+
+    report() is cheap and never waits: it only records the latest state and
+    makes sure a flush is scheduled. The flush edits the message at most
+    once per min_interval, always with the newest state, and skips edits
+    that would not change the text. A FloodWait pushes the next edit back
+    by the time Telegram asked for instead of failing the download.
+    """
+
+    def __init__(self, edit: Callable[[str], Awaitable[None]], render: Callable[[Progress], str],
+                 min_interval: float = 3.0):
+        self.edit = edit
+        self.render = render
+        self.min_interval = min_interval
+        self.edits = 0
+        self._pending: Optional[Progress] = None
+        self._last_text: Optional[str] = None
+        self._next_edit = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._phase_start = {}
+        self._closed = False
+
+    def report(self, progress: Progress):
+        """Record the latest progress (must be called on the event loop)"""
+        if self._closed:
+            return
+        self._pending = progress
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush())
+
+    def callback(self, phase: str) -> Callable[[int, int], Awaitable[None]]:
+        """Build a Pyrogram-style progress(current, total) callback for a phase"""
+        async def progress(current: int, total: int, *args):
+            start = self._phase_start.setdefault(phase, (time.monotonic(), current))
+            elapsed = time.monotonic() - start[0]
+            speed = (current - start[1]) / elapsed if elapsed > 0 else None
+            eta = (total - current) / speed if speed and total else None
+            self.report(Progress(phase, current, total, speed, eta))
+        return progress
+
+    async def _flush(self):
+        while self._pending is not None and not self._closed:
+            delay = self._next_edit - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            progress, self._pending = self._pending, None
+            if progress is None or self._closed:
+                return
+
+            text = self.render(progress)
+            self._next_edit = time.monotonic() + self.min_interval
+            if text == self._last_text:
+                continue
+            try:
+                await self.edit(text)
+                self._last_text = text
+                self.edits += 1
+            except FloodWait as e:
+                self._next_edit = time.monotonic() + e.value
+            except MessageNotModified:
+                self._last_text = text
+            except Exception as e:
+                logger.debug(f"Progress edit failed: {e}")
+
+    async def close(self):
+        """Stop reporting so no late progress edit overwrites the final message"""
+        self._closed = True
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.wait([self._task])
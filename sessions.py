@@ -0,0 +1,190 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from storage import StorageBackend
+
+# Key prefix of sessions kept in a shared storage backend
+SESSION_PREFIX = "session:"
+
+# Containers Telegram plays as audio; other formats are sent as video
+AUDIO_EXTS = ('mp3', 'm4a', 'opus', 'ogg', 'wav')
+
+
+class FormatRow:
+    """The few fields of a yt-dlp format that the keyboard and download need"""
+
+    __slots__ = ('format_id', 'ext', 'height', 'width', 'filesize', 'filesize_approx', 'vcodec', 'acodec', 'url',
+                 'protocol', 'http_headers')
+
+    def __init__(self, format_id: str, ext: str, height: Optional[int] = None, filesize: Optional[int] = None,
+                 vcodec: Optional[str] = None, acodec: Optional[str] = None, width: Optional[int] = None,
+                 url: Optional[str] = None, protocol: Optional[str] = None,
+                 http_headers: Optional[Dict[str, str]] = None, filesize_approx: Optional[int] = None):
+        self.format_id = format_id
+        self.ext = ext
+        self.height = height
+        self.width = width
+        self.filesize = filesize
+        self.filesize_approx = filesize_approx
+        self.vcodec = vcodec
+        self.acodec = acodec
+        self.url = url
+        self.protocol = protocol
+        self.http_headers = http_headers
+
+    @classmethod
+    def from_format(cls, fmt: Dict[str, Any]) -> "FormatRow":
+        row = cls(
+            format_id=fmt.get('format_id', ''),
+            ext=fmt.get('ext', ''),
+            height=fmt.get('height'),
+            width=fmt.get('width'),
+            filesize=fmt.get('filesize'),
+            filesize_approx=fmt.get('filesize_approx'),
+            vcodec=fmt.get('vcodec'),
+            acodec=fmt.get('acodec'),
+        )
+        # The direct URL is only worth keeping when it can be streamed
+        if row.is_progressive and fmt.get('protocol') in ('http', 'https'):
+            row.url = fmt.get('url')
+            row.protocol = fmt.get('protocol')
+            row.http_headers = fmt.get('http_headers')
+        return row
+
+    @property
+    def is_progressive(self) -> bool:
+        """Single file holding every stream the user asked for (no merging needed)"""
+        has_audio = bool(self.acodec) and self.acodec != 'none'
+        has_video = bool(self.vcodec) and self.vcodec != 'none'
+        return has_audio and (has_video or not self.height)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"FormatRow({self.format_id!r}, {self.ext!r}, height={self.height!r})"
+
+
+class Session:
+    """A user's pending format choice for one video"""
+
+    __slots__ = ('url', 'video_key', 'title', 'duration', 'formats', 'user_id', 'message_id', 'playlist',
+                 'urls', 'created_at', 'expires_at')
+
+    def __init__(self, url: str, video_key: str, title: str, duration: int, formats: Iterable[FormatRow],
+                 user_id: int, message_id: int, playlist: bool = False, urls: Optional[List[str]] = None,
+                 created_at: Optional[float] = None):
+        self.url = url
+        self.video_key = video_key
+        self.title = title
+        self.duration = duration
+        self.formats: Tuple[FormatRow, ...] = tuple(formats)
+        self.user_id = user_id
+        self.message_id = message_id
+        self.playlist = playlist
+        self.urls = urls
+        self.created_at = time.time() if created_at is None else created_at
+        self.expires_at = 0.0
+
+    def find_format(self, format_id: str) -> Optional[FormatRow]:
+        for fmt in self.formats:
+            if fmt.format_id == format_id:
+                return fmt
+        return None
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'url': self.url,
+            'video_key': self.video_key,
+            'title': self.title,
+            'duration': self.duration,
+            'formats': [fmt.to_dict() for fmt in self.formats],
+            'user_id': self.user_id,
+            'message_id': self.message_id,
+            'playlist': self.playlist,
+            'urls': self.urls,
+            'created_at': self.created_at,
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> "Session":
+        fields = json.loads(data)
+        fields['formats'] = [FormatRow(**fmt) for fmt in fields['formats']]
+        return cls(**fields)
+
+
+class SessionStore:
+    """Sessions with TTL expiry and LRU eviction beyond max_entries
+
+    With a storage backend, sessions are written through to it as well, so
+    they survive restarts and are visible to every process sharing it. The
+    in-memory LRU then acts as a local cache in front of the backend.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600, backend: Optional[StorageBackend] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """Return a live session and mark it as recently used"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return self._load(session_id)
+        if session.expires_at <= time.monotonic():
+            del self._sessions[session_id]
+            self.expirations += 1
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        if not self.backend:
+            return None
+        data = self.backend.get(SESSION_PREFIX + session_id)
+        if not data:
+            return None
+        session = Session.from_json(data)
+        self._remember(session_id, session)
+        return session
+
+    def put(self, session_id: str, session: Session):
+        if self.backend:
+            self.backend.set(SESSION_PREFIX + session_id, session.to_json(), ttl=self.ttl)
+        self._remember(session_id, session)
+
+    def _remember(self, session_id: str, session: Session):
+        age = max(0.0, time.time() - session.created_at)
+        session.expires_at = time.monotonic() + self.ttl - age
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        self.purge_expired()
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, session_id: str) -> Optional[Session]:
+        if self.backend:
+            self.backend.delete(SESSION_PREFIX + session_id)
+        return self._sessions.pop(session_id, None)
+
+    def purge_expired(self):
+        """Drop expired sessions from the least recently used end"""
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.expires_at > now:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
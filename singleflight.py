@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one
+
+    The first caller for a key starts func() as its own task; everybody
+    who asks for the same key while it runs awaits that task instead of
+    starting another. The task is cancelled only when every caller waiting
+    on it has been cancelled, so one impatient user cannot take the
+    result away from the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.started = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the result of func(), or of the identical call already running"""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            call.task.add_done_callback(lambda task: self._done(key, call))
+            self._calls[key] = call
+            self.started += 1
+        else:
+            self.shared += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                # Callers arriving from now on start a new call instead of joining this one
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                call.task.cancel()
+                await asyncio.wait([call.task])
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _done(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Nobody may be left to look at the outcome; keep asyncio from warning
+        if not call.task.cancelled() and call.task.exception():
+            logger.debug(f"Single-flight call {key!r} failed: {call.task.exception()}")
+
+
+class Recipients:
+    """Callers waiting for one shared call, in the order they arrived
+
+    Work that is done for one of them, like sending the result to their
+    chat, is done for the first caller still waiting. serve() starts that
+    work over for the next caller when the first one leaves before it is
+    finished.
+    """
+
+    def __init__(self, items: Optional[List[Any]] = None):
+        self._items: List[Any] = list(items or [])
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def first(self) -> Any:
+        return self._items[0] if self._items else None
+
+    def add(self, item: Any):
+        self._items.append(item)
+
+    def discard(self, item: Any):
+        for index, waiting in enumerate(self._items):
+            if waiting is item:
+                del self._items[index]
+                if index == 0:
+                    self._changed.set()
+                return
+
+    async def serve(self, func: Callable[[Any], Awaitable[Any]]) -> Any:
+        """Return func(first); re-run for the next caller whenever the first one leaves early"""
+        while self._items:
+            item = self._items[0]
+            self._changed.clear()
+            task = asyncio.ensure_future(func(item))
+            left = asyncio.ensure_future(self._changed.wait())
+            try:
+                await asyncio.wait([task, left], return_when=asyncio.FIRST_COMPLETED)
+                if task.done():
+                    return task.result()
+            finally:
+                left.cancel()
+                if not task.done():
+                    task.cancel()
+                    await asyncio.wait([task])
+            logger.debug(f"Recipient left; handing over to the next of {len(self._items)}")
+        raise asyncio.CancelledError()
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Only plain HTTP formats can be sized with HEAD; for HLS/DASH it would
+# return the size of the manifest, not of the media
+HEAD_PROTOCOLS = ('http', 'https')
+
+# Probe stage between format extraction and the keyboard. Sizes yt-dlp
+# already estimated (filesize_approx, or bitrate × duration) are used as
+# they are; the remaining formats are sized with concurrent HEAD requests
+# under one overall deadline, so the probe adds a bounded delay at most.
+
+
+def estimate_size(fmt: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    """Approximate size from yt-dlp's estimate or the average bitrate"""
+    if fmt.get('filesize_approx'):
+        return int(fmt['filesize_approx'])
+    if fmt.get('tbr') and duration:
+        # tbr is in kbit/s
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+
+async def head_size(http: aiohttp.ClientSession, url: str, headers: Optional[Dict[str, str]] = None) -> Optional[int]:
+    """Content-Length of url according to a HEAD request"""
+    async with http.head(url, headers=headers, allow_redirects=True) as response:
+        if response.status != 200:
+            return None
+        return response.content_length or None
+
+
+async def fill_sizes(http: aiohttp.ClientSession, formats: List[Dict[str, Any]], duration: Optional[float],
+                     deadline: float = 1.5) -> int:
+    """Fill in missing sizes of formats in place; returns how many got one
+
+    Exact sizes from HEAD go into 'filesize', estimates into
+    'filesize_approx'. HEAD requests still running at the deadline are
+    abandoned and their formats keep an unknown size.
+    """
+    filled = 0
+    probes: Dict[asyncio.Task, Dict[str, Any]] = {}
+    for fmt in formats:
+        if fmt.get('filesize'):
+            continue
+        estimate = estimate_size(fmt, duration)
+        if estimate:
+            fmt['filesize_approx'] = estimate
+            filled += 1
+        elif fmt.get('url') and fmt.get('protocol') in HEAD_PROTOCOLS:
+            probes[asyncio.ensure_future(head_size(http, fmt['url'], fmt.get('http_headers')))] = fmt
+
+    if not probes:
+        return filled
+
+    done, pending = await asyncio.wait(probes, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        if task.exception():
+            logger.debug(f"HEAD probe failed: {task.exception()}")
+        elif task.result():
+            probes[task]['filesize'] = task.result()
+            filled += 1
+    if pending:
+        logger.info(f"Size probe deadline hit, {len(pending)} format(s) left unknown")
+    return filled
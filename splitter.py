@@ -0,0 +1,276 @@
+import os
+import csv
+import shutil
+import signal
+import asyncio
+import logging
+import mimetypes
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Union
+
+from pyrogram import Client, enums, raw, types, utils
+
+from outbound import PRIORITY_UPLOAD
+
+logger = logging.getLogger(__name__)
+
+# Largest file a bot may upload, and the most items Telegram allows in one album
+MAX_UPLOAD_SIZE = 2000 * 1024 * 1024
+MEDIA_GROUP_SIZE = 10
+
+# Segments are cut by time, so aim below the byte limit to absorb bitrate swings
+SEGMENT_SAFETY = 0.85
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Splitting stage for outputs above the upload limit. With ffmpeg, the file
+# is cut into independently playable segments by stream copy (no re-encode);
+# without it, or when a segment still comes out too large, it is cut into
+# raw byte chunks that are sent as documents. Parts are handed out as soon
+# as they are complete, so uploads overlap with the rest of the split, but
+# the next part is only cut once an upload slot is free: at most `workers`
+# parts, plus the one being cut, are on disk at any time.
+
+
+class Part(NamedTuple):
+    path: str
+    index: int
+    duration: int = 0
+
+
+class SegmentError(Exception):
+    """Stream-copy segmenting did not work for this file; fall back to byte chunks"""
+
+
+def needs_split(path: str, max_size: int = MAX_UPLOAD_SIZE) -> bool:
+    return os.path.getsize(path) > max_size
+
+
+def split_reservation(size: int, part_size: int = MAX_UPLOAD_SIZE, workers: int = 3) -> int:
+    """Disk space split_and_send needs for parts, next to the file itself"""
+    return min(size, (workers + 1) * part_size)
+
+
+def _pause(process: asyncio.subprocess.Process, paused: bool):
+    """Stop or continue a subprocess where the platform allows it"""
+    sig = getattr(signal, "SIGSTOP" if paused else "SIGCONT", None)
+    if sig is not None and process.returncode is None:
+        try:
+            process.send_signal(sig)
+        except ProcessLookupError:
+            pass
+
+
+def copy_range(source: str, target: str, offset: int, size: int):
+    """Copy size bytes starting at offset into a new file (blocking)"""
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        src.seek(offset)
+        remaining = size
+        while remaining:
+            chunk = src.read(min(COPY_BUFFER_SIZE, remaining))
+            if not chunk:
+                break
+            dst.write(chunk)
+            remaining -= len(chunk)
+
+
+async def split_bytes(path: str, output_dir: str, part_size: int) -> AsyncIterator[Part]:
+    """Cut a file into raw byte chunks of at most part_size bytes"""
+    total = os.path.getsize(path)
+    name = os.path.basename(path)
+    for index, offset in enumerate(range(0, total, part_size)):
+        target = os.path.join(output_dir, f"{name}.{index + 1:03d}")
+        await asyncio.to_thread(copy_range, path, target, offset, min(part_size, total - offset))
+        yield Part(target, index)
+
+
+async def split_segments(path: str, output_dir: str, part_size: int, duration: float,
+                         poll_interval: float = 0.5) -> AsyncIterator[Part]:
+    """Cut a media file into playable segments with ffmpeg stream copy
+
+    Every segment is yielded as soon as ffmpeg lists it as finished. ffmpeg
+    is paused while the caller holds a segment, so it does not cut ahead
+    of the uploads.
+    """
+    total = os.path.getsize(path)
+    segment_time = max(1.0, duration * part_size / total * SEGMENT_SAFETY)
+    base, ext = os.path.splitext(os.path.basename(path))
+    list_path = os.path.join(output_dir, ".segments.csv")
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", path,
+        "-map", "0", "-c", "copy", "-f", "segment", "-segment_time", f"{segment_time:.3f}",
+        "-reset_timestamps", "1", "-segment_list", list_path, "-segment_list_type", "csv",
+        os.path.join(output_dir, f"{base}.part%03d{ext}"),
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+    )
+
+    yielded = 0
+    try:
+        while True:
+            finished = process.returncode is not None
+            rows = []
+            if os.path.exists(list_path):
+                with open(list_path, newline="") as f:
+                    rows = [row for row in csv.reader(f) if row]
+            for row in rows[yielded:]:
+                segment = os.path.join(output_dir, row[0])
+                if os.path.getsize(segment) > part_size:
+                    raise SegmentError(f"{row[0]} is larger than {part_size} bytes")
+                _pause(process, True)
+                yield Part(segment, yielded, int(float(row[2]) - float(row[1])))
+                _pause(process, False)
+                yielded += 1
+            if finished:
+                break
+            try:
+                await asyncio.wait_for(process.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        if process.returncode != 0:
+            error = (await process.stderr.read()).decode(errors="replace").strip()
+            raise SegmentError(f"ffmpeg failed to split the file: {error}")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+async def upload_part(client: Client, chat_id: Union[int, str], part: Part, as_document: bool, audio: bool,
+                      width: int = 0, height: int = 0, progress: Optional[Callable] = None
+                      ) -> "raw.types.InputMediaDocument":
+    """Upload one part and return it as media that can be sent in an album"""
+    file_name = os.path.basename(part.path)
+    attributes: List[raw.base.DocumentAttribute] = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+    if as_document:
+        mime_type = "application/octet-stream"
+    elif audio:
+        mime_type = mimetypes.guess_type(file_name)[0] or "audio/mpeg"
+        attributes.append(raw.types.DocumentAttributeAudio(duration=part.duration))
+    else:
+        mime_type = mimetypes.guess_type(file_name)[0] or "video/mp4"
+        attributes.append(raw.types.DocumentAttributeVideo(
+            supports_streaming=True, duration=part.duration, w=width, h=height
+        ))
+
+    media = await client.invoke(
+        raw.functions.messages.UploadMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=raw.types.InputMediaUploadedDocument(
+                file=await client.save_file(part.path, progress=progress),
+                mime_type=mime_type,
+                attributes=attributes,
+                force_file=as_document or None,
+            )
+        )
+    )
+    return raw.types.InputMediaDocument(
+        id=raw.types.InputDocument(
+            id=media.document.id,
+            access_hash=media.document.access_hash,
+            file_reference=media.document.file_reference,
+        )
+    )
+
+
+async def send_album(client: Client, chat_id: Union[int, str], medias: List["raw.types.InputMediaDocument"],
+                     captions: List[str], parse_mode: Optional[enums.ParseMode], outbound=None
+                     ) -> List["types.Message"]:
+    """Send uploaded parts as media groups of up to ten items each"""
+    messages = []
+    for start in range(0, len(medias), MEDIA_GROUP_SIZE):
+        multi_media = []
+        for media, caption in zip(medias[start:start + MEDIA_GROUP_SIZE], captions[start:start + MEDIA_GROUP_SIZE]):
+            multi_media.append(raw.types.InputSingleMedia(
+                media=media,
+                random_id=client.rnd_id(),
+                **await utils.parse_text_entities(client, caption, parse_mode, None)
+            ))
+        rpc = raw.functions.messages.SendMultiMedia(peer=await client.resolve_peer(chat_id), multi_media=multi_media)
+        if outbound:
+            result = await outbound.call(PRIORITY_UPLOAD, chat_id, client.invoke, rpc)
+        else:
+            result = await client.invoke(rpc)
+        messages.extend(await utils.parse_messages(
+            client,
+            raw.types.messages.Messages(
+                messages=[update.message for update in result.updates
+                          if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage))],
+                users=result.users,
+                chats=result.chats,
+            )
+        ))
+    return messages
+
+
+async def split_and_send(client: Client, chat_id: Union[int, str], path: str, output_dir: str,
+                         caption: Callable[[int, int, bool], str], parse_mode: Union[str, enums.ParseMode, None] = None,
+                         audio: bool = False, duration: float = 0, width: int = 0, height: int = 0,
+                         part_size: int = MAX_UPLOAD_SIZE, workers: int = 3, outbound=None,
+                         progress: Optional[Callable] = None) -> List["types.Message"]:
+    """Split an oversized file and send the parts as an album
+
+    caption(index, count, raw_chunks) builds the caption of each part;
+    raw_chunks tells whether the parts must be joined before playing. Up to
+    `workers` parts upload at once; the next part is cut as soon as one of
+    them is done and removed.
+    """
+    if isinstance(parse_mode, str):
+        parse_mode = enums.ParseMode(parse_mode)
+
+    total = os.path.getsize(path)
+    uploaded: Dict[int, int] = {}
+
+    async def upload(part: Part, as_document: bool):
+        async def part_progress(current: int, part_total: int, *args):
+            uploaded[part.index] = current
+            if progress:
+                await progress(sum(uploaded.values()), total)
+
+        try:
+            media = await upload_part(client, chat_id, part, as_document, audio, width, height, part_progress)
+            # The upload is on Telegram's side now; the local copy is no longer needed
+            os.remove(part.path)
+        finally:
+            slots.release()
+        return media
+
+    use_segments = bool(duration) and shutil.which("ffmpeg") is not None
+    while True:
+        parts_dir = os.path.join(output_dir, "parts")
+        os.makedirs(parts_dir, exist_ok=True)
+        if use_segments:
+            parts = split_segments(path, parts_dir, part_size, duration)
+        else:
+            parts = split_bytes(path, parts_dir, part_size)
+
+        # Fresh per attempt: uploads cancelled before they started never free theirs
+        slots = asyncio.Semaphore(workers)
+        uploads: List[asyncio.Future] = []
+        try:
+            while True:
+                # A slot is taken before the part is cut and freed once its upload is done
+                await slots.acquire()
+                try:
+                    part = await parts.__anext__()
+                except StopAsyncIteration:
+                    slots.release()
+                    break
+                except BaseException:
+                    slots.release()
+                    raise
+                uploads.append(asyncio.ensure_future(upload(part, not use_segments)))
+            medias = await asyncio.gather(*uploads)
+            break
+        except SegmentError as e:
+            logger.warning(f"Stream-copy split failed, falling back to byte chunks: {e}")
+            use_segments = False
+            uploaded.clear()
+        finally:
+            for task in uploads:
+                task.cancel()
+            await parts.aclose()
+            if uploads:
+                await asyncio.wait(uploads)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    captions = [caption(index, len(medias), not use_segments) for index in range(len(medias))]
+    return await send_album(client, chat_id, medias, captions, parse_mode, outbound)
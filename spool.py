@@ -0,0 +1,197 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+import secrets
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: reservations are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Every job directory records the bytes it reserved in this file, so the
+# quota can be enforced across all processes sharing the spool root
+RESERVATION_FILE = ".reserved"
+LOCK_FILE = ".lock"
+JOB_PREFIX = "job-"
+OWNER_PREFIX = ".owner-"
+
+
+class SpoolFull(Exception):
+    """A reservation can never fit, or did not fit before the timeout"""
+
+
+class Spool:
+    """Download scratch space under one root directory with a byte quota
+
+    Each download gets its own job directory, created only once its
+    reservation fits under the quota and in the free disk space. Directory
+    names carry the id of the owning Spool, which holds a lock on its owner
+    file for as long as the process lives. A startup sweep can therefore
+    tell leftovers of crashed processes (even when the pid was reused by a
+    container restart) from directories other workers still use.
+    """
+
+    def __init__(self, root: Optional[str] = None, quota_bytes: int = 0, stale_after: float = 6 * 3600):
+        self.root = os.path.abspath(root or os.path.join(tempfile.gettempdir(), "video_downloader_spool"))
+        self.quota_bytes = quota_bytes
+        self.stale_after = stale_after
+        self.owner_id = secrets.token_hex(4)
+        os.makedirs(self.root, exist_ok=True)
+
+        # Held until this process exits; a lock that can be taken means a dead owner
+        self._owner_file = open(self._owner_path(self.owner_id), "w")
+        if fcntl:
+            fcntl.flock(self._owner_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _owner_path(self, owner_id: str) -> str:
+        return os.path.join(self.root, OWNER_PREFIX + owner_id)
+
+    def _owner_alive(self, owner_id: str) -> Optional[bool]:
+        """Whether the owning Spool still runs; None when this cannot be told"""
+        if owner_id == self.owner_id:
+            return True
+        if not fcntl:
+            return None
+        try:
+            with open(self._owner_path(owner_id), "a") as owner:
+                try:
+                    fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return True
+                fcntl.flock(owner, fcntl.LOCK_UN)
+                return False
+        except OSError:
+            return False
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(os.path.join(self.root, LOCK_FILE), "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def job_dirs(self) -> List[str]:
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.root, name) for name in names if name.startswith(JOB_PREFIX)]
+
+    @staticmethod
+    def reserved_bytes(path: str) -> int:
+        try:
+            with open(os.path.join(path, RESERVATION_FILE)) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def used(self) -> int:
+        """Bytes reserved by all live job directories"""
+        return sum(self.reserved_bytes(path) for path in self.job_dirs())
+
+    def try_reserve(self, size: int, name: str = "") -> Optional[str]:
+        """Create a job directory holding size bytes, or return None if it does not fit now"""
+        if self.quota_bytes and size > self.quota_bytes:
+            raise SpoolFull(f"{size} bytes exceed the spool quota of {self.quota_bytes} bytes")
+
+        with self._locked():
+            used = self.used()
+            if self.quota_bytes and used + size > self.quota_bytes:
+                return None
+            if size > shutil.disk_usage(self.root).free:
+                return None
+
+            path = os.path.join(self.root, f"{JOB_PREFIX}{self.owner_id}-{name or secrets.token_hex(6)}")
+            os.makedirs(path)
+            with open(os.path.join(path, RESERVATION_FILE), "w") as f:
+                f.write(str(size))
+            return path
+
+    async def reserve(self, size: int, name: str = "", timeout: Optional[float] = None,
+                      poll_interval: float = 1.0) -> str:
+        """Wait until size bytes fit, then return a new job directory"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            path = await asyncio.to_thread(self.try_reserve, size, name)
+            if path:
+                return path
+            if deadline is not None and time.monotonic() >= deadline:
+                raise SpoolFull(f"No room for {size} bytes in the spool after {timeout}s")
+            await asyncio.sleep(poll_interval)
+
+    def release(self, path: str):
+        """Remove a job directory and give its reservation back"""
+        # Drop the reservation first so a half-removed directory does not count
+        try:
+            os.remove(os.path.join(path, RESERVATION_FILE))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(path, ignore_errors=True)
+
+    def sweep(self) -> int:
+        """Remove job directories left behind by dead processes; returns how many"""
+        removed = 0
+        now = time.time()
+        owners = {}
+        for path in self.job_dirs():
+            owner_id = os.path.basename(path)[len(JOB_PREFIX):].split("-", 1)[0]
+            if owner_id not in owners:
+                owners[owner_id] = self._owner_alive(owner_id)
+            alive = owners[owner_id]
+            if alive is None:
+                # No file locks here: fall back to the age of the directory
+                try:
+                    alive = now - os.path.getmtime(path) < self.stale_after
+                except OSError:
+                    continue
+            if alive:
+                continue
+            self.release(path)
+            removed += 1
+
+        # Owner files of dead processes, including ones that left no directories
+        for name in os.listdir(self.root):
+            if name.startswith(OWNER_PREFIX):
+                owner_id = name[len(OWNER_PREFIX):]
+                if owner_id not in owners:
+                    owners[owner_id] = self._owner_alive(owner_id)
+        for owner_id, alive in owners.items():
+            if alive is False:
+                try:
+                    os.remove(self._owner_path(owner_id))
+                except OSError:
+                    pass
+        if removed:
+            logger.info(f"Spool sweep removed {removed} orphaned job director{'y' if removed == 1 else 'ies'}")
+        return removed
+
+    def close(self):
+        """Release every job directory of this process and its owner lock"""
+        prefix = f"{JOB_PREFIX}{self.owner_id}-"
+        for path in self.job_dirs():
+            if os.path.basename(path).startswith(prefix):
+                self.release(path)
+        self._owner_file.close()
+        try:
+            os.remove(self._owner_path(self.owner_id))
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            'root': self.root,
+            'jobs': len(self.job_dirs()),
+            'reserved': self.used(),
+            'quota': self.quota_bytes,
+        }
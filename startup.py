@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Startup timing for the Telegram Video Downloader Bot
+
+The bot records how long after process start it finished importing,
+connected, handled its first update and had yt-dlp loaded, logs each
+milestone and warns when one is over STARTUP_BUDGET.
+
+Run this file to check the budget offline, e.g. in CI. It starts a
+fresh interpreter, imports the bot, runs its post-connect startup with
+a fake client, answers /start and waits for yt-dlp to load:
+
+    python startup.py --budget import=3,first_update=3.5,ytdl_ready=15
+
+It exits with status 1 when a milestone is over budget or yt-dlp was
+imported together with the bot.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import subprocess
+import tempfile
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Milestones in the order they are normally reached
+MILESTONES = ("import", "connect", "first_update", "ytdl_ready")
+
+# Budget of the offline check in seconds since process start
+DEFAULT_BUDGET = "import=3,connect=3.5,first_update=4,ytdl_ready=20"
+
+
+def process_started() -> float:
+    """time.monotonic() at which this process started; now where /proc is missing"""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name in parentheses may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        age = uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.monotonic() - max(0.0, age)
+    except (OSError, ValueError, IndexError):
+        return time.monotonic()
+
+
+def parse_budget(spec: str) -> Dict[str, float]:
+    """Seconds per milestone from "import=3,first_update=5" """
+    budget = {}
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        name, _, seconds = part.partition("=")
+        if name not in MILESTONES:
+            raise ValueError(f"Unknown startup milestone {name!r} (expected one of {MILESTONES})")
+        budget[name] = float(seconds)
+    return budget
+
+
+class StartupTimer:
+    """Seconds from process start to each startup milestone
+
+    Each milestone is recorded once. Milestones over their budget are
+    logged as warnings; with report_path, the report is rewritten as
+    JSON after every milestone.
+    """
+
+    def __init__(self, started: Optional[float] = None, budget: Optional[Dict[str, float]] = None,
+                 report_path: Optional[str] = None):
+        self.started = process_started() if started is None else started
+        self.budget = budget or {}
+        self.report_path = report_path
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, name: str) -> Optional[float]:
+        """Record a milestone now; None when it was already recorded"""
+        if name in self.marks:
+            return None
+        elapsed = self.marks[name] = round(time.monotonic() - self.started, 3)
+        if name in self.budget and elapsed > self.budget[name]:
+            logger.warning(f"Startup: {name} after {elapsed:.2f}s, over its budget of {self.budget[name]:.2f}s")
+        else:
+            logger.info(f"Startup: {name} after {elapsed:.2f}s")
+        if self.report_path:
+            self.write(self.report_path)
+        return elapsed
+
+    def over_budget(self) -> List[str]:
+        """Milestones later than their budget, or budgeted but never reached"""
+        return [name for name, seconds in self.budget.items()
+                if self.marks.get(name) is None or self.marks[name] > seconds]
+
+    def report(self) -> Dict[str, Any]:
+        return {'marks': dict(self.marks), 'budget': dict(self.budget), 'over_budget': self.over_budget()}
+
+    def write(self, path: str):
+        try:
+            with open(path, "w") as f:
+                json.dump(self.report(), f)
+        except OSError as e:
+            logger.warning(f"Could not write startup report: {e}")
+
+
+def run_child(timeout: float):
+    """Start the bot offline in this fresh interpreter and print its startup report"""
+    import bot
+    eager = 'yt_dlp' in sys.modules
+    from fakes import FakeClient
+
+    async def start():
+        client = FakeClient()
+        # What main() does once the client is connected
+        bot.startup.mark("connect")
+        warm_up = asyncio.ensure_future(bot.warm_up_ytdl())
+        await bot.start_command(client, client.text_message(1, "/start"))
+        bot.startup.mark("first_update")
+        try:
+            await asyncio.wait_for(warm_up, timeout)
+        except asyncio.TimeoutError:
+            pass
+        await bot.outbound.close()
+
+    try:
+        asyncio.run(start())
+    finally:
+        bot.spool.close()
+        bot.pools.shutdown(wait=False)
+    print(json.dumps(dict(bot.startup.report(), yt_dlp_at_import=eager)))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Check the bot's startup time against a budget")
+    parser.add_argument("--budget", default=DEFAULT_BUDGET, help="seconds per milestone, e.g. import=3,first_update=4")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for yt-dlp to load")
+    parser.add_argument("--report", help="also write the report as JSON to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.timeout)
+        return
+
+    from benchmark import configure_environment
+    with tempfile.TemporaryDirectory(prefix="bot-startup-") as work_dir:
+        configure_environment(work_dir, slots=1)
+        env = dict(os.environ, STARTUP_BUDGET=args.budget, STARTUP_REPORT="")
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--timeout", str(args.timeout)],
+                               env=env, capture_output=True, text=True)
+    if child.returncode:
+        sys.stderr.write(child.stderr)
+        sys.exit(f"Starting the bot failed with status {child.returncode}")
+    report = json.loads(child.stdout.splitlines()[-1])
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    for name in MILESTONES:
+        seconds = report['marks'].get(name)
+        budget = report['budget'].get(name)
+        status = "OVER" if name in report['over_budget'] else "ok"
+        shown = f"{seconds:.2f}s" if seconds is not None else "not reached"
+        print(f"{name:<13} {shown:>12}" + (f"  budget {budget:.2f}s  {status}" if budget is not None else ""))
+    failed = bool(report['over_budget'])
+    if report['yt_dlp_at_import']:
+        print("yt_dlp was imported together with the bot; it should load lazily")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
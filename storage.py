@@ -0,0 +1,408 @@
+import time
+import socket
+import sqlite3
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+# Shared state for sessions and queued download jobs. Every backend offers
+# the same small surface: string keys with an optional TTL, hashes, and FIFO
+# queues. The SQLite and Redis backends can be shared by several processes.
+
+
+class StorageBackend:
+    """Interface implemented by all storage backends"""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def hset(self, name: str, field: str, value: str):
+        raise NotImplementedError
+
+    def hdel(self, name: str, field: str):
+        raise NotImplementedError
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def push(self, queue: str, value: str):
+        raise NotImplementedError
+
+    def pop(self, queue: str, timeout: float = 0) -> Optional[str]:
+        """Remove and return the oldest queue item, waiting up to timeout seconds"""
+        popped = self.pop_any([queue], timeout)
+        return popped[1] if popped else None
+
+    def pop_any(self, queues: Sequence[str], timeout: float = 0) -> Optional[Tuple[str, str]]:
+        """Like pop() over several queues; returns (queue, item) from the first non-empty one"""
+        raise NotImplementedError
+
+    def length(self, queue: str) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(StorageBackend):
+    """Process-local backend; state is lost on restart"""
+
+    # Seconds between sweeps that drop expired keys nobody reads again
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self):
+        self._next_purge = 0.0
+        self._values: Dict[str, tuple] = {}
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        self._queues: Dict[str, deque] = {}
+        self._cond = threading.Condition()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._cond:
+            entry = self._values.get(key)
+            if not entry:
+                return None
+            value, expires_at = entry
+            if expires_at and expires_at <= time.time():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._cond:
+            now = time.time()
+            if now >= self._next_purge:
+                self._next_purge = now + self.PURGE_INTERVAL
+                expired = [k for k, (_, expires_at) in self._values.items() if expires_at and expires_at <= now]
+                for k in expired:
+                    del self._values[k]
+            self._values[key] = (value, now + ttl if ttl else None)
+
+    def delete(self, key: str):
+        with self._cond:
+            self._values.pop(key, None)
+
+    def hset(self, name: str, field: str, value: str):
+        with self._cond:
+            self._hashes.setdefault(name, {})[field] = value
+
+    def hdel(self, name: str, field: str):
+        with self._cond:
+            self._hashes.get(name, {}).pop(field, None)
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        with self._cond:
+            return dict(self._hashes.get(name, {}))
+
+    def push(self, queue: str, value: str):
+        with self._cond:
+            self._queues.setdefault(queue, deque()).append(value)
+            self._cond.notify_all()
+
+    def pop_any(self, queues: Sequence[str], timeout: float = 0) -> Optional[Tuple[str, str]]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for queue in queues:
+                    items = self._queues.get(queue)
+                    if items:
+                        return queue, items.popleft()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def length(self, queue: str) -> int:
+        with self._cond:
+            return len(self._queues.get(queue, ()))
+
+
+class SQLiteBackend(StorageBackend):
+    """File-backed backend that survives restarts and can be shared by local processes"""
+
+    POLL_INTERVAL = 0.1
+    # Seconds between sweeps that delete expired keys nobody reads again
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS hashes (name TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (name, field))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queues (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+            "value TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS queues_name ON queues (name, id)")
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._lock:
+            now = time.time()
+            if now >= self._next_purge:
+                self._next_purge = now + self.PURGE_INTERVAL
+                self._db.execute("DELETE FROM kv WHERE expires_at <= ?", (now,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl if ttl else None),
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def hset(self, name: str, field: str, value: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO hashes (name, field, value) VALUES (?, ?, ?)", (name, field, value))
+
+    def hdel(self, name: str, field: str):
+        with self._lock:
+            self._db.execute("DELETE FROM hashes WHERE name = ? AND field = ?", (name, field))
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        with self._lock:
+            rows = self._db.execute("SELECT field, value FROM hashes WHERE name = ?", (name,)).fetchall()
+        return dict(rows)
+
+    def push(self, queue: str, value: str):
+        with self._lock:
+            self._db.execute("INSERT INTO queues (name, value) VALUES (?, ?)", (queue, value))
+
+    def _pop_once(self, queues: Sequence[str]) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock, so two processes never pop the same row
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = None
+                for queue in queues:
+                    row = self._db.execute(
+                        "SELECT id, name, value FROM queues WHERE name = ? ORDER BY id LIMIT 1", (queue,)
+                    ).fetchone()
+                    if row:
+                        break
+                if row:
+                    self._db.execute("DELETE FROM queues WHERE id = ?", (row[0],))
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                self._db.execute("ROLLBACK")
+                raise
+        return (row[1], row[2]) if row else None
+
+    def pop_any(self, queues: Sequence[str], timeout: float = 0) -> Optional[Tuple[str, str]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            popped = self._pop_once(queues)
+            if popped is not None or time.monotonic() >= deadline:
+                return popped
+            time.sleep(min(self.POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+
+    def length(self, queue: str) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM queues WHERE name = ?", (queue,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RedisConnection:
+    """One socket to a Redis-protocol server; commands on it run one at a time"""
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None,
+                 socket_timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.socket_timeout = socket_timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._file = None
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.socket_timeout)
+        self._file = self._sock.makefile("rb")
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", str(self.db))
+
+    def _disconnect(self):
+        if self._sock:
+            try:
+                self._file.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+    @staticmethod
+    def _encode(*args: str) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read_reply(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by Redis server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            data = self._file.read(size + 2)[:-2]
+            return data.decode("utf-8")
+        if kind == b"*":
+            count = int(payload)
+            if count < 0:
+                return None
+            return [self._read_reply() for _ in range(count)]
+        raise RedisError(f"Unexpected reply type: {line!r}")
+
+    def _call(self, *args: str):
+        self._sock.sendall(self._encode(*args))
+        return self._read_reply()
+
+    def execute(self, *args: str, block: float = 0):
+        """Send one command and return its decoded reply, reconnecting once if needed
+
+        block is how long the server may hold the reply back, as with BLPOP.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if not self._sock:
+                        self._connect()
+                    self._sock.settimeout(self.socket_timeout + block)
+                    return self._call(*args)
+                except (ConnectionError, OSError):
+                    self._disconnect()
+                    if attempt == 2:
+                        raise
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+class RedisBackend(StorageBackend):
+    """Backend speaking the Redis protocol (RESP2) over plain sockets
+
+    Works with Redis, Valkey, KeyDB or any stand-in that implements GET,
+    SET PX, DEL, HSET, HDEL, HGETALL, RPUSH, LPOP, BLPOP and LLEN.
+    Blocking pops get a connection of their own, so a worker waiting for
+    a job never holds up the other commands.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, socket_timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.socket_timeout = socket_timeout
+        self._commands = RedisConnection(host, port, db, password, socket_timeout)
+        self._blocking = RedisConnection(host, port, db, password, socket_timeout)
+
+    def execute(self, *args: str):
+        """Send one command and return its decoded reply, reconnecting once if needed"""
+        return self._commands.execute(*args)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.execute("GET", key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        if ttl:
+            self.execute("SET", key, value, "PX", str(int(ttl * 1000)))
+        else:
+            self.execute("SET", key, value)
+
+    def delete(self, key: str):
+        self.execute("DEL", key)
+
+    def hset(self, name: str, field: str, value: str):
+        self.execute("HSET", name, field, value)
+
+    def hdel(self, name: str, field: str):
+        self.execute("HDEL", name, field)
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        reply: List[str] = self.execute("HGETALL", name) or []
+        return dict(zip(reply[::2], reply[1::2]))
+
+    def push(self, queue: str, value: str):
+        self.execute("RPUSH", queue, value)
+
+    def pop_any(self, queues: Sequence[str], timeout: float = 0) -> Optional[Tuple[str, str]]:
+        if timeout <= 0:
+            for queue in queues:
+                value = self.execute("LPOP", queue)
+                if value is not None:
+                    return queue, value
+            return None
+        reply = self._blocking.execute("BLPOP", *queues, f"{timeout:.3f}", block=timeout)
+        return (reply[0], reply[1]) if reply else None
+
+    def length(self, queue: str) -> int:
+        return self.execute("LLEN", queue)
+
+    def close(self):
+        self._commands.close()
+        self._blocking.close()
+
+
+def open_backend(url: Optional[str]) -> StorageBackend:
+    """Open a backend from a URL: memory://, sqlite:///path.db or redis://[:password@]host:port/db
+
+    As with SQLAlchemy, sqlite:///state.db is relative to the working
+    directory and sqlite:////var/lib/bot/state.db is absolute.
+    """
+    if not url or url == "memory://":
+        return MemoryBackend()
+
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        return SQLiteBackend(parsed.path[1:] if parsed.path.startswith("/") else parsed.path)
+    if parsed.scheme == "redis":
+        db = parsed.path.lstrip("/")
+        return RedisBackend(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(db) if db else 0,
+            password=parsed.password,
+        )
+    raise ValueError(f"Unsupported storage URL: {url}")
@@ -0,0 +1,218 @@
+import math
+import asyncio
+import hashlib
+import logging
+import mimetypes
+from typing import Callable, Dict, Optional, Union
+
+import aiohttp
+from pyrogram import Client, enums, raw, types, utils
+
+from outbound import PRIORITY_UPLOAD
+
+logger = logging.getLogger(__name__)
+
+# Telegram upload parts must be 512 KB (the last one may be shorter), and
+# files above 10 MB must use the "big file" upload methods
+PART_SIZE = 512 * 1024
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+# Download-to-upload streaming: bytes flow from an HTTP response through a
+# bounded in-memory ring buffer straight into Telegram's part-based upload,
+# so a job takes roughly max(download, upload) time and never touches disk.
+
+
+class StreamingUnavailable(Exception):
+    """The format cannot be streamed and has to go through a normal download"""
+
+
+class RingBuffer:
+    """Bounded single-producer byte buffer
+
+    write() waits while the buffer is full, which pushes back on the
+    download whenever the upload falls behind. read() waits until the
+    requested number of bytes is available or the writer has closed.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._start = 0
+        self._size = 0
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._cond = asyncio.Condition()
+
+    def __len__(self) -> int:
+        return self._size
+
+    async def write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            async with self._cond:
+                await self._cond.wait_for(lambda: self._size < self.capacity or self._closed)
+                if self._closed:
+                    raise ValueError("Write to a closed ring buffer")
+                count = min(len(view), self.capacity - self._size)
+                end = (self._start + self._size) % self.capacity
+                first = min(count, self.capacity - end)
+                self._buffer[end:end + first] = view[:first]
+                self._buffer[:count - first] = view[first:count]
+                self._size += count
+                view = view[count:]
+                self._cond.notify_all()
+
+    async def read(self, size: int) -> bytes:
+        """Read exactly size bytes, or whatever is left once the writer closed"""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._size >= size or self._closed)
+            if self._error:
+                raise self._error
+            count = min(size, self._size)
+            first = min(count, self.capacity - self._start)
+            data = bytes(self._buffer[self._start:self._start + first]) + bytes(self._buffer[:count - first])
+            self._start = (self._start + count) % self.capacity
+            self._size -= count
+            self._cond.notify_all()
+            return data
+
+    async def close(self, error: Optional[BaseException] = None):
+        """Signal end of stream, or a failed download when error is given"""
+        async with self._cond:
+            self._closed = True
+            self._error = error
+            self._cond.notify_all()
+
+
+async def upload_from_buffer(client: Client, buffer: RingBuffer, file_size: int, file_name: str,
+                             workers: int = 4, progress: Optional[Callable] = None
+                             ) -> Union["raw.types.InputFile", "raw.types.InputFileBig"]:
+    """Upload file_size bytes from the buffer as Telegram file parts
+
+    Parts are read in order but up to `workers` of them are in flight at
+    once, which is what Pyrogram's save_file does for files on disk.
+    """
+    total_parts = max(1, math.ceil(file_size / PART_SIZE))
+    is_big = file_size > BIG_FILE_THRESHOLD
+    file_id = client.rnd_id()
+    md5 = None if is_big else hashlib.md5()
+    read_lock = asyncio.Lock()
+    next_part = 0
+    uploaded = 0
+
+    async def worker():
+        nonlocal next_part, uploaded
+        while True:
+            async with read_lock:
+                if next_part >= total_parts:
+                    return
+                part = next_part
+                chunk = await buffer.read(PART_SIZE)
+                expected = min(PART_SIZE, file_size - part * PART_SIZE)
+                if len(chunk) != expected:
+                    raise IOError(f"Stream ended early: part {part} has {len(chunk)} of {expected} bytes")
+                if md5:
+                    md5.update(chunk)
+                next_part += 1
+
+            if is_big:
+                rpc = raw.functions.upload.SaveBigFilePart(
+                    file_id=file_id, file_part=part, file_total_parts=total_parts, bytes=chunk
+                )
+            else:
+                rpc = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=part, bytes=chunk)
+            await client.invoke(rpc)
+
+            uploaded += len(chunk)
+            if progress:
+                await progress(uploaded, file_size)
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(min(workers, total_parts) if is_big else 1)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    if is_big:
+        return raw.types.InputFileBig(id=file_id, parts=total_parts, name=file_name)
+    return raw.types.InputFile(id=file_id, parts=total_parts, name=file_name, md5_checksum=md5.hexdigest())
+
+
+async def stream_media(client: Client, http: aiohttp.ClientSession, chat_id: Union[int, str], url: str,
+                       file_name: str, caption: Union[str, Callable[[int], str]] = "",
+                       parse_mode: Union[str, enums.ParseMode, None] = None,
+                       audio: bool = False, duration: int = 0, width: int = 0, height: int = 0,
+                       expected_size: Optional[int] = None, headers: Optional[Dict[str, str]] = None,
+                       buffer_size: int = 8 * 1024 * 1024, workers: int = 4,
+                       progress: Optional[Callable] = None, max_size: Optional[int] = None,
+                       outbound=None) -> "types.Message":
+    """Download url and upload it to Telegram at the same time
+
+    caption may be a callable receiving the final file size. Raises
+    StreamingUnavailable before anything is uploaded when the size of the
+    file cannot be known up front, or when it is larger than max_size and
+    has to be split instead. With an OutboundScheduler, the final
+    send is rate-limited and retried on FloodWait without re-uploading.
+    """
+    async with http.get(url, headers=headers) as response:
+        response.raise_for_status()
+        file_size = response.content_length or expected_size
+        if not file_size:
+            raise StreamingUnavailable("Server did not report the file size")
+        if max_size and file_size > max_size:
+            raise StreamingUnavailable(f"{file_size} bytes is above the upload limit and needs splitting")
+
+        buffer = RingBuffer(buffer_size)
+
+        async def produce():
+            try:
+                async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+                    await buffer.write(chunk)
+            except Exception as e:
+                await buffer.close(e)
+            else:
+                await buffer.close()
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            input_file = await upload_from_buffer(client, buffer, file_size, file_name, workers, progress)
+        finally:
+            producer.cancel()
+
+    mime_type = mimetypes.guess_type(file_name)[0] or ("audio/mpeg" if audio else "video/mp4")
+    if audio:
+        attribute = raw.types.DocumentAttributeAudio(duration=duration or 0)
+    else:
+        attribute = raw.types.DocumentAttributeVideo(
+            supports_streaming=True, duration=duration or 0, w=width or 0, h=height or 0
+        )
+    media = raw.types.InputMediaUploadedDocument(
+        mime_type=mime_type,
+        file=input_file,
+        attributes=[attribute, raw.types.DocumentAttributeFilename(file_name=file_name)],
+    )
+
+    if isinstance(parse_mode, str):
+        parse_mode = enums.ParseMode(parse_mode)
+    text = caption(file_size) if callable(caption) else caption
+    rpc = raw.functions.messages.SendMedia(
+        peer=await client.resolve_peer(chat_id),
+        media=media,
+        random_id=client.rnd_id(),
+        **await utils.parse_text_entities(client, text, parse_mode, None)
+    )
+    if outbound:
+        result = await outbound.call(PRIORITY_UPLOAD, chat_id, client.invoke, rpc)
+    else:
+        result = await client.invoke(rpc)
+    for update in result.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(
+                client, update.message,
+                {user.id: user for user in result.users},
+                {chat.id: chat for chat in result.chats},
+            )
+    raise IOError("Telegram did not return the sent message")
@@ -0,0 +1,29 @@
+from batch import batch_key, find_urls, is_supported
+
+
+def test_find_urls_in_free_text():
+    text = """Look at https://youtu.be/dQw4w9WgXcQ?si=share, and youtu.be/dQw4w9WgXcQ again
+    www.instagram.com/reel/abc/ (nice) vimeo.com/123.
+    https://www.tiktok.com/@a/video/1?is_from_webapp=1
+    not links: e.g. foo.bar and 3.14"""
+    assert find_urls(text) == [
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        'https://instagram.com/reel/abc',
+        'https://vimeo.com/123',
+        'https://tiktok.com/@a/video/1',
+    ]
+
+
+def test_find_urls_limit_and_empty():
+    text = "\n".join(f"https://vimeo.com/{index}" for index in range(10))
+    assert len(find_urls(text, limit=3)) == 3
+    assert find_urls("") == []
+
+
+def test_supported_and_batch_key():
+    assert is_supported('https://www.youtube.com/watch?v=x')
+    assert not is_supported('https://example.com/video')
+    urls = ['https://vimeo.com/1', 'https://vimeo.com/2']
+    assert batch_key(urls) == batch_key(list(urls))
+    assert batch_key(urls) != batch_key(urls[::-1])
+    assert batch_key(urls).startswith('batch:')
@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import subprocess
+
+from benchmark import compare, save_result, summarize
+
+
+def test_summarize_percentiles():
+    summary = summarize([float(value) for value in range(1, 101)])
+    assert summary == {'p50': 50.0, 'p95': 95.0, 'p99': 99.0, 'max': 100.0}
+    assert summarize([])['p95'] is None
+
+
+def test_results_compare_with_matching_run(tmp_path):
+    path = str(tmp_path / "benchmarks.jsonl")
+
+    def record(jobs, per_second, commit):
+        return {'benchmark': "handlers", 'commit': commit, 'params': {'jobs': jobs},
+                'results': {'jobs_per_second': per_second, 'job_p95': 1.0}}
+
+    assert save_result(path, record(10, 5.0, "aaa")) is None
+    save_result(path, record(20, 1.0, "bbb"))
+    current = record(10, 4.0, "ccc")
+    previous = save_result(path, current)
+    assert previous['commit'] == "aaa"
+
+    lines = compare(previous, current)
+    assert "aaa" in lines[0]
+    assert any("jobs_per_second" in line and "-20.0%" in line and "(worse)" in line for line in lines)
+
+
+def test_benchmark_runs_offline(tmp_path):
+    results = tmp_path / "benchmarks.jsonl"
+    output = subprocess.run(
+        [sys.executable, "benchmark.py", "--jobs", "4", "--concurrency", "2", "--repeat", "0.5",
+         "--size-kb", "256", "--extract-latency", "0", "--results", str(results), "--json"],
+        capture_output=True, text=True, timeout=120, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    record = json.loads(output.splitlines()[-1])
+    assert record['results']['completed'] == 4
+    assert record['results']['job_p50'] > 0
+    assert record['results']['peak_rss_mb'] > 0
+    assert json.loads(results.read_text()) == record
@@ -0,0 +1,70 @@
+import os
+import time
+import tempfile
+
+from cache import InfoCache, FileIdCache, info_expiry
+
+
+def make_info(expire=None):
+    url = "https://rr1.googlevideo.com/videoplayback?itag=18"
+    if expire:
+        url += f"&expire={int(expire)}"
+    return {'title': 'Test', 'formats': [{'format_id': '18', 'url': url}]}
+
+
+def test_lru_eviction_and_counters():
+    cache = InfoCache(max_entries=2)
+    cache.put("a", make_info())
+    cache.put("b", make_info())
+    assert cache.get("a")
+    cache.put("c", make_info())
+
+    # "b" was the least recently used entry
+    assert cache.get("b") is None
+    assert cache.get("c")
+    stats = cache.stats()
+    assert stats['entries'] == 2
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['evictions'] == 1
+
+
+def test_ttl_is_capped_by_signed_url_expiry():
+    now = time.time()
+    info = make_info(expire=now + 600)
+    assert info_expiry(info) == int(now + 600)
+
+    cache = InfoCache(ttl=3600, safety_margin=300)
+    assert cache.expires_at(info, now) <= now + 300
+
+    # URLs expiring within the safety margin are not cached at all
+    cache.put("soon", make_info(expire=now + 60))
+    assert cache.get("soon") is None
+
+
+def test_disk_tier_survives_restart():
+    db_path = os.path.join(tempfile.mkdtemp(), "cache.db")
+    cache = InfoCache(db_path=db_path)
+    cache.put("a", make_info())
+    cache.close()
+
+    restarted = InfoCache(db_path=db_path)
+    assert restarted.get("a")['title'] == 'Test'
+    assert restarted.stats()['disk_hits'] == 1
+    restarted.close()
+
+
+def test_file_id_cache_round_trip():
+    db_path = os.path.join(tempfile.mkdtemp(), "file_ids.db")
+    cache = FileIdCache(db_path)
+    assert cache.get("youtube:abc", "18") is None
+    cache.put("youtube:abc", "18", "BAACAgIAAxk", "video", 1234)
+    cache.close()
+
+    restarted = FileIdCache(db_path)
+    assert restarted.get("youtube:abc", "18") == ("BAACAgIAAxk", "video", 1234)
+    assert restarted.get("youtube:abc", "22") is None
+    restarted.discard("youtube:abc", "18")
+    assert len(restarted) == 0
+    assert restarted.stats()['hits'] == 1
+    restarted.close()
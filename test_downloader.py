@@ -0,0 +1,112 @@
+import os
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from downloader import download_ranges, plan_segments, RangesUnsupported
+
+
+async def serve(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_plan_segments():
+    assert plan_segments(10, 4) == [(0, 3), (4, 7), (8, 9)]
+    assert plan_segments(0, 4) == []
+
+
+def test_parallel_range_download(tmp_path):
+    source = tmp_path / "source.mp4"
+    data = os.urandom(3 * 1024 * 1024 + 123)
+    source.write_bytes(data)
+    ranges = []
+
+    async def file_handler(request):
+        ranges.append(request.headers.get("Range"))
+        return web.FileResponse(source)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/video.mp4", file_handler)
+        runner, base = await serve(app)
+        progress = []
+
+        async def report(done, total):
+            progress.append((done, total))
+
+        try:
+            async with aiohttp.ClientSession() as http:
+                await download_ranges(http, f"{base}/video.mp4", str(tmp_path / "out.mp4"),
+                                      connections=3, segment_size=512 * 1024, progress=report)
+        finally:
+            await runner.cleanup()
+        return progress
+
+    progress = asyncio.run(run())
+    assert (tmp_path / "out.mp4").read_bytes() == data
+    # One probe plus one request per segment
+    assert len(ranges) == 1 + 7
+    assert progress[-1] == (len(data), len(data))
+
+
+def test_server_without_ranges_is_rejected(tmp_path):
+    async def whole_file(request):
+        return web.Response(body=b"x" * 1000)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/video.mp4", whole_file)
+        runner, base = await serve(app)
+        try:
+            async with aiohttp.ClientSession() as http:
+                await download_ranges(http, f"{base}/video.mp4", str(tmp_path / "out.mp4"))
+        finally:
+            await runner.cleanup()
+
+    with pytest.raises(RangesUnsupported):
+        asyncio.run(run())
+    assert not (tmp_path / "out.mp4").exists()
+
+
+def test_interrupted_segment_is_resumed(tmp_path):
+    data = os.urandom(200_000)
+    failures = []
+
+    async def flaky(request):
+        start, end = (int(x) for x in request.headers["Range"][len("bytes="):].split("-"))
+        body = data[start:end + 1]
+        response = web.StreamResponse(status=206, headers={
+            "Content-Range": f"bytes {start}-{end}/{len(data)}",
+            "Content-Length": str(len(body)),
+        })
+        await response.prepare(request)
+        if start == 0 and end > 0 and not failures:
+            # Cut the first real segment short once
+            failures.append(start)
+            await response.write(body[:1000])
+            request.transport.close()
+            return response
+        await response.write(body)
+        return response
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/video.mp4", flaky)
+        runner, base = await serve(app)
+        try:
+            async with aiohttp.ClientSession() as http:
+                await download_ranges(http, f"{base}/video.mp4", str(tmp_path / "out.mp4"),
+                                      connections=2, segment_size=50_000)
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+    assert failures == [0]
+    assert (tmp_path / "out.mp4").read_bytes() == data
@@ -0,0 +1,55 @@
+import time
+import asyncio
+
+import pytest
+
+from executor import ExecutorPools
+
+
+def test_blocking_calls_do_not_stall_event_loop():
+    """A slow download must not block other coroutines"""
+    pools = ExecutorPools(extract_workers=1, download_workers=1)
+
+    async def scenario():
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(pools.run_download(time.sleep, 0.2), ticker())
+        return ticks
+
+    try:
+        ticks = asyncio.run(scenario())
+    finally:
+        pools.shutdown()
+
+    # All ticks happen while the download is still sleeping
+    assert ticks[-1] - ticks[0] < 0.15
+
+
+def test_pools_are_sized_separately():
+    pools = ExecutorPools(extract_workers=3, download_workers=2)
+    try:
+        assert pools.extract_workers == 3
+        assert pools.download_workers == 2
+        assert asyncio.run(pools.run_extract(sum, [1, 2, 3])) == 6
+    finally:
+        pools.shutdown()
+
+
+def test_unknown_kind_rejected():
+    with pytest.raises(ValueError):
+        ExecutorPools(kind="fiber")
+
+
+def test_warm_up_runs_once_for_threads():
+    pools = ExecutorPools(extract_workers=3, download_workers=2)
+    calls = []
+    try:
+        asyncio.run(pools.warm_up(calls.append, "loaded"))
+    finally:
+        pools.shutdown()
+    assert calls == ["loaded"]
@@ -0,0 +1,170 @@
+import os
+import asyncio
+import tempfile
+
+from jobs import JobScheduler, JobQueue, JobSpec, CANCELLED, DONE, QUEUED
+from sessions import FormatRow
+from storage import MemoryBackend
+
+
+async def drain(scheduler):
+    while scheduler.running_count or scheduler.queued_count:
+        await asyncio.sleep(0.001)
+
+
+def test_global_and_per_user_limits():
+    async def scenario():
+        scheduler = JobScheduler(max_concurrent=2, max_per_user=1)
+        release = asyncio.Event()
+        started = []
+
+        async def work(job):
+            started.append(job.user_id)
+            await release.wait()
+
+        jobs = [scheduler.submit(user_id, work) for user_id in (1, 1, 2, 3)]
+        await asyncio.sleep(0)
+
+        # User 1's second job waits behind their first, user 2 takes the other slot
+        assert started == [1, 2]
+        assert [job.position for job in jobs] == [0, 1, 0, 2]
+        assert scheduler.running_count == 2
+        assert scheduler.queued_count == 2
+
+        release.set()
+        await drain(scheduler)
+        return jobs
+
+    jobs = asyncio.run(scenario())
+    assert all(job.state == DONE for job in jobs)
+
+
+def test_position_updates_are_reported():
+    async def scenario():
+        scheduler = JobScheduler(max_concurrent=1)
+        release = asyncio.Event()
+        positions = []
+
+        async def work(job):
+            await release.wait()
+
+        async def report(position):
+            positions.append(position)
+
+        first = scheduler.submit(1, work)
+        scheduler.submit(2, work, on_position=report)
+        scheduler.submit(3, work, on_position=report)
+        await asyncio.sleep(0)
+        await scheduler.cancel(first.job_id)
+        await asyncio.sleep(0)
+        release.set()
+        await drain(scheduler)
+        return positions
+
+    # Job 2 reports position 1, job 3 reports 2 and then 1 once job 2 starts
+    assert sorted(asyncio.run(scenario())) == [1, 1, 2]
+
+
+def test_cancel_running_job_writes_marker_and_stops():
+    async def scenario():
+        scheduler = JobScheduler()
+        work_dir = tempfile.mkdtemp()
+        seen_marker = []
+
+        async def work(job):
+            job.work_dir = work_dir
+            try:
+                await asyncio.sleep(10)
+            finally:
+                seen_marker.append(os.path.exists(job.cancel_path))
+
+        job = scheduler.submit(1, work)
+        await asyncio.sleep(0.01)
+        assert await scheduler.cancel(job.job_id)
+        assert scheduler.get(job.job_id) is None
+        return job, seen_marker
+
+    job, seen_marker = asyncio.run(scenario())
+    assert job.state == CANCELLED
+    assert seen_marker == [True]
+
+
+def test_cancel_queued_job():
+    async def scenario():
+        scheduler = JobScheduler(max_concurrent=1)
+        release = asyncio.Event()
+
+        async def work(job):
+            await release.wait()
+
+        running = scheduler.submit(1, work)
+        queued = scheduler.submit(2, work)
+        assert await scheduler.cancel(queued.job_id)
+        assert not await scheduler.cancel(queued.job_id)
+        release.set()
+        await running.task
+        return queued
+
+    assert asyncio.run(scenario()).state == CANCELLED
+
+
+def test_job_queue_round_trip():
+    queue = JobQueue(MemoryBackend())
+    spec = JobSpec(user_id=1, chat_id=2, message_id=3, url="https://vimeo.com/1", video_key="vimeo:1",
+                   title="Title", format=FormatRow("22", "mp4", height=720))
+
+    assert queue.enqueue_extract(1, 2, 3, "https://vimeo.com/1") == 1
+    assert queue.enqueue_download(spec) == 1
+    assert len(queue) == 2
+    assert queue.get_status(spec.job_id) == QUEUED
+
+    # A worker with no free download slot only takes extractions
+    assert queue.pop(kinds=[JobQueue.EXTRACT])['kind'] == JobQueue.EXTRACT
+    assert queue.pop(timeout=0.01, kinds=[JobQueue.EXTRACT]) is None
+    assert queue.length(JobQueue.DOWNLOAD) == 1
+    item = queue.pop()
+    assert item['kind'] == JobQueue.DOWNLOAD
+    assert item['spec'].format.height == 720
+    assert queue.pop(timeout=0.01) is None
+
+    assert queue.get_spec(spec.job_id).user_id == 1
+    assert not queue.cancel_requested(spec.job_id)
+    queue.request_cancel(spec.job_id)
+    assert queue.cancel_requested(spec.job_id)
+
+
+def test_unfinished_specs_lists_running_and_queued_jobs():
+    async def scenario():
+        scheduler = JobScheduler(max_concurrent=1)
+        specs = [JobSpec(user_id=user_id, chat_id=user_id, message_id=1, url="https://vimeo.com/1",
+                         video_key="vimeo:1", title="Title", format=FormatRow("22", "mp4"))
+                 for user_id in (1, 2)]
+        for spec in specs:
+            scheduler.submit(spec.user_id, lambda job: asyncio.sleep(10), spec=spec)
+        scheduler.submit(3, lambda job: asyncio.sleep(10))
+        await asyncio.sleep(0)
+        unfinished = scheduler.unfinished_specs()
+        await scheduler.shutdown()
+        return [spec.job_id for spec in specs], [spec.job_id for spec in unfinished]
+
+    submitted, unfinished = asyncio.run(scenario())
+    assert unfinished == submitted
+
+
+def test_shutdown_finishes_queued_jobs_and_keeps_their_specs():
+    async def scenario():
+        backend = MemoryBackend()
+        scheduler = JobScheduler(max_concurrent=2, max_per_user=1, backend=backend)
+        specs = [JobSpec(user_id=1, chat_id=1, message_id=index, url="https://vimeo.com/1",
+                         video_key="vimeo:1", title="Title", format=FormatRow("22", "mp4"))
+                 for index in (1, 2)]
+        # The second job waits behind the first, since both belong to user 1
+        jobs = [scheduler.submit(1, lambda job: asyncio.sleep(10), spec=spec) for spec in specs]
+        await asyncio.sleep(0)
+        await scheduler.shutdown()
+        await asyncio.wait_for(asyncio.gather(*(job.wait() for job in jobs)), 1)
+        return jobs, JobScheduler(backend=backend).pending_specs()
+
+    jobs, pending = asyncio.run(scenario())
+    assert [job.state for job in jobs] == [CANCELLED, CANCELLED]
+    assert len(pending) == 2
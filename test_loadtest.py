@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import subprocess
+
+from loadtest import deep_size
+from sessions import FormatRow, Session, SessionStore
+
+
+def test_deep_size_grows_with_sessions():
+    store = SessionStore(max_entries=100)
+    empty = deep_size(store)
+    for index in range(10):
+        store.put(f"s{index}", Session(url=f"https://youtu.be/{index}", video_key=f"youtube:{index}", title="x" * 100,
+                                       duration=60, formats=[FormatRow("22", "mp4", height=720)], user_id=index,
+                                       message_id=index))
+    one = deep_size(store._sessions["s0"])
+    assert one > 100
+    # Strings and small ints shared between sessions count once
+    assert deep_size(store) - empty >= 5 * one
+
+
+def test_loadtest_runs_offline(tmp_path):
+    results = tmp_path / "benchmarks.jsonl"
+    output = subprocess.run(
+        [sys.executable, "loadtest.py", "--users", "5", "--duration", "1", "--think", "0.1",
+         "--extract-latency", "0", "--server-latency", "0", "--api-latency", "0", "--size-kb", "64",
+         "--sample-interval", "0.2", "--results", str(results), "--json"],
+        capture_output=True, text=True, timeout=120, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    record = json.loads(output.splitlines()[-1])
+    figures = record['results']
+    assert record['benchmark'] == "loadtest"
+    assert figures['links'] > 0 and figures['errors'] == 0 and figures['timeouts'] == 0
+    assert figures['completed'] + figures['cancelled'] + figures['failed'] == figures['downloads']
+    assert figures['sessions_peak'] >= figures['sessions_end']
+    assert len(figures['timeline']) >= 3
+    assert figures['loop_lag_p99'] is not None
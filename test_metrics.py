@@ -0,0 +1,98 @@
+import time
+import asyncio
+
+import aiohttp
+import pytest
+
+from metrics import CONTENT_TYPE, LoopLag, RecentSamples, Registry, RollingSum, serve
+
+
+def test_counter_and_gauge():
+    registry = Registry()
+    failures = registry.counter("failures_total", "Failures", labels=("stage",))
+    failures.inc(stage="download")
+    failures.inc(2, stage="download")
+    failures.inc(stage='up"load')
+    jobs = [1, 2, 3]
+    registry.gauge("active_jobs", "Active jobs", lambda: len(jobs))
+
+    text = registry.render()
+    assert "# TYPE failures_total counter" in text
+    assert 'failures_total{stage="download"} 3' in text
+    assert 'failures_total{stage="up\\"load"} 1' in text
+    assert "active_jobs 3" in text
+    assert failures.value(stage="download") == 3
+
+    with pytest.raises(ValueError):
+        failures.inc(extractor="youtube")
+    with pytest.raises(ValueError):
+        registry.counter("failures_total", "Again")
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("extract_seconds", "Latency", buckets=(1, 5), labels=("source",))
+    for value in (0.5, 1, 3, 10):
+        latency.observe(value, source="extract")
+
+    lines = registry.render().splitlines()
+    assert 'extract_seconds_bucket{source="extract",le="1.0"} 2' in lines
+    assert 'extract_seconds_bucket{source="extract",le="5.0"} 3' in lines
+    assert 'extract_seconds_bucket{source="extract",le="+Inf"} 4' in lines
+    assert 'extract_seconds_sum{source="extract"} 14.5' in lines
+    assert 'extract_seconds_count{source="extract"} 4' in lines
+    assert latency.count(source="extract") == 4
+
+
+def test_metrics_endpoint():
+    registry = Registry()
+    registry.counter("requests_total", "Requests").inc()
+
+    async def run():
+        runner = await serve(registry, "127.0.0.1", 0)
+        port = runner.addresses[0][1]
+        try:
+            async with aiohttp.ClientSession() as http:
+                async with http.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    return response.headers["Content-Type"], await response.text()
+        finally:
+            await runner.cleanup()
+
+    content_type, text = asyncio.run(run())
+    assert content_type == CONTENT_TYPE
+    assert "requests_total 1" in text
+
+
+def test_recent_percentiles_drop_old_samples():
+    samples = RecentSamples(size=100, max_age=60)
+    assert samples.percentile(50) is None
+    samples.add(100.0, now=0)
+    for value in range(1, 11):
+        samples.add(float(value), now=100)
+    assert samples.percentile(50, now=100) == 5.0
+    assert samples.percentile(95, now=100) == 10.0
+    # The old outlier is past max_age and no longer counted
+    assert samples.percentile(100, now=100) == 10.0
+
+
+def test_rolling_sum_window():
+    served = RollingSum(window=60, slots=6)
+    served.add(100, now=0)
+    served.add(50, now=30)
+    assert served.total(now=30) == 150
+    assert served.total(now=65) == 50
+    assert served.total(now=200) == 0
+
+
+def test_loop_lag_sees_blocking_work():
+    async def run():
+        lag = LoopLag(interval=0.01)
+        lag.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)
+        await asyncio.sleep(0.02)
+        await lag.stop()
+        return lag
+
+    lag = asyncio.run(run())
+    assert lag.recent.percentile(100) >= 0.05
@@ -0,0 +1,143 @@
+import time
+import asyncio
+
+import pytest
+from pyrogram.errors import FloodWait
+
+from outbound import OutboundScheduler, TokenBucket, PRIORITY_ANSWER, PRIORITY_UPLOAD, PRIORITY_EDIT
+
+
+def flood_wait(seconds):
+    error = FloodWait(value=1)
+    error.value = seconds
+    return error
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, capacity=2)
+    now = bucket.updated
+    bucket.take(now)
+    bucket.take(now)
+    assert bucket.delay(now) == pytest.approx(0.1)
+    assert bucket.delay(now + 0.11) == 0
+
+
+def test_per_chat_rate_limit():
+    async def run():
+        outbound = OutboundScheduler(global_rate=1000, chat_rate=20, chat_burst=1)
+        sent = []
+
+        async def send(chat_id):
+            sent.append((chat_id, time.monotonic()))
+
+        start = time.monotonic()
+        await asyncio.gather(*[outbound.call(PRIORITY_EDIT, 1, send, 1) for _ in range(3)],
+                             outbound.call(PRIORITY_EDIT, 2, send, 2))
+        await outbound.close()
+        return start, sent
+
+    start, sent = asyncio.run(run())
+    chat_1 = [at - start for chat_id, at in sent if chat_id == 1]
+    chat_2 = [at - start for chat_id, at in sent if chat_id == 2]
+    # Chat 1 gets one request per 50 ms; chat 2 does not wait behind it
+    assert chat_1[2] >= 0.09
+    assert chat_2[0] < 0.03
+
+
+def test_priorities_and_superseded_edits():
+    async def run():
+        outbound = OutboundScheduler(global_rate=1000, chat_rate=20, chat_burst=1)
+        order = []
+
+        async def record(name):
+            order.append(name)
+            return name
+
+        first = asyncio.ensure_future(outbound.call(PRIORITY_EDIT, 1, record, "first"))
+        await asyncio.sleep(0.01)
+        # The chat bucket is empty now, so the next requests queue up
+        edits = [asyncio.ensure_future(outbound.call_replacing((1, 5), PRIORITY_EDIT, 1, record, f"edit {i}"))
+                 for i in range(3)]
+        upload = asyncio.ensure_future(outbound.call(PRIORITY_UPLOAD, 1, record, "upload"))
+        answer = asyncio.ensure_future(outbound.call(PRIORITY_ANSWER, None, record, "answer"))
+        results = await asyncio.gather(first, *edits, upload, answer)
+        await outbound.close()
+        return order, results, outbound.superseded
+
+    order, results, superseded = asyncio.run(run())
+    assert order == ["first", "answer", "upload", "edit 2"]
+    assert results[1:4] == [None, None, "edit 2"]
+    assert superseded == 2
+
+
+def test_flood_wait_is_retried():
+    async def run():
+        outbound = OutboundScheduler(global_rate=1000, chat_rate=1000, chat_burst=10)
+        attempts = []
+
+        async def send():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise flood_wait(0.1)
+            return "sent"
+
+        result = await outbound.call(PRIORITY_UPLOAD, 1, send)
+        await outbound.close()
+        return result, attempts, outbound.flood_waits
+
+    result, attempts, flood_waits = asyncio.run(run())
+    assert result == "sent"
+    assert flood_waits == 1
+    assert attempts[1] - attempts[0] >= 0.09
+
+
+def test_flood_wait_gives_up_after_retries():
+    async def run():
+        outbound = OutboundScheduler(global_rate=1000, chat_rate=1000, chat_burst=10, max_retries=1)
+
+        async def send():
+            raise flood_wait(0.01)
+
+        try:
+            await outbound.call(PRIORITY_EDIT, 1, send)
+        finally:
+            await outbound.close()
+
+    with pytest.raises(FloodWait):
+        asyncio.run(run())
+
+
+def test_cancelling_an_upload_stops_it():
+    async def run():
+        outbound = OutboundScheduler(global_rate=1000)
+        states = []
+
+        async def upload():
+            states.append("started")
+            try:
+                await asyncio.sleep(3)
+            except asyncio.CancelledError:
+                states.append("stopped")
+                raise
+            states.append("uploaded")
+
+        async def edit():
+            await asyncio.sleep(0.1)
+            states.append("edited")
+
+        call = asyncio.ensure_future(outbound.call(PRIORITY_UPLOAD, 1, upload))
+        edit_call = asyncio.ensure_future(outbound.call_replacing((1, 5), PRIORITY_EDIT, 2, edit))
+        await asyncio.sleep(0.02)
+        started = time.monotonic()
+        call.cancel()
+        edit_call.cancel()
+        await asyncio.wait([call, edit_call])
+        took = time.monotonic() - started
+        await outbound.close()
+        return states, took
+
+    states, took = asyncio.run(run())
+    # The upload stops at once; an edit already sent is allowed to finish
+    assert "stopped" in states and "uploaded" not in states
+    assert "edited" in states
+    assert took < 0.5
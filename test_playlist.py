@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from playlist import PipelineStats, pick_entry_format, run_pipeline
+from sessions import FormatRow
+
+
+def test_pipeline_delivers_every_entry_with_bounded_work():
+    in_flight = 0
+    peak = 0
+    pulled = []
+    delivered = []
+
+    def entries():
+        for index in range(50):
+            pulled.append(index)
+            yield index
+
+    async def prepare(entry):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        return entry
+
+    async def deliver(entry):
+        nonlocal in_flight
+        await asyncio.sleep(0.002)
+        delivered.append(entry)
+        in_flight -= 1
+        return True
+
+    stats = asyncio.run(run_pipeline(entries(), prepare, deliver, prepare_workers=2, deliver_workers=2,
+                                     buffer=2, stats=PipelineStats(50)))
+    assert sorted(delivered) == list(range(50))
+    assert (stats.done, stats.failed, stats.finished) == (50, 0, 50)
+    # Two preparing, two queued and two delivering at most
+    assert peak <= 6
+
+
+def test_failures_do_not_stop_the_pipeline():
+    updates = []
+
+    async def prepare(entry):
+        if entry == 1:
+            return None
+        if entry == 2:
+            raise ValueError("extraction failed")
+        return entry
+
+    async def deliver(entry):
+        if entry == 3:
+            raise OSError("upload failed")
+        return entry != 4
+
+    stats = asyncio.run(run_pipeline(range(6), prepare, deliver,
+                                     on_update=lambda stats: updates.append(stats.finished)))
+    assert (stats.done, stats.failed) == (2, 4)
+    assert sorted(updates) == list(range(1, 7))
+
+
+def test_cancelling_stops_every_stage():
+    pulled = []
+    stopped = []
+
+    def entries():
+        for index in range(100):
+            pulled.append(index)
+            yield index
+
+    async def prepare(entry):
+        return entry
+
+    async def deliver(entry):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            stopped.append(entry)
+            raise
+        return True
+
+    async def run():
+        task = asyncio.ensure_future(run_pipeline(entries(), prepare, deliver, deliver_workers=2, buffer=1))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert len(stopped) == 2
+    # Only the entries that fit into the pipeline were ever pulled
+    assert len(pulled) <= 2 + 1 + 2 + 1
+
+
+YOUTUBE_FORMATS = [
+    {'format_id': '251', 'ext': 'webm', 'vcodec': 'none', 'acodec': 'opus', 'tbr': 160},
+    {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'tbr': 130},
+    {'format_id': '18', 'ext': 'mp4', 'height': 360, 'vcodec': 'avc1', 'acodec': 'mp4a.40.2', 'tbr': 500},
+    {'format_id': '136', 'ext': 'mp4', 'height': 720, 'vcodec': 'avc1', 'acodec': 'none', 'tbr': 1500},
+]
+AUDIO = FormatRow(format_id='audio', ext='m4a')
+VIDEO = FormatRow(format_id='video', ext='mp4', height=720)
+
+
+def test_audio_preset_prefers_containers_sent_as_audio():
+    # WebM has the higher bitrate but would arrive as a video
+    assert pick_entry_format(YOUTUBE_FORMATS, AUDIO).format_id == '140'
+
+
+def test_audio_preset_skips_entries_without_audio_only_formats():
+    progressive_only = [fmt for fmt in YOUTUBE_FORMATS if fmt['format_id'] == '18']
+    assert pick_entry_format(progressive_only, AUDIO) is None
+
+
+def test_video_preset_merges_only_when_allowed():
+    assert pick_entry_format(YOUTUBE_FORMATS, VIDEO).format_id == '18'
+    merged = pick_entry_format(YOUTUBE_FORMATS, VIDEO, merge=True)
+    assert merged.format_id.startswith("bv*[height<=720]")
+    assert merged.height == 720
@@ -0,0 +1,90 @@
+import asyncio
+
+from pyrogram.errors import FloodWait
+
+import ytdl
+from progress import ProgressReporter, Progress, DOWNLOAD, UPLOAD
+
+
+def render(progress):
+    return f"{progress.phase} {progress.done}/{progress.total}"
+
+
+def test_edits_are_coalesced_and_rate_limited():
+    edits = []
+
+    async def edit(text):
+        edits.append(text)
+
+    async def run():
+        reporter = ProgressReporter(edit, render, min_interval=0.05)
+        for done in range(1, 51):
+            reporter.report(Progress(DOWNLOAD, done, 100))
+        await asyncio.sleep(0.01)
+        for done in range(51, 101):
+            reporter.report(Progress(DOWNLOAD, done, 100))
+        await asyncio.sleep(0.01)
+        assert len(edits) == 1
+        await asyncio.sleep(0.1)
+        reporter.report(Progress(DOWNLOAD, 100, 100))  # unchanged text is not sent again
+        await asyncio.sleep(0.1)
+        await reporter.close()
+        reporter.report(Progress(UPLOAD, 1, 100))
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    # Each burst collapses into its newest state
+    assert edits == ["download 50/100", "download 100/100"]
+
+
+def test_flood_wait_delays_next_edit():
+    edits = []
+
+    async def edit(text):
+        if not edits:
+            edits.append(None)
+            error = FloodWait(value=1)
+            error.value = 0.2
+            raise error
+        edits.append(text)
+
+    async def run():
+        reporter = ProgressReporter(edit, render, min_interval=0)
+        reporter.report(Progress(DOWNLOAD, 1, 10))
+        await asyncio.sleep(0.01)
+        reporter.report(Progress(DOWNLOAD, 2, 10))
+        await asyncio.sleep(0.05)
+        assert edits == [None]
+        await asyncio.sleep(0.25)
+        await reporter.close()
+
+    asyncio.run(run())
+    assert edits == [None, "download 2/10"]
+
+
+def test_upload_callback_computes_speed():
+    reported = []
+
+    async def run():
+        reporter = ProgressReporter(lambda text: asyncio.sleep(0), render)
+        reporter.report = reported.append
+        callback = reporter.callback(UPLOAD)
+        await callback(0, 1000)
+        await asyncio.sleep(0.05)
+        await callback(500, 1000)
+
+    asyncio.run(run())
+    assert reported[-1].percent == 50
+    assert reported[-1].speed > 0 and reported[-1].eta > 0
+
+
+def test_ytdl_progress_hook_is_throttled(tmp_path):
+    progress_file = ytdl.ProgressFile(str(tmp_path / ".progress"))
+    hook = ytdl.progress_hook(progress_file, interval=60)
+    hook({'status': 'downloading', 'downloaded_bytes': 10, 'total_bytes': 100, 'speed': 5.0, 'eta': 18})
+    hook({'status': 'downloading', 'downloaded_bytes': 20, 'total_bytes': 100})
+    assert progress_file.read()['downloaded'] == 10
+
+    hook({'status': 'finished', 'downloaded_bytes': 100, 'total_bytes': 100})
+    assert progress_file.read() == {'status': 'finished', 'downloaded': 100, 'total': 100,
+                                    'speed': None, 'eta': None}
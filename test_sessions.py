@@ -0,0 +1,41 @@
+import time
+
+from sessions import SessionStore, Session, FormatRow
+
+
+def make_session(user_id=1):
+    formats = [
+        FormatRow.from_format({'format_id': '22', 'ext': 'mp4', 'height': 720, 'url': 'https://example.com'}),
+        FormatRow.from_format({'format_id': '140', 'ext': 'm4a', 'acodec': 'mp4a.40.2'}),
+    ]
+    return Session("https://www.youtube.com/watch?v=dQw4w9WgXcQ", "youtube:dQw4w9WgXcQ",
+                   "Title", 212, formats, user_id, 10)
+
+
+def test_records_are_compact():
+    session = make_session()
+    assert not hasattr(session, '__dict__')
+    assert not hasattr(session.formats[0], '__dict__')
+    assert session.find_format('140').ext == 'm4a'
+    assert session.find_format('999') is None
+
+
+def test_lru_eviction():
+    store = SessionStore(max_entries=2)
+    store.put("a", make_session())
+    store.put("b", make_session())
+    assert store.get("a")
+    store.put("c", make_session())
+
+    assert "b" not in store
+    assert "a" in store and "c" in store
+    assert store.evictions == 1
+
+
+def test_ttl_expiry():
+    store = SessionStore(ttl=0.01)
+    store.put("a", make_session())
+    time.sleep(0.02)
+    assert store.get("a") is None
+    assert len(store) == 0
+    assert store.expirations == 1
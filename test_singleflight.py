@@ -0,0 +1,195 @@
+import asyncio
+
+from singleflight import Recipients, SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "info"
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        return flight, results
+
+    flight, results = asyncio.run(run())
+    assert results == ["info"] * 5
+    assert calls == [1]
+    assert (flight.started, flight.shared) == (1, 4)
+    assert len(flight) == 0
+
+
+def test_finished_call_is_not_reused():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        flight = SingleFlight()
+        return await flight.do("key", work), await flight.do("key", work)
+
+    assert asyncio.run(run()) == (1, 2)
+
+
+def test_cancelling_one_waiter_keeps_the_call_running():
+    async def run():
+        flight = SingleFlight()
+        finished = []
+
+        async def work():
+            await asyncio.sleep(0.1)
+            finished.append(1)
+            return "file"
+
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+        return first.cancelled(), result, finished
+
+    cancelled, result, finished = asyncio.run(run())
+    assert cancelled
+    assert result == "file"
+    assert finished == [1]
+
+
+def test_cancelling_every_waiter_cancels_the_call():
+    async def run():
+        flight = SingleFlight()
+        stopped = []
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                stopped.append(1)
+                raise
+
+        waiters = [asyncio.ensure_future(flight.do("key", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.wait(waiters)
+        return flight, stopped
+
+    flight, stopped = asyncio.run(run())
+    assert stopped == [1]
+    assert not flight.in_flight("key")
+
+
+def test_exception_reaches_every_waiter():
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("extraction failed")
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_different_keys_run_separately():
+    async def run():
+        flight = SingleFlight()
+
+        async def work(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(flight.do("a", lambda: work(1)), flight.do("b", lambda: work(2)))
+
+    assert asyncio.run(run()) == [1, 2]
+
+
+def test_leader_cancelling_hands_the_call_to_the_next_waiter():
+    async def run():
+        flight = SingleFlight()
+        recipients = Recipients()
+        delivered, stopped = [], []
+
+        async def send(chat):
+            try:
+                await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                stopped.append(chat)
+                raise
+            delivered.append(chat)
+            return chat
+
+        async def request(chat):
+            recipients.add(chat)
+            try:
+                return await flight.do("key", lambda: recipients.serve(send))
+            finally:
+                recipients.discard(chat)
+
+        leader = asyncio.ensure_future(request("leader"))
+        follower = asyncio.ensure_future(request("follower"))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        result = await follower
+        return leader.cancelled(), result, delivered, stopped
+
+    cancelled, result, delivered, stopped = asyncio.run(run())
+    assert cancelled
+    # Nothing reaches the leader once it has left; the follower gets the result
+    assert result == "follower"
+    assert delivered == ["follower"]
+    assert stopped == ["leader"]
+
+
+def test_other_waiters_leaving_does_not_restart_the_work():
+    async def run():
+        recipients = Recipients(["first", "second"])
+        calls = []
+
+        async def send(chat):
+            calls.append(chat)
+            await asyncio.sleep(0.05)
+            return chat
+
+        served = asyncio.ensure_future(recipients.serve(send))
+        await asyncio.sleep(0.01)
+        recipients.discard("second")
+        return await served, calls
+
+    result, calls = asyncio.run(run())
+    assert result == "first"
+    assert calls == ["first"]
+
+
+def test_caller_arriving_during_cancellation_starts_a_new_call():
+    async def run():
+        flight = SingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            try:
+                await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                # Slow cleanup, during which another caller arrives
+                await asyncio.sleep(0.05)
+                raise
+            return "file"
+
+        first = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        second = await flight.do("key", work)
+        return first.cancelled(), second, runs
+
+    cancelled, second, runs = asyncio.run(run())
+    assert cancelled
+    assert second == "file"
+    assert runs == [1, 1]
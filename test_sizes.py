@@ -0,0 +1,60 @@
+import time
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from sizes import estimate_size, fill_sizes
+
+
+def test_estimate_size():
+    assert estimate_size({'filesize_approx': 1234.5}, 60) == 1234
+    # 800 kbit/s for 10 s is 1 MB
+    assert estimate_size({'tbr': 800}, 10) == 1_000_000
+    assert estimate_size({'tbr': 800}, None) is None
+    assert estimate_size({}, 10) is None
+
+
+def test_fill_sizes_with_deadline():
+    async def fast(request):
+        return web.Response(body=b"x" * 4096)
+
+    async def slow(request):
+        await asyncio.sleep(1)
+        return web.Response(body=b"x")
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/fast", fast)
+        app.router.add_get("/slow", slow)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+        formats = [
+            {'format_id': 'exact', 'filesize': 10},
+            {'format_id': 'approx', 'tbr': 80},
+            {'format_id': 'fast', 'url': f"{base}/fast", 'protocol': 'https'},
+            {'format_id': 'slow', 'url': f"{base}/slow", 'protocol': 'http'},
+            {'format_id': 'hls', 'url': f"{base}/fast", 'protocol': 'm3u8_native'},
+        ]
+        try:
+            async with aiohttp.ClientSession() as http:
+                start = time.monotonic()
+                filled = await fill_sizes(http, formats, 100, deadline=0.3)
+                elapsed = time.monotonic() - start
+        finally:
+            await runner.cleanup()
+        return formats, filled, elapsed
+
+    formats, filled, elapsed = asyncio.run(run())
+    by_id = {fmt['format_id']: fmt for fmt in formats}
+    assert filled == 2
+    assert by_id['approx']['filesize_approx'] == 1_000_000
+    assert by_id['fast']['filesize'] == 4096
+    assert 'filesize' not in by_id['slow']
+    assert 'filesize' not in by_id['hls']
+    # The slow server did not hold up the probe past its deadline
+    assert elapsed < 0.8
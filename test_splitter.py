@@ -0,0 +1,133 @@
+import os
+import shutil
+import asyncio
+
+import pytest
+from pyrogram import raw
+
+import splitter
+from splitter import split_bytes, split_segments, split_and_send, split_reservation
+from spool import Spool
+
+
+class FakeParser:
+    async def parse(self, text, mode):
+        return {'message': text, 'entities': None}
+
+
+class FakeClient:
+    """Answers the raw calls made by split_and_send and records them"""
+
+    def __init__(self):
+        self.parser = FakeParser()
+        self.saved = []
+        self.albums = []
+        self.active_uploads = 0
+        self.max_active_uploads = 0
+        self.parts_on_disk = 0
+        self._ids = iter(range(1, 10 ** 6))
+
+    def rnd_id(self):
+        return next(self._ids)
+
+    async def resolve_peer(self, chat_id):
+        return raw.types.InputPeerUser(user_id=chat_id, access_hash=0)
+
+    async def save_file(self, path, progress=None):
+        self.parts_on_disk = max(self.parts_on_disk, len(os.listdir(os.path.dirname(path))))
+        self.active_uploads += 1
+        self.max_active_uploads = max(self.max_active_uploads, self.active_uploads)
+        with open(path, "rb") as f:
+            data = f.read()
+        await asyncio.sleep(0.01)
+        if progress:
+            await progress(len(data), len(data))
+        self.active_uploads -= 1
+        self.saved.append((os.path.basename(path), data))
+        return raw.types.InputFile(id=len(self.saved), parts=1, name=os.path.basename(path), md5_checksum="")
+
+    async def invoke(self, rpc):
+        if isinstance(rpc, raw.functions.messages.UploadMedia):
+            assert rpc.media.force_file
+            document = raw.types.Document(id=rpc.media.file.id, access_hash=0, file_reference=b"", date=0,
+                                          mime_type=rpc.media.mime_type, size=0, dc_id=1, attributes=[])
+            return raw.types.MessageMediaDocument(document=document)
+        self.albums.append(rpc.multi_media)
+        return raw.types.Updates(updates=[], users=[], chats=[], date=0, seq=0)
+
+
+def test_split_bytes_round_trip(tmp_path):
+    source = tmp_path / "video.mp4"
+    data = os.urandom(2500)
+    source.write_bytes(data)
+
+    async def collect():
+        return [part async for part in split_bytes(str(source), str(tmp_path), 1000)]
+
+    parts = asyncio.run(collect())
+    assert [os.path.basename(part.path) for part in parts] == ["video.mp4.001", "video.mp4.002", "video.mp4.003"]
+    assert b"".join(open(part.path, "rb").read() for part in parts) == data
+
+
+def test_split_and_send_uploads_parts_as_albums(tmp_path, monkeypatch):
+    monkeypatch.setattr(splitter, "MEDIA_GROUP_SIZE", 3)
+    source = tmp_path / "video.mp4"
+    data = os.urandom(4500)
+    source.write_bytes(data)
+    client = FakeClient()
+    progress = []
+
+    async def report(current, total):
+        progress.append((current, total))
+
+    asyncio.run(split_and_send(
+        client, 7, str(source), str(tmp_path),
+        caption=lambda index, count, raw_chunks: f"{index + 1}/{count} raw={raw_chunks}",
+        part_size=1000, workers=2, progress=report,
+    ))
+
+    # Parts upload concurrently, but never more than `workers` at a time
+    assert client.max_active_uploads == 2
+    assert b"".join(chunk for name, chunk in sorted(client.saved)) == data
+    assert [len(album) for album in client.albums] == [3, 2]
+    assert client.albums[0][0].message == "1/5 raw=True"
+    assert progress[-1] == (4500, 4500)
+    # Uploaded parts are removed right away
+    assert not os.listdir(tmp_path / "parts")
+
+
+def test_split_cuts_parts_only_as_fast_as_they_upload(tmp_path):
+    source = tmp_path / "video.mp4"
+    source.write_bytes(os.urandom(10000))
+    client = FakeClient()
+
+    asyncio.run(split_and_send(
+        client, 7, str(source), str(tmp_path),
+        caption=lambda index, count, raw_chunks: "", part_size=1000, workers=2,
+    ))
+
+    assert len(client.saved) == 10
+    assert client.parts_on_disk <= 2
+
+
+def test_file_over_the_upload_limit_fits_the_default_quota(tmp_path):
+    # SPOOL_QUOTA_MB, MAX_UPLOAD_MB and SPLIT_UPLOAD_WORKERS defaults
+    spool = Spool(str(tmp_path), quota_bytes=8192 * 1024 * 1024)
+    part_size = 2000 * 1024 * 1024
+    filesize = part_size + 1
+    assert spool.try_reserve(filesize + split_reservation(filesize, part_size, workers=3)) is not None
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_split_segments_with_ffmpeg(tmp_path):
+    source = tmp_path / "video.mp4"
+    os.system(f"ffmpeg -loglevel error -f lavfi -i testsrc=duration=6:size=320x240:rate=25 "
+              f"-g 25 -c:v libx264 {source}")
+
+    async def collect():
+        size = os.path.getsize(source)
+        return [part async for part in split_segments(str(source), str(tmp_path), size // 2, 6)]
+
+    parts = asyncio.run(collect())
+    assert len(parts) >= 2
+    assert sum(part.duration for part in parts) >= 5
@@ -0,0 +1,64 @@
+import os
+import asyncio
+
+import pytest
+
+from spool import Spool, SpoolFull, RESERVATION_FILE
+
+
+def test_quota_is_enforced_and_released(tmp_path):
+    spool = Spool(str(tmp_path), quota_bytes=100)
+    first = spool.try_reserve(60, "a")
+    assert os.path.isdir(first)
+    assert spool.try_reserve(60, "b") is None
+    assert spool.used() == 60
+
+    spool.release(first)
+    assert not os.path.exists(first)
+    assert spool.try_reserve(60, "b")
+
+    with pytest.raises(SpoolFull):
+        spool.try_reserve(101)
+
+
+def test_quota_is_shared_between_spools(tmp_path):
+    frontend, worker = Spool(str(tmp_path), quota_bytes=100), Spool(str(tmp_path), quota_bytes=100)
+    assert frontend.try_reserve(70)
+    assert worker.try_reserve(70) is None
+
+
+def test_reserve_waits_for_space(tmp_path):
+    spool = Spool(str(tmp_path), quota_bytes=100)
+
+    async def run():
+        held = spool.try_reserve(80)
+        waiter = asyncio.ensure_future(spool.reserve(50, poll_interval=0.01))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        spool.release(held)
+        return await asyncio.wait_for(waiter, 1)
+
+    assert os.path.isdir(asyncio.run(run()))
+
+    with pytest.raises(SpoolFull):
+        asyncio.run(Spool(str(tmp_path), quota_bytes=10).reserve(5, timeout=0.05, poll_interval=0.01))
+
+
+def test_sweep_removes_only_orphans(tmp_path):
+    crashed = Spool(str(tmp_path))
+    orphan = crashed.try_reserve(10)
+    with open(os.path.join(orphan, "video.mp4.part"), "wb") as f:
+        f.write(b"x" * 10)
+    # Simulate a crash: the owner lock goes away without any cleanup
+    crashed._owner_file.close()
+
+    live = Spool(str(tmp_path))
+    in_use = live.try_reserve(10)
+
+    restarted = Spool(str(tmp_path))
+    assert restarted.sweep() == 1
+    assert not os.path.exists(orphan)
+    assert os.path.exists(os.path.join(in_use, RESERVATION_FILE))
+
+    live.close()
+    assert not os.path.exists(in_use)
@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import time
+import subprocess
+
+import pytest
+
+from startup import StartupTimer, parse_budget, process_started
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_parse_budget():
+    assert parse_budget("import=2.5, first_update=4") == {'import': 2.5, 'first_update': 4.0}
+    assert parse_budget("") == {}
+    with pytest.raises(ValueError):
+        parse_budget("boot=1")
+
+
+def test_marks_are_recorded_once_and_checked(tmp_path):
+    path = str(tmp_path / "startup.json")
+    timer = StartupTimer(started=time.monotonic() - 2, budget={'import': 1, 'connect': 10, 'first_update': 10},
+                         report_path=path)
+    assert timer.mark("import") >= 2
+    assert timer.mark("import") is None
+    timer.mark("connect")
+    # first_update was never reached
+    assert timer.over_budget() == ["import", "first_update"]
+    with open(path) as f:
+        assert json.load(f)['marks'] == timer.marks
+
+
+def test_process_started_is_in_the_past():
+    assert process_started() <= time.monotonic()
+
+
+def test_ytdl_does_not_import_yt_dlp():
+    subprocess.run([sys.executable, "-c", "import sys, ytdl; assert 'yt_dlp' not in sys.modules"],
+                   cwd=HERE, check=True, timeout=60)
+
+
+def test_startup_check_offline(tmp_path):
+    report_path = str(tmp_path / "startup.json")
+    subprocess.run([sys.executable, "startup.py", "--budget", "import=60,first_update=60,ytdl_ready=120",
+                    "--report", report_path], cwd=HERE, check=True, capture_output=True, timeout=180)
+    with open(report_path) as f:
+        report = json.load(f)
+    assert not report['yt_dlp_at_import']
+    marks = report['marks']
+    assert marks['import'] <= marks['connect'] <= marks['first_update']
+    assert marks['ytdl_ready'] >= marks['connect']
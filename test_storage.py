@@ -0,0 +1,224 @@
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import socketserver
+
+import pytest
+
+from storage import MemoryBackend, SQLiteBackend, RedisBackend, open_backend
+from sessions import SessionStore, Session, FormatRow
+from jobs import JobScheduler, JobSpec
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Minimal Redis-protocol stand-in covering the commands RedisBackend uses
+
+    BLPOP waits for a push like Redis does, and SET PX keys expire.
+    """
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2].decode())
+        return args
+
+    def reply(self, value):
+        if value is None:
+            self.wfile.write(b"$-1\r\n")
+        elif isinstance(value, int):
+            self.wfile.write(b":%d\r\n" % value)
+        elif isinstance(value, list):
+            self.wfile.write(b"*%d\r\n" % len(value))
+            for item in value:
+                self.reply(item)
+        else:
+            data = value.encode()
+            self.wfile.write(b"$%d\r\n%s\r\n" % (len(data), data))
+
+    def handle(self):
+        state = self.server.state
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            command, args = args[0].upper(), args[1:]
+            with state['cond']:
+                if command == "SET":
+                    ttl = float(args[3]) / 1000 if len(args) == 4 and args[2].upper() == "PX" else None
+                    state['kv'][args[0]] = args[1]
+                    state['expires'][args[0]] = time.monotonic() + ttl if ttl else None
+                    self.wfile.write(b"+OK\r\n")
+                elif command == "GET":
+                    expires_at = state['expires'].get(args[0])
+                    if expires_at and expires_at <= time.monotonic():
+                        state['kv'].pop(args[0], None)
+                    self.reply(state['kv'].get(args[0]))
+                elif command == "DEL":
+                    self.reply(int(state['kv'].pop(args[0], None) is not None))
+                elif command == "HSET":
+                    state['hashes'].setdefault(args[0], {})[args[1]] = args[2]
+                    self.reply(1)
+                elif command == "HDEL":
+                    self.reply(int(state['hashes'].get(args[0], {}).pop(args[1], None) is not None))
+                elif command == "HGETALL":
+                    items = state['hashes'].get(args[0], {})
+                    self.reply([part for pair in items.items() for part in pair])
+                elif command == "RPUSH":
+                    state['lists'].setdefault(args[0], []).append(args[1])
+                    state['cond'].notify_all()
+                    self.reply(len(state['lists'][args[0]]))
+                elif command == "LPOP":
+                    items = state['lists'].get(args[0])
+                    self.reply(items.pop(0) if items else None)
+                elif command == "BLPOP":
+                    keys = args[:-1]
+                    ready = lambda: next((key for key in keys if state['lists'].get(key)), None)
+                    key = state['cond'].wait_for(ready, float(args[-1]))
+                    if key is None:
+                        self.wfile.write(b"*-1\r\n")
+                    else:
+                        self.reply([key, state['lists'][key].pop(0)])
+                elif command == "LLEN":
+                    self.reply(len(state['lists'].get(args[0], [])))
+                else:
+                    self.wfile.write(b"-ERR unknown command\r\n")
+
+
+@pytest.fixture
+def redis_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeRedisHandler)
+    server.daemon_threads = True
+    server.state = {'cond': threading.Condition(), 'kv': {}, 'expires': {}, 'hashes': {}, 'lists': {}}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        backend = MemoryBackend()
+    elif request.param == "sqlite":
+        backend = SQLiteBackend(str(tmp_path / "state.db"))
+    else:
+        server = request.getfixturevalue("redis_server")
+        backend = RedisBackend(*server.server_address)
+    yield backend
+    backend.close()
+
+
+def test_backend_contract(backend):
+    assert backend.get("missing") is None
+    backend.set("key", "value")
+    assert backend.get("key") == "value"
+    backend.delete("key")
+    assert backend.get("key") is None
+
+    backend.hset("hash", "a", "1")
+    backend.hset("hash", "b", "2")
+    backend.hdel("hash", "a")
+    assert backend.hgetall("hash") == {"b": "2"}
+
+    backend.push("queue", "first")
+    backend.push("queue", "second")
+    assert backend.length("queue") == 2
+    assert backend.pop("queue") == "first"
+    assert backend.pop("queue", timeout=0.1) == "second"
+    assert backend.pop("queue") is None
+
+    backend.push("second", "b")
+    assert backend.pop_any(["first", "second"], timeout=0.1) == ("second", "b")
+    backend.push("first", "a")
+    backend.push("second", "c")
+    assert backend.pop_any(["first", "second"]) == ("first", "a")
+    assert backend.pop_any(["first"], timeout=0.05) is None
+
+
+def test_ttl_expiry(redis_server):
+    for backend in (MemoryBackend(), SQLiteBackend(os.path.join(tempfile.mkdtemp(), "state.db")),
+                    RedisBackend(*redis_server.server_address)):
+        backend.set("key", "value", ttl=0.01)
+        time.sleep(0.02)
+        assert backend.get("key") is None
+
+
+def test_expired_keys_are_purged(tmp_path):
+    memory, sqlite = MemoryBackend(), SQLiteBackend(str(tmp_path / "state.db"))
+    for backend in (memory, sqlite):
+        backend.PURGE_INTERVAL = 0
+        for index in range(50):
+            backend.set(f"session:{index}", "value", ttl=0.01)
+        backend.set("kept", "value")
+        time.sleep(0.02)
+        backend.set("trigger", "value", ttl=60)
+
+    assert sorted(memory._values) == ["kept", "trigger"]
+    assert sorted(row[0] for row in sqlite._db.execute("SELECT key FROM kv")) == ["kept", "trigger"]
+
+
+def test_redis_blocking_pop_does_not_hold_up_other_commands(redis_server):
+    backend = RedisBackend(*redis_server.server_address)
+    popped = []
+    waiter = threading.Thread(target=lambda: popped.append(backend.pop("queue", timeout=2)))
+    waiter.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    backend.set("key", "value")
+    assert backend.get("key") == "value"
+    assert time.monotonic() - started < 0.5
+
+    # The waiting pop gets an item pushed while it blocks
+    backend.push("queue", "job-1")
+    waiter.join(timeout=2)
+    assert popped == ["job-1"]
+    backend.close()
+
+
+def test_sqlite_queue_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "state.db")
+    frontend, worker = SQLiteBackend(path), SQLiteBackend(path)
+    frontend.push("downloads", "job-1")
+    assert worker.pop("downloads", timeout=1) == "job-1"
+    assert frontend.length("downloads") == 0
+
+
+def test_open_backend_urls(tmp_path):
+    assert isinstance(open_backend(None), MemoryBackend)
+    assert isinstance(open_backend(f"sqlite:///{tmp_path}/state.db"), SQLiteBackend)
+    redis = open_backend("redis://:secret@cache:6380/2")
+    assert (redis.host, redis.port, redis.db, redis.password) == ("cache", 6380, 2, "secret")
+    with pytest.raises(ValueError):
+        open_backend("mongodb://localhost")
+
+
+def test_sessions_and_jobs_survive_restart(redis_server):
+    fmt = FormatRow("22", "mp4", height=720)
+    sessions = SessionStore(backend=RedisBackend(*redis_server.server_address))
+    sessions.put("abc", Session("https://vimeo.com/1", "vimeo:1", "Title", 60, [fmt], 7, 8))
+
+    async def queue_job():
+        scheduler = JobScheduler(max_concurrent=1, backend=RedisBackend(*redis_server.server_address))
+        spec = JobSpec(user_id=7, chat_id=7, message_id=8, url="https://vimeo.com/1", video_key="vimeo:1",
+                       title="Title", format=fmt)
+        scheduler.submit(7, lambda job: asyncio.sleep(10), spec=spec)
+        await asyncio.sleep(0)
+        await scheduler.shutdown()
+        return spec
+
+    spec = asyncio.run(queue_job())
+
+    # A new process sees the same session and the unfinished job
+    restarted = SessionStore(backend=RedisBackend(*redis_server.server_address))
+    assert restarted.get("abc").find_format("22").height == 720
+    pending = JobScheduler(backend=RedisBackend(*redis_server.server_address)).pending_specs()
+    assert [p.job_id for p in pending] == [spec.job_id]
+    assert pending[0].format.format_id == "22"
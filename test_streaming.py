@@ -0,0 +1,107 @@
+import os
+import asyncio
+import hashlib
+
+import pytest
+from pyrogram import raw
+
+from sessions import FormatRow
+from streaming import RingBuffer, upload_from_buffer, PART_SIZE, BIG_FILE_THRESHOLD
+
+
+class FakeClient:
+    """Records uploaded parts the way Telegram would reassemble them"""
+
+    def __init__(self):
+        self.parts = {}
+
+    def rnd_id(self):
+        return 42
+
+    async def invoke(self, rpc):
+        await asyncio.sleep(0)
+        self.parts[rpc.file_part] = rpc.bytes
+        return True
+
+
+async def feed(buffer, data, chunk_size=100_000):
+    for start in range(0, len(data), chunk_size):
+        await buffer.write(data[start:start + chunk_size])
+    await buffer.close()
+
+
+def test_ring_buffer_wraps_and_applies_backpressure():
+    async def run():
+        buffer = RingBuffer(10)
+        data = bytes(range(95))
+        writer = asyncio.ensure_future(feed(buffer, data, chunk_size=7))
+        received = b""
+        while True:
+            chunk = await buffer.read(4)
+            assert len(buffer) <= 10
+            if not chunk:
+                break
+            received += chunk
+        await writer
+        return received, data
+
+    received, data = asyncio.run(run())
+    assert received == data
+
+
+def test_ring_buffer_reports_producer_error():
+    async def run():
+        buffer = RingBuffer(10)
+        await buffer.write(b"abc")
+        await buffer.close(IOError("connection reset"))
+        await buffer.read(5)
+
+    with pytest.raises(IOError):
+        asyncio.run(run())
+
+
+@pytest.mark.parametrize("size", [PART_SIZE * 3 + 17, BIG_FILE_THRESHOLD + PART_SIZE + 5])
+def test_upload_from_buffer(size):
+    data = os.urandom(size)
+    client = FakeClient()
+
+    async def run():
+        buffer = RingBuffer(2 * PART_SIZE)
+        producer = asyncio.ensure_future(feed(buffer, data))
+        input_file = await upload_from_buffer(client, buffer, size, "video.mp4", workers=3)
+        await producer
+        return input_file
+
+    input_file = asyncio.run(run())
+    assert b"".join(client.parts[i] for i in sorted(client.parts)) == data
+    assert input_file.parts == len(client.parts)
+    if size > BIG_FILE_THRESHOLD:
+        assert isinstance(input_file, raw.types.InputFileBig)
+    else:
+        assert input_file.md5_checksum == hashlib.md5(data).hexdigest()
+
+
+def test_upload_fails_on_short_stream():
+    async def run():
+        buffer = RingBuffer(PART_SIZE)
+        producer = asyncio.ensure_future(feed(buffer, b"x" * 1000))
+        await upload_from_buffer(FakeClient(), buffer, 5000, "video.mp4")
+        await producer
+
+    with pytest.raises(IOError):
+        asyncio.run(run())
+
+
+def test_only_progressive_http_formats_keep_their_url():
+    base = {'url': 'https://cdn.example/v.mp4', 'protocol': 'https', 'http_headers': {'User-Agent': 'x'}}
+    progressive = FormatRow.from_format(dict(base, format_id='18', ext='mp4', height=360,
+                                             vcodec='avc1', acodec='mp4a'))
+    video_only = FormatRow.from_format(dict(base, format_id='137', ext='mp4', height=1080,
+                                            vcodec='avc1', acodec='none'))
+    audio = FormatRow.from_format(dict(base, format_id='140', ext='m4a', vcodec='none', acodec='mp4a'))
+    hls = FormatRow.from_format(dict(base, format_id='hls', ext='mp4', height=720, vcodec='avc1',
+                                     acodec='mp4a', protocol='m3u8_native'))
+
+    assert progressive.url and audio.url
+    assert video_only.url is None and hls.url is None
+    assert FormatRow(**progressive.to_dict()).http_headers == {'User-Agent': 'x'}
@@ -0,0 +1,88 @@
+import os
+import json
+import asyncio
+
+import pytest
+
+from tracing import Profiler, Tracer, current_job
+
+
+def read_spans(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_spans_carry_the_current_job(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    tracer = Tracer(path)
+
+    async def job(job_id):
+        current_job.set(job_id)
+        with tracer.span("download", method="native") as span:
+            await asyncio.sleep(0.01)
+            span['bytes'] = 1000
+        # Tasks started by the job inherit its ID
+        await asyncio.ensure_future(upload())
+
+    async def upload():
+        tracer.record("upload", 0.5, bytes=1000)
+
+    async def run():
+        await asyncio.gather(job("a"), job("b"))
+        tracer.record("extract", 0.2, key="youtube:x")
+
+    asyncio.run(run())
+    tracer.close()
+
+    spans = read_spans(path)
+    assert sorted((span['job_id'], span['stage']) for span in spans if span['job_id']) == [
+        ("a", "download"), ("a", "upload"), ("b", "download"), ("b", "upload")]
+    download = next(span for span in spans if span['stage'] == "download")
+    assert download['bytes'] == 1000 and download['method'] == "native"
+    assert download['duration'] >= 0.01
+    assert spans[-1] == dict(spans[-1], job_id=None, stage="extract", key="youtube:x")
+
+
+def test_failed_span_and_disabled_tracer(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    tracer = Tracer(path)
+    with pytest.raises(ValueError):
+        with tracer.span("upload"):
+            raise ValueError("boom")
+    tracer.close()
+    assert read_spans(path)[0]['ok'] is False
+
+    disabled = Tracer()
+    disabled.record("extract", 1.0)
+    assert not disabled.enabled and disabled.spans == 0
+
+
+def test_profiler_stops_after_jobs(tmp_path):
+    profiler = Profiler(str(tmp_path / "profiles"))
+
+    async def run():
+        profiler.start(jobs=2)
+        with pytest.raises(RuntimeError):
+            profiler.start(jobs=1)
+        sum(range(10000))
+        profiler.job_finished()
+        assert profiler.active
+        profiler.job_finished()
+
+    asyncio.run(run())
+    assert not profiler.active
+    assert os.path.exists(profiler.last_path)
+    assert os.path.exists(profiler.last_path[:-len(".prof")] + ".txt")
+
+
+def test_profiler_stops_after_seconds(tmp_path):
+    profiler = Profiler(str(tmp_path))
+
+    async def run():
+        profiler.start(seconds=0.05)
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert not profiler.active
+    assert profiler.last_path and os.path.exists(profiler.last_path)
+    assert profiler.stop() is None
@@ -0,0 +1,33 @@
+from video_ids import canonical_url, video_key, short_id, session_id
+
+
+def test_youtube_variants_share_one_canonical_url():
+    expected = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+    for url in (
+        "https://youtu.be/dQw4w9WgXcQ",
+        "https://youtu.be/dQw4w9WgXcQ?si=abcdef",
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&si=abcdef&feature=share",
+        "https://m.youtube.com/watch?feature=share&v=dQw4w9WgXcQ",
+        "https://youtube.com/shorts/dQw4w9WgXcQ?feature=share",
+        "youtube.com/embed/dQw4w9WgXcQ",
+    ):
+        assert canonical_url(url) == expected, url
+
+
+def test_other_sites_drop_tracking_and_keep_meaningful_params():
+    assert canonical_url("https://www.instagram.com/reel/Cabc123/?igsh=xyz&utm_source=ig") == \
+        "https://instagram.com/reel/Cabc123"
+    assert canonical_url("https://vimeo.com/123?b=2&a=1#t=10") == "https://vimeo.com/123?a=1&b=2"
+
+
+def test_ids_are_deterministic_and_per_user():
+    info = {'extractor_key': 'Youtube', 'id': 'dQw4w9WgXcQ'}
+    key = video_key(info)
+    assert key == "youtube:dQw4w9WgXcQ"
+    assert short_id(key) == short_id(key)
+    assert len(short_id(key)) == 16
+    assert session_id(key, 1) != session_id(key, 2)
+
+
+def test_video_key_falls_back_to_canonical_url():
+    assert video_key({}, "https://youtu.be/dQw4w9WgXcQ") == "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
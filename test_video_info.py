@@ -0,0 +1,71 @@
+import json
+
+from video_info import PlaylistInfo, VideoInfo, load_info, project_info
+
+
+def full_info():
+    return {
+        'id': 'dQw4w9WgXcQ',
+        'extractor_key': 'Youtube',
+        'webpage_url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        'title': 'Song',
+        'duration': 212,
+        'uploader': 'Artist',
+        'thumbnail': 'https://i.ytimg.com/vi/dQw4w9WgXcQ/maxresdefault.jpg',
+        'description': 'x' * 5000,
+        'heatmap': [{'start_time': i, 'end_time': i + 1, 'value': 0.5} for i in range(200)],
+        'automatic_captions': {f'lang{i}': [{'url': 'https://example.com/' + 'c' * 200}] * 7 for i in range(150)},
+        'chapters': [{'title': f'Part {i}', 'start_time': i} for i in range(20)],
+        'formats': [
+            {'format_id': '18', 'ext': 'mp4', 'url': 'https://example.com/18', 'protocol': 'https',
+             'height': 360, 'vcodec': 'avc1', 'acodec': 'mp4a', 'fragments': [{'url': 'f'}] * 50,
+             'downloader_options': {'http_chunk_size': 10485760}},
+            {'format_id': 'sb0', 'ext': 'mhtml', 'protocol': 'mhtml'},
+        ],
+    }
+
+
+def test_projection_keeps_only_used_fields():
+    projected = project_info(full_info())
+    assert set(projected) == {'id', 'extractor_key', 'webpage_url', 'title', 'duration', 'uploader',
+                              'thumbnail', 'formats'}
+    # The storyboard has no URL and cannot be downloaded
+    assert projected['formats'] == [{'format_id': '18', 'ext': 'mp4', 'url': 'https://example.com/18',
+                                     'protocol': 'https', 'height': 360, 'vcodec': 'avc1', 'acodec': 'mp4a'}]
+    assert len(json.dumps(projected)) * 50 < len(json.dumps(full_info()))
+
+
+def test_projection_is_idempotent():
+    projected = project_info(full_info())
+    assert project_info(projected) == projected
+
+
+def test_video_info_record():
+    info = VideoInfo.from_dict(full_info())
+    assert (info.title, info.duration, info.uploader) == ('Song', 212, 'Artist')
+    assert info.key() == 'youtube:dQw4w9WgXcQ'
+    assert len(info.formats) == 1
+
+    bare = VideoInfo.from_dict({'webpage_url': 'https://www.example.com/clip/?utm_source=x'})
+    assert (bare.title, bare.duration, bare.uploader) == ('Unknown Title', 0, 'Unknown')
+    assert bare.key() == 'https://example.com/clip'
+
+
+def test_flat_playlist_projection():
+    info = load_info({
+        '_type': 'playlist',
+        'id': 'PL123',
+        'extractor_key': 'YoutubeTab',
+        'title': 'Mix',
+        'description': 'x' * 1000,
+        'entries': iter([
+            {'_type': 'url', 'ie_key': 'Youtube', 'id': 'a', 'url': 'https://www.youtube.com/watch?v=a',
+             'title': 'First', 'duration': 10, 'thumbnails': [{'url': 't'}] * 5},
+            None,
+            {'_type': 'url', 'id': 'b'},
+        ]),
+    })
+    assert isinstance(info, PlaylistInfo)
+    assert info.key() == 'youtubetab:PL123'
+    assert info.entries == ({'id': 'a', 'title': 'First', 'duration': 10, 'url': 'https://www.youtube.com/watch?v=a'},)
+    assert isinstance(load_info(full_info()), VideoInfo)
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import pstats
+import asyncio
+import logging
+import cProfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Job the current task works for; set once when a job starts and inherited
+# by every task it creates, so spans deep inside a download know their job
+current_job: ContextVar[Optional[str]] = ContextVar("current_job", default=None)
+
+# Functions listed in the text summary written next to each profile
+PROFILE_SUMMARY_LINES = 40
+
+
+class Tracer:
+    """Per-job stage spans written as JSON lines
+
+    Every span is one line: {"ts", "job_id", "stage", "duration", "bytes",
+    ...extra fields}. Without a path nothing is recorded. The file is
+    opened in append mode with line buffering, so processes sharing it
+    write whole lines.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.spans = 0
+        self._file = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def record(self, stage: str, duration: float, bytes: Optional[int] = None, job_id: Optional[str] = None,
+               **fields: Any):
+        """Write a finished span"""
+        if not self.path:
+            return
+        span: Dict[str, Any] = {
+            'ts': round(time.time(), 3),
+            'job_id': job_id or current_job.get(),
+            'stage': stage,
+            'duration': round(duration, 4),
+        }
+        if bytes is not None:
+            span['bytes'] = bytes
+        span.update(fields)
+        try:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1, encoding="utf-8")
+            self._file.write(json.dumps(span, default=str) + "\n")
+            self.spans += 1
+        except OSError as e:
+            logger.warning(f"Could not write trace span: {e}")
+
+    @contextmanager
+    def span(self, stage: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+        """Time a block; fields added to the yielded dict end up in the span"""
+        started = time.monotonic()
+        ok = True
+        try:
+            yield fields
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            if not ok:
+                fields['ok'] = False
+            self.record(stage, time.monotonic() - started, **fields)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class Profiler:
+    """cProfile of the event loop thread, switched on at runtime
+
+    A session ends after a number of finished jobs, after a number of
+    seconds, or when stopped; the profile is then written to `directory`
+    as a .prof file (for pstats/snakeviz) with a text summary next to it.
+    Work running in executor threads or processes is not included.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.jobs_left = 0
+        self.last_path: Optional[str] = None
+        self._profile: Optional[cProfile.Profile] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def active(self) -> bool:
+        return self._profile is not None
+
+    def start(self, jobs: int = 0, seconds: float = 0):
+        """Profile until `jobs` jobs have finished or `seconds` have passed, whichever is first"""
+        if self.active:
+            raise RuntimeError("A profile is already being recorded")
+        self.jobs_left = jobs
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        if seconds:
+            self._timer = asyncio.get_running_loop().call_later(seconds, self.stop)
+
+    def job_finished(self):
+        if self.active and self.jobs_left:
+            self.jobs_left -= 1
+            if not self.jobs_left:
+                self.stop()
+
+    def stop(self) -> Optional[str]:
+        """Stop profiling and write the profile; returns its path"""
+        if not self.active:
+            return None
+        profile, self._profile = self._profile, None
+        profile.disable()
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"profile-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.prof")
+        profile.dump_stats(path)
+        with open(path[:-len(".prof")] + ".txt", "w") as summary:
+            stats = pstats.Stats(profile, stream=summary)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_SUMMARY_LINES)
+        self.last_path = path
+        logger.info(f"Profile written to {path}")
+        return path
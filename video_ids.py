@@ -0,0 +1,102 @@
+import re
+import hashlib
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+# Stable identifiers for videos. Everything here is deterministic across
+# processes and restarts (unlike the salted built-in hash()), so the IDs can
+# be used in callback data, caches and persistent indexes alike.
+
+YOUTUBE_HOSTS = ("youtube.com", "youtube-nocookie.com", "youtu.be")
+YOUTUBE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+YOUTUBE_PATH_PREFIXES = ("shorts", "embed", "live", "v", "e")
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = {
+    "si", "feature", "pp", "igshid", "igsh", "fbclid", "gclid", "ref", "ref_src",
+    "ref_url", "s", "t", "is_from_webapp", "sender_device", "share_id", "_r",
+}
+TRACKING_PREFIXES = ("utm_", "mibextid")
+
+HOST_PREFIXES = ("www.", "m.", "mobile.")
+
+
+def _strip_host(host: str) -> str:
+    host = host.lower().rstrip(".")
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+
+def _is_youtube(host: str) -> bool:
+    return any(host == yt or host.endswith("." + yt) for yt in YOUTUBE_HOSTS)
+
+
+def youtube_id(url: str) -> Optional[str]:
+    """Extract the 11 character video ID from any YouTube URL form"""
+    parsed = urlparse(url.strip())
+    host = _strip_host(parsed.netloc.split("@")[-1].split(":")[0])
+    if not _is_youtube(host):
+        return None
+
+    parts = [part for part in parsed.path.split("/") if part]
+    candidate = None
+    if host == "youtu.be" and parts:
+        candidate = parts[0]
+    elif len(parts) >= 2 and parts[0] in YOUTUBE_PATH_PREFIXES:
+        candidate = parts[1]
+    else:
+        candidate = dict(parse_qsl(parsed.query)).get("v")
+
+    if candidate and YOUTUBE_ID_RE.match(candidate):
+        return candidate
+    return None
+
+
+def canonical_url(url: str) -> str:
+    """Normalize a video URL so equivalent links compare equal
+
+    YouTube links (youtu.be, /watch, /shorts, /embed, /live) collapse to
+    https://www.youtube.com/watch?v=ID. Other links lose their fragment,
+    tracking parameters and www./m. host prefixes, and keep their remaining
+    query parameters in sorted order.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+
+    video = youtube_id(url)
+    if video:
+        return f"https://www.youtube.com/watch?v={video}"
+
+    parsed = urlparse(url)
+    host = _strip_host(parsed.netloc.split("@")[-1])
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith(TRACKING_PREFIXES)
+    )
+    path = parsed.path.rstrip("/") or "/"
+    return urlunparse(("https", host, path, "", urlencode(query), ""))
+
+
+def video_key(info: Dict[str, Any], url: Optional[str] = None) -> str:
+    """Identity of an extracted video: "<extractor>:<video id>"
+
+    Falls back to the canonical URL when the extractor did not report an ID.
+    """
+    extractor = info.get("extractor_key") or info.get("extractor")
+    video = info.get("id")
+    if extractor and video:
+        return f"{extractor.lower()}:{video}"
+    return canonical_url(url or info.get("webpage_url") or info.get("original_url") or "")
+
+
+def short_id(key: str, length: int = 16) -> str:
+    """Compact, collision-resistant hex digest of a key for callback data"""
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=length // 2).hexdigest()
+
+
+def session_id(key: str, user_id: int) -> str:
+    """Per-user session ID, so users sharing a video never share a session"""
+    return short_id(f"{key}|{user_id}")
@@ -0,0 +1,110 @@
+from typing import Any, Dict, Optional, Tuple, Union
+
+from video_ids import video_key
+
+# The only parts of a yt-dlp info dict the bot ever reads. A full YouTube
+# info dict carries thumbnails, subtitles, automatic captions, chapters and
+# heatmaps and runs into megabytes; the projection is a few kilobytes.
+INFO_FIELDS = ('id', 'extractor_key', 'webpage_url', 'title', 'duration', 'uploader', 'thumbnail')
+FORMAT_FIELDS = ('format_id', 'ext', 'url', 'protocol', 'http_headers', 'filesize', 'filesize_approx', 'tbr',
+                 'height', 'width', 'fps', 'vcodec', 'acodec', 'format_note')
+
+# Playlists and channels are extracted flat: every entry is just a link
+# that gets extracted on its own when its turn comes
+PLAYLIST_FIELDS = ('id', 'extractor_key', 'webpage_url', 'title', 'uploader')
+ENTRY_FIELDS = ('id', 'title', 'duration')
+
+
+def is_playlist(info: Dict[str, Any]) -> bool:
+    return info.get('_type') in ('playlist', 'multi_video') or 'entries' in info
+
+
+def project_info(info: Dict[str, Any]) -> Dict[str, Any]:
+    """Trim an info dict down to the fields in INFO_FIELDS and FORMAT_FIELDS
+
+    Formats without a URL or extension cannot be downloaded and are
+    dropped. Projecting an already projected dict returns an equal dict.
+    """
+    if is_playlist(info):
+        return project_playlist(info)
+    projected = {field: info.get(field) for field in INFO_FIELDS}
+    projected['formats'] = [
+        {field: fmt[field] for field in FORMAT_FIELDS if fmt.get(field) is not None}
+        for fmt in info.get('formats') or []
+        if fmt.get('url') and fmt.get('ext')
+    ]
+    return projected
+
+
+def project_playlist(info: Dict[str, Any]) -> Dict[str, Any]:
+    """Trim a flat playlist info dict down to its entry links"""
+    projected = {field: info.get(field) for field in PLAYLIST_FIELDS}
+    projected['_type'] = 'playlist'
+    projected['entries'] = []
+    for entry in info.get('entries') or []:
+        url = entry and (entry.get('url') or entry.get('webpage_url'))
+        if url:
+            projected['entries'].append(dict({field: entry.get(field) for field in ENTRY_FIELDS}, url=url))
+    return projected
+
+
+class VideoInfo:
+    """Typed view of a projected info dict"""
+
+    __slots__ = INFO_FIELDS + ('formats',)
+
+    def __init__(self, id: Optional[str] = None, extractor_key: Optional[str] = None,
+                 webpage_url: Optional[str] = None, title: Optional[str] = None,
+                 duration: Optional[float] = None, uploader: Optional[str] = None,
+                 thumbnail: Optional[str] = None, formats: Tuple[Dict[str, Any], ...] = ()):
+        self.id = id
+        self.extractor_key = extractor_key
+        self.webpage_url = webpage_url
+        self.title = title or 'Unknown Title'
+        self.duration = duration or 0
+        self.uploader = uploader or 'Unknown'
+        self.thumbnail = thumbnail
+        self.formats = tuple(formats)
+
+    @classmethod
+    def from_dict(cls, info: Dict[str, Any]) -> "VideoInfo":
+        """Build from a full or already projected info dict"""
+        return cls(**project_info(info))
+
+    def key(self, url: Optional[str] = None) -> str:
+        """Stable identity of the video, see video_ids.video_key"""
+        return video_key({'extractor_key': self.extractor_key, 'id': self.id, 'webpage_url': self.webpage_url}, url)
+
+    def __repr__(self) -> str:
+        return f"VideoInfo({self.extractor_key!r}, {self.id!r}, formats={len(self.formats)})"
+
+
+class PlaylistInfo:
+    """Typed view of a projected playlist or channel"""
+
+    __slots__ = PLAYLIST_FIELDS + ('entries',)
+
+    def __init__(self, id: Optional[str] = None, extractor_key: Optional[str] = None,
+                 webpage_url: Optional[str] = None, title: Optional[str] = None,
+                 uploader: Optional[str] = None, entries: Tuple[Dict[str, Any], ...] = (), _type: str = 'playlist'):
+        self.id = id
+        self.extractor_key = extractor_key
+        self.webpage_url = webpage_url
+        self.title = title or 'Unknown Playlist'
+        self.uploader = uploader or 'Unknown'
+        self.entries = tuple(entries)
+
+    def key(self, url: Optional[str] = None) -> str:
+        """Stable identity of the playlist, see video_ids.video_key"""
+        return video_key({'extractor_key': self.extractor_key, 'id': self.id, 'webpage_url': self.webpage_url}, url)
+
+    def __repr__(self) -> str:
+        return f"PlaylistInfo({self.extractor_key!r}, {self.id!r}, entries={len(self.entries)})"
+
+
+def load_info(info: Dict[str, Any]) -> Union[VideoInfo, PlaylistInfo]:
+    """Build the record matching a full or projected info dict"""
+    projected = project_info(info)
+    if is_playlist(projected):
+        return PlaylistInfo(**projected)
+    return VideoInfo(**projected)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Download worker processes for the Telegram Video Downloader Bot
+
+Run the bot with BOT_MODE=frontend and a shared STORAGE_URL, then start
+this script with the same environment. The frontend only answers updates
+and queues work; every worker process pops extraction and download jobs
+from the shared queue, runs them and edits the user's message itself.
+"""
+
+import os
+import asyncio
+import logging
+import multiprocessing
+
+from pyrogram import Client
+
+import bot
+from jobs import Job, JobQueue, CANCELLED
+
+logger = logging.getLogger(__name__)
+
+# How often a running download checks whether the frontend asked to cancel it
+CANCEL_POLL_INTERVAL = 1.0
+
+
+async def watch_cancel(queue: JobQueue, job: Job):
+    """Cancel a running job once the frontend records a cancel request"""
+    while not job.finished:
+        if await asyncio.to_thread(queue.cancel_requested, job.job_id):
+            await bot.scheduler.cancel(job.job_id)
+            return
+        await asyncio.sleep(CANCEL_POLL_INTERVAL)
+
+
+async def run_download(client: Client, queue: JobQueue, spec):
+    """Run one download from the shared queue and report its state back"""
+    if queue.cancel_requested(spec.job_id):
+        queue.set_status(spec.job_id, CANCELLED)
+        return
+
+    job = bot.submit_download(client, spec)
+    queue.set_status(job.job_id, job.state)
+    watcher = asyncio.ensure_future(watch_cancel(queue, job))
+    try:
+        await job.wait()
+    finally:
+        watcher.cancel()
+    queue.set_status(job.job_id, job.state)
+
+
+def requeue_downloads(queue: JobQueue, specs):
+    """Give downloads this worker did not finish back to the shared queue"""
+    specs = [spec for spec in specs if not queue.cancel_requested(spec.job_id)]
+    for spec in specs:
+        queue.enqueue_download(spec)
+    if specs:
+        logger.info(f"Requeued {len(specs)} unfinished downloads")
+
+
+async def run_worker(index: int):
+    """Pop and run jobs until the process is stopped"""
+    queue = bot.job_queue
+    client = Client(
+        f"video_downloader_worker_{index}",
+        api_id=bot.API_ID,
+        api_hash=bot.API_HASH,
+        bot_token=bot.BOT_TOKEN,
+        no_updates=True,
+    )
+
+    # Pull new work of a kind only while this process has a free slot for it
+    capacity = {JobQueue.EXTRACT: bot.pools.extract_workers, JobQueue.DOWNLOAD: bot.scheduler.max_concurrent}
+    in_flight = {kind: set() for kind in capacity}
+
+    bot.spool.sweep()
+    async with client:
+        logger.info(f"Worker {index} ready ({capacity[JobQueue.DOWNLOAD]} downloads, "
+                    f"{capacity[JobQueue.EXTRACT]} extractions)")
+        bot.startup.mark("connect")
+        warm_up = asyncio.ensure_future(bot.warm_up_ytdl()) if bot.WARM_UP_YTDL else None
+        # The frontend serves its metrics on METRICS_PORT, workers on the ports after it
+        metrics_server = await bot.start_metrics(index + 1)
+        bot.loop_lag.start()
+        try:
+            while True:
+                kinds = [kind for kind, tasks in in_flight.items() if len(tasks) < capacity[kind]]
+                if not kinds:
+                    busy = set().union(*in_flight.values())
+                    await asyncio.wait(busy, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                item = await asyncio.to_thread(queue.pop, 1.0, kinds)
+                if item is None:
+                    continue
+
+                if item['kind'] == JobQueue.EXTRACT:
+                    coro = bot.process_url(client, item['chat_id'], item['message_id'], item['user_id'], item['url'])
+                else:
+                    coro = run_download(client, queue, item['spec'])
+
+                task = asyncio.ensure_future(coro)
+                in_flight[item['kind']].add(task)
+                task.add_done_callback(in_flight[item['kind']].discard)
+        finally:
+            if warm_up:
+                warm_up.cancel()
+            unfinished = bot.scheduler.unfinished_specs()
+            await bot.scheduler.shutdown()
+            if in_flight[JobQueue.DOWNLOAD]:
+                await asyncio.wait(in_flight[JobQueue.DOWNLOAD])
+            requeue_downloads(queue, unfinished)
+            await bot.outbound.close()
+            if bot.http_session:
+                await bot.http_session.close()
+            if metrics_server:
+                await metrics_server.cleanup()
+            await bot.loop_lag.stop()
+            bot.profiler.stop()
+            bot.tracer.close()
+            bot.spool.close()
+
+
+def worker_main(index: int):
+    try:
+        asyncio.run(run_worker(index))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bot.pools.shutdown(wait=False)
+
+
+def main():
+    if bot.job_queue is None:
+        raise SystemExit("worker.py needs a shared STORAGE_URL (sqlite:// or redis://)")
+
+    processes = int(os.getenv("WORKER_PROCESSES", "0")) or os.cpu_count() or 1
+    print(f"🚀 Starting {processes} download worker(s)...")
+
+    # spawn keeps each worker free of state inherited from the parent
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=worker_main, args=(index,), name=f"worker-{index}")
+               for index in range(processes)]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping workers")
+        for process in workers:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
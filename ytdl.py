@@ -0,0 +1,159 @@
+import os
+import json
+import time
+from typing import Optional, Dict, Any, Callable
+
+from video_info import project_info
+
+# Blocking yt-dlp calls. These run inside the executor pools (see
+# executor.py), so they must stay plain module-level functions that can be
+# pickled for the process pool and must return picklable results.
+#
+# yt_dlp is imported inside the functions: importing it and building its
+# extractor registry takes seconds on small hosts, and the bot should answer
+# commands before that. warm_up() does both ahead of the first link.
+
+
+# Extraction profile that skips work the bot has no use for: subtitle and
+# comment fetching, format availability checks, translated subtitle tracks
+# and the playlist a video link may also point into
+LEAN_OPTIONS = {
+    'noplaylist': True,
+    'writesubtitles': False,
+    'writeautomaticsub': False,
+    'getcomments': False,
+    'check_formats': False,
+    'extractor_args': {'youtube': {'skip': ['translated_subs']}},
+}
+
+
+def extract_info(url: str, lean: bool = True, playlist_end: Optional[int] = None) -> Dict[str, Any]:
+    """Extract video information using yt-dlp (blocking)
+
+    The result is projected down to the fields listed in video_info, so
+    only a small, JSON-safe dict leaves the worker. Playlists come back
+    flat, with at most playlist_end entries.
+    """
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+    }
+    if playlist_end:
+        ydl_opts['playlistend'] = playlist_end
+    if lean:
+        ydl_opts.update(LEAN_OPTIONS)
+
+    import yt_dlp
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return project_info(ydl.extract_info(url, download=False))
+
+
+def warm_up() -> float:
+    """Import yt-dlp and load its extractor classes (blocking); returns the seconds taken"""
+    started = time.monotonic()
+    import yt_dlp
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+        ydl.get_info_extractor('Youtube')
+    return time.monotonic() - started
+
+
+def cancel_hook(cancel_path: str, interval: float = 0.5):
+    """Build a progress hook that aborts the download once cancel_path exists"""
+    last_check = 0.0
+
+    def hook(progress: Dict[str, Any]):
+        nonlocal last_check
+        now = time.monotonic()
+        if now - last_check < interval:
+            return
+        last_check = now
+        if os.path.exists(cancel_path):
+            import yt_dlp
+            raise yt_dlp.utils.DownloadCancelled("Download cancelled by user")
+
+    return hook
+
+
+def progress_hook(report: Callable[[Dict[str, Any]], None], interval: float = 0.5):
+    """Build a progress hook passing throttled, trimmed progress dicts to report"""
+    last_report = 0.0
+
+    def hook(progress: Dict[str, Any]):
+        nonlocal last_report
+        now = time.monotonic()
+        if progress.get('status') == 'downloading' and now - last_report < interval:
+            return
+        last_report = now
+        report({
+            'status': progress.get('status'),
+            'downloaded': progress.get('downloaded_bytes') or 0,
+            'total': progress.get('total_bytes') or progress.get('total_bytes_estimate'),
+            'speed': progress.get('speed'),
+            'eta': progress.get('eta'),
+        })
+
+    return hook
+
+
+class ProgressFile:
+    """Picklable progress reporter for the process pool
+
+    A callback into the event loop cannot cross a process boundary, so the
+    download process writes its latest progress to a file the bot polls.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, progress: Dict[str, Any]):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(progress, f)
+        os.replace(temp_path, self.path)
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def output_name(title: str, ext: str) -> str:
+    """File name yt-dlp would give a download with this title"""
+    import yt_dlp
+    return f"{yt_dlp.utils.sanitize_filename(title) or 'video'}.{ext or 'mp4'}"
+
+
+def download(url: str, format_id: str, output_dir: str, cancel_path: Optional[str] = None,
+             progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+             fragment_concurrency: int = 1) -> Optional[str]:
+    """Download a single format into output_dir using yt-dlp (blocking)
+
+    fragment_concurrency sets how many DASH/HLS fragments are fetched at once.
+    """
+    ydl_opts = {
+        'format': format_id,
+        'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
+        'quiet': True,
+        'no_warnings': True,
+        'progress_hooks': [],
+        'concurrent_fragment_downloads': max(1, fragment_concurrency),
+    }
+    if cancel_path:
+        ydl_opts['progress_hooks'].append(cancel_hook(cancel_path))
+    if progress:
+        ydl_opts['progress_hooks'].append(progress_hook(progress))
+
+    import yt_dlp
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        ydl.download([url])
+
+    # Find the downloaded file, skipping markers and partial downloads
+    files = [name for name in os.listdir(output_dir)
+             if not name.startswith('.') and not name.endswith(('.part', '.ytdl'))]
+    if files:
+        return os.path.join(output_dir, files[0])
+
+    return None